@@ -0,0 +1,236 @@
+from collections import deque
+from fastapi import HTTPException
+from datetime import datetime
+from typing import Awaitable, Callable, List, Optional
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import secrets
+import uuid
+from storage import DuplicateKeyError, storage
+
+logger = logging.getLogger(__name__)
+
+QR_BASE_URL = os.getenv("QR_BASE_URL", "https://api.esim.com.mm/qr")
+# Codes kept ready; a background refill starts once the pool drops below the low watermark
+ACTIVATION_CODE_POOL_SIZE = int(os.getenv("ACTIVATION_CODE_POOL_SIZE", "2000"))
+ACTIVATION_CODE_LOW_WATERMARK = ACTIVATION_CODE_POOL_SIZE // 4
+# Backoff between failed refills, doubling up to the max
+REFILL_RETRY_INITIAL = 0.5
+REFILL_RETRY_MAX = 30.0
+IDEMPOTENCY_TTL = float(os.getenv("IDEMPOTENCY_TTL", "86400"))
+ESIM_BULK_ACTIVATION_MAX = int(os.getenv("ESIM_BULK_ACTIVATION_MAX", "500"))
+
+# No 0/O or 1/I, so codes survive being read out or typed by hand
+CODE_ALPHABET = "ABCDEFGHJKLMNPQRSTUVWXYZ23456789"
+CODE_LENGTH = 8
+MAX_INSERT_ATTEMPTS = 3
+
+
+def generate_code() -> str:
+    # 32-letter alphabet, so the low 5 bits of each random byte pick a letter uniformly
+    return "ESM" + "".join(CODE_ALPHABET[b & 31] for b in secrets.token_bytes(CODE_LENGTH))
+
+
+class ActivationCodePool:
+    """Pre-generated, collision-checked activation codes."""
+
+    def __init__(self, store=storage, size: int = ACTIVATION_CODE_POOL_SIZE,
+                 low_watermark: int = ACTIVATION_CODE_LOW_WATERMARK):
+        self.store = store
+        self.size = size
+        self.low_watermark = low_watermark
+        self._codes = deque()
+        self._pooled = set()
+        self._refill_needed = asyncio.Event()
+        self._filled = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self.misses = 0
+
+    async def refill(self):
+        while len(self._codes) < self.size:
+            candidates = {generate_code() for _ in range(min(500, self.size - len(self._codes)))}
+            candidates -= self._pooled
+            candidates -= await self.store.activations.codes_in_use(candidates)
+            self._codes.extend(candidates)
+            self._pooled |= candidates
+            # In-memory lookups never suspend; let requests in between chunks
+            await asyncio.sleep(0)
+
+    def take(self) -> str:
+        if len(self._codes) < self.low_watermark:
+            self._refill_needed.set()
+        if not self._codes:
+            # Pool drained faster than refills; fall back to an unchecked code,
+            # the unique index still catches the rare collision on insert
+            self.misses += 1
+            return generate_code()
+        code = self._codes.popleft()
+        self._pooled.discard(code)
+        return code
+
+    async def _run(self):
+        while True:
+            await self._refill_needed.wait()
+            self._refill_needed.clear()
+            delay = REFILL_RETRY_INITIAL
+            while True:
+                try:
+                    await self.refill()
+                    self._filled.set()
+                    break
+                except Exception:
+                    # Retried here rather than on the next take(): until the first
+                    # refill lands /ready fails, so no take() may ever come
+                    logger.exception("Activation code refill failed; retrying in %.1fs", delay)
+                    await asyncio.sleep(delay)
+                    delay = min(delay * 2, REFILL_RETRY_MAX)
+
+    async def start(self):
+        # Filled in the background so startup doesn't wait on it; take()
+        # falls back to unchecked codes until the first refill lands
+        if self._task is None:
+            self._refill_needed.set()
+            self._task = asyncio.create_task(self._run())
+
+    async def wait_filled(self):
+        await self._filled.wait()
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+
+def request_fingerprint(payload) -> str:
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, default=str).encode()).hexdigest()
+
+
+async def idempotent(key: Optional[str], scope: str, payload,
+                 operation: Callable[[], Awaitable[dict]], store=storage) -> dict:
+    """Run operation once per idempotency key; retries get the stored response."""
+    if not key:
+        return await operation()
+    key = f"{scope}:{key}"
+    fingerprint = request_fingerprint(payload)
+    existing = await store.idempotency.reserve(key, fingerprint, IDEMPOTENCY_TTL)
+    if existing is not None:
+        if existing["fingerprint"] != fingerprint:
+            raise HTTPException(status_code=422, detail="Idempotency-Key was used with a different request")
+        if existing["response"] is None:
+            raise HTTPException(status_code=409, detail="A request with this Idempotency-Key is still in progress")
+        return existing["response"]
+    try:
+        response = await operation()
+    except BaseException:
+        await store.idempotency.release(key)
+        raise
+    await store.idempotency.complete(key, response)
+    return response
+
+
+class ActivationService:
+    """Creates activations with pooled codes and idempotent retries."""
+
+    def __init__(self, catalog, store=storage, code_pool: Optional[ActivationCodePool] = None):
+        self.catalog = catalog
+        self.store = store
+        self.code_pool = code_pool or ActivationCodePool(store)
+
+    async def idempotent(self, key: Optional[str], scope: str, payload,
+                         operation: Callable[[], Awaitable[dict]]) -> dict:
+        return await idempotent(key, scope, payload, operation, self.store)
+
+    def build(self, order: dict) -> dict:
+        plan = self.catalog.get(order["plan_id"])
+        now = datetime.utcnow()
+        return {
+            "activation_id": str(uuid.uuid4()),
+            "activation_code": self.code_pool.take(),
+            "plan_id": plan.id,
+            "device_imei": order["device_imei"],
+            "customer_email": order["customer_email"],
+            "status": "pending",
+            "data_total_gb": plan.data_gb,
+            "data_used_gb": 0.0,
+            "duration_days": plan.duration_days,
+            "created_at": now,
+            "expires_at": now.replace(hour=23, minute=59, second=59),
+        }
+
+    def refresh_ids(self, record: dict):
+        record["activation_id"] = str(uuid.uuid4())
+        record["activation_code"] = self.code_pool.take()
+
+    @staticmethod
+    def response(record: dict) -> dict:
+        return {
+            "activation_id": record["activation_id"],
+            "qr_code_url": f"{QR_BASE_URL}/{record['activation_id']}",
+            "activation_code": record["activation_code"],
+            "status": record["status"],
+            "expires_at": record["expires_at"],
+        }
+
+    async def _create(self, order: dict) -> dict:
+        record = self.build(order)
+        for attempt in range(MAX_INSERT_ATTEMPTS):
+            try:
+                await self.store.activations.create(record)
+                return self.response(record)
+            except DuplicateKeyError:
+                self.refresh_ids(record)
+        raise HTTPException(status_code=503, detail="Could not allocate an activation code, please retry")
+
+    async def _create_many(self, orders: List[dict]) -> dict:
+        results = [None] * len(orders)
+        pending = []
+        for index, order in enumerate(orders):
+            if order["plan_id"] not in self.catalog:
+                results[index] = {"index": index, "error": "Invalid plan ID"}
+            else:
+                pending.append((index, self.build(order)))
+
+        # Bulk insert; retry only the rows that hit a duplicate id or code
+        for attempt in range(MAX_INSERT_ATTEMPTS):
+            if not pending:
+                break
+            failed = set(await self.store.activations.create_many([r for _, r in pending]))
+            for position, (index, record) in enumerate(pending):
+                if position not in failed:
+                    results[index] = {"index": index, "activation": self.response(record)}
+            pending = [pending[position] for position in sorted(failed)]
+            for _, record in pending:
+                self.refresh_ids(record)
+        for index, _ in pending:
+            results[index] = {"index": index, "error": "Could not allocate an activation code"}
+
+        activated = sum(1 for r in results if "activation" in r)
+        return {"activated": activated, "failed": len(orders) - activated, "results": results}
+
+    async def activate(self, order: dict, idempotency_key: Optional[str] = None) -> dict:
+        return await self.idempotent(
+            idempotency_key, "activate", order, lambda: self._create(order)
+        )
+
+    async def activate_many(self, orders: List[dict], idempotency_key: Optional[str] = None) -> dict:
+        if len(orders) > ESIM_BULK_ACTIVATION_MAX:
+            raise HTTPException(
+                status_code=413,
+                detail=f"Bulk activation exceeds {ESIM_BULK_ACTIVATION_MAX} orders"
+            )
+        return await self.idempotent(
+            idempotency_key, "activate-bulk", orders, lambda: self._create_many(orders)
+        )
+
+    async def start(self):
+        await self.code_pool.start()
+
+    async def stop(self):
+        await self.code_pool.stop()
@@ -1,18 +1,41 @@
 from fastapi import APIRouter, HTTPException, Depends
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from pydantic import BaseModel, EmailStr
-from passlib.context import CryptContext
-from jose import JWTError, jwt
 from datetime import datetime, timedelta
 import os
+import time
+import uuid
+from hashing import get_pwd_context, password_hasher
+from tokens import InvalidTokenError, KeyRing, RevocationList, SharedRevocationList, VerifiedTokenCache, token_digest
+from metrics import jwt_decode_duration, registry
+from ratelimit import rate_limiter
+from responses import trusted_response
+from storage import DuplicateKeyError, USER_AUTH_FIELDS, USER_PROFILE_FIELDS, storage
 
 router = APIRouter(prefix="/auth", tags=["authentication"])
 security = HTTPBearer()
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
 SECRET_KEY = os.getenv("JWT_SECRET", "esim-myanmar-secret-key")
+# Comma-separated retired secrets still accepted for verification during rotation
+PREVIOUS_SECRET_KEYS = [k for k in os.getenv("JWT_PREVIOUS_SECRETS", "").split(",") if k]
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
+TOKEN_CACHE_SIZE = int(os.getenv("TOKEN_CACHE_SIZE", "10000"))
+TOKEN_CACHE_TTL = float(os.getenv("TOKEN_CACHE_TTL", "300"))
+MIN_PASSWORD_LENGTH = 8
+
+key_ring = KeyRing(SECRET_KEY, PREVIOUS_SECRET_KEYS, ALGORITHM)
+token_cache = VerifiedTokenCache(max_size=TOKEN_CACHE_SIZE, ttl=TOKEN_CACHE_TTL)
+# Seconds before a logout on one worker is honoured by the others
+TOKEN_REVOCATION_SYNC_INTERVAL = float(os.getenv("TOKEN_REVOCATION_SYNC_INTERVAL", "1"))
+# Shared through storage unless storage is this process's own memory
+revoked_tokens = (RevocationList() if storage.process_local
+                  else SharedRevocationList(storage.revocations, TOKEN_REVOCATION_SYNC_INTERVAL))
+
+registry.counter_function("jwt_cache_hits_total", "Token verifications served from cache",
+                          lambda: token_cache.hits)
+registry.counter_function("jwt_cache_misses_total", "Token verifications needing a full decode",
+                          lambda: token_cache.misses)
 
 class UserRegister(BaseModel):
     email: EmailStr
@@ -36,14 +59,23 @@ class User(BaseModel):
     phone: str
     is_active: bool
 
-# Mock user database
-users_db = {}
+def new_user(user: UserRegister, hashed_password: str) -> dict:
+    """Stored document for a new account; shared with bulk provisioning."""
+    return {
+        "id": f"user_{uuid.uuid4().hex[:12]}",
+        "email": user.email,
+        "full_name": user.full_name,
+        "phone": user.phone,
+        "hashed_auth": hashed_password,
+        "is_active": True,
+        "created_at": datetime.utcnow()
+    }
 
 def verify_password(plain_password, hashed_password):
-    return pwd_context.verify(plain_password, hashed_password)
+    return get_pwd_context().verify(plain_password, hashed_password)
 
 def get_password_hash(user_password):
-    return pwd_context.hash(user_password)
+    return get_pwd_context().hash(user_password)
 
 def create_access_token(data: dict, expires_delta: timedelta = None):
     to_encode = data.copy()
@@ -52,83 +84,101 @@ def create_access_token(data: dict, expires_delta: timedelta = None):
     else:
         expire = datetime.utcnow() + timedelta(minutes=15)
     to_encode.update({"exp": expire})
-    encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
+    encoded_jwt = key_ring.encode(to_encode)
     return encoded_jwt
 
-def verify_token(credentials: HTTPAuthorizationCredentials = Depends(security)):
+async def verify_token(credentials: HTTPAuthorizationCredentials = Depends(security)):
+    # Async so it runs inline on the loop: cheaper than a threadpool hop for
+    # microsecond-scale work, and keeps metric updates on the loop thread
+    digest = token_digest(credentials.credentials)
+    if digest in revoked_tokens:
+        raise HTTPException(status_code=401, detail="Invalid token")
+    
+    # Skip signature verification for tokens already verified recently
+    email = token_cache.get(digest)
+    if email is not None:
+        return email
+    
     try:
-        payload = jwt.decode(credentials.credentials, SECRET_KEY, algorithms=[ALGORITHM])
+        start = time.perf_counter()
+        payload = key_ring.decode(credentials.credentials)
+        jwt_decode_duration.observe(time.perf_counter() - start)
         email: str = payload.get("sub")
         if email is None:
             raise HTTPException(status_code=401, detail="Invalid token")
+        token_cache.put(digest, email, payload["exp"])
         return email
-    except JWTError:
+    except (InvalidTokenError, KeyError):
         raise HTTPException(status_code=401, detail="Invalid token")
 
 @router.post("/register", response_model=dict)
 async def register_user(user: UserRegister):
     # Check if user already exists
-    if user.email in users_db:
+    if await storage.users.exists(user.email):
         raise HTTPException(status_code=400, detail="Email already registered")
     
     # Validate user input strength
-    if len(user.password) < 8:
-        raise HTTPException(status_code=400, detail="Password must be at least 8 characters")
+    if len(user.password) < MIN_PASSWORD_LENGTH:
+        raise HTTPException(status_code=400, detail=f"Password must be at least {MIN_PASSWORD_LENGTH} characters")
     
-    # Hash user password and store user
-    hashed_user_password = get_password_hash(user.password)
-    user_id = f"user_{len(users_db) + 1}"
+    # Hash user password off the event loop and store user
+    hashed_user_password = await password_hasher.hash(user.password)
+    record = new_user(user, hashed_user_password)
     
-    users_db[user.email] = {
-        "id": user_id,
-        "email": user.email,
-        "full_name": user.full_name,
-        "phone": user.phone,
-        "hashed_auth": hashed_user_password,
-        "is_active": True,
-        "created_at": datetime.utcnow()
-    }
+    try:
+        await storage.users.create(record)
+    except DuplicateKeyError:
+        raise HTTPException(status_code=400, detail="Email already registered")
     
     return {
         "message": "User registered successfully",
-        "user_id": user_id,
+        "user_id": record["id"],
         "email": user.email
     }
 
 @router.post("/login", response_model=Token)
+@trusted_response
 async def login_user(user: UserLogin):
+    # Per-account throttle, checked before any bcrypt work is queued
+    await rate_limiter.check_email(user.email)
+    
     # Check if user exists
-    if user.email not in users_db:
+    stored_user = await storage.users.get_by_email(user.email, USER_AUTH_FIELDS)
+    if stored_user is None:
         raise HTTPException(status_code=401, detail="Invalid email or password")
     
-    stored_user = users_db[user.email]
-    
     # Verify user credentials
-    if not verify_password(user.password, stored_user["hashed_auth"]):
+    valid, new_hash = await password_hasher.verify(user.password, stored_user["hashed_auth"])
+    if not valid:
         raise HTTPException(status_code=401, detail="Invalid email or password")
     
     # Check if user is active
     if not stored_user["is_active"]:
         raise HTTPException(status_code=401, detail="Account is disabled")
     
+    # Upgrade hashes made with an outdated bcrypt cost; disabled accounts are left as they are
+    if new_hash:
+        await storage.users.update_password_hash(user.email, new_hash)
+    
     # Create access token
     access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
     access_token = create_access_token(
         data={"sub": user.email}, expires_delta=access_token_expires
     )
     
-    return {
-        "access_token": access_token,
-        "token_type": "bearer",
-        "expires_in": ACCESS_TOKEN_EXPIRE_MINUTES * 60
-    }
+    return Token(
+        access_token=access_token,
+        token_type="bearer",
+        expires_in=ACCESS_TOKEN_EXPIRE_MINUTES * 60
+    )
 
 @router.get("/me", response_model=User)
+@trusted_response
 async def get_current_user(email: str = Depends(verify_token)):
-    if email not in users_db:
+    user_data = await storage.users.get_by_email(email, USER_PROFILE_FIELDS)
+    if user_data is None:
         raise HTTPException(status_code=404, detail="User not found")
     
-    user_data = users_db[email]
     return User(
         id=user_data["id"],
         email=user_data["email"],
@@ -138,18 +188,27 @@ async def get_current_user(email: str = Depends(verify_token)):
     )
 
 @router.post("/logout")
-async def logout_user(email: str = Depends(verify_token)):
+async def logout_user(
+    email: str = Depends(verify_token),
+    credentials: HTTPAuthorizationCredentials = Depends(security),
+):
+    # Token is already verified, so its claims can be read without re-checking
+    claims = key_ring.unverified_claims(credentials.credentials)
+    digest = token_digest(credentials.credentials)
+    await revoked_tokens.publish(digest, claims["exp"])
+    token_cache.discard(digest)
     return {"message": "Successfully logged out"}
 
 @router.post("/refresh", response_model=Token)
+@trusted_response
 async def refresh_token(email: str = Depends(verify_token)):
     access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
     access_token = create_access_token(
         data={"sub": email}, expires_delta=access_token_expires
     )
     
-    return {
-        "access_token": access_token,
-        "token_type": "bearer",
-        "expires_in": ACCESS_TOKEN_EXPIRE_MINUTES * 60
-    }
\ No newline at end of file
+    return Token(
+        access_token=access_token,
+        token_type="bearer",
+        expires_in=ACCESS_TOKEN_EXPIRE_MINUTES * 60
+    )
\ No newline at end of file
@@ -0,0 +1,183 @@
+from fastapi import HTTPException, Request, Response
+from typing import Callable, Dict, List, Optional, Tuple
+import hashlib
+import json
+import os
+from plan_index import InvalidQuery, PlanIndex, PlanQuery, SearchPage
+
+# Where to load plans from instead of the built-in list (e.g. ../package_data.json)
+CATALOG_PATH = os.getenv("ESIM_CATALOG_PATH")
+CATALOG_CACHE_CONTROL = "public, max-age=300"
+# Page size for filtered listings when ?limit= isn't given, and its ceiling
+PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+
+def render_json(content) -> bytes:
+    # Same encoding FastAPI's JSONResponse uses, so payloads stay byte-identical
+    return json.dumps(
+        content,
+        ensure_ascii=False,
+        allow_nan=False,
+        indent=None,
+        separators=(",", ":"),
+    ).encode("utf-8")
+
+
+def make_etag(body: bytes) -> str:
+    return '"' + hashlib.sha256(body).hexdigest()[:32] + '"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    # If-None-Match uses weak comparison, so W/"x" matches "x"
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate == etag:
+            return True
+    return False
+
+
+def cached_response(request: Request, body: bytes, etag: str,
+                    cache_control: str = CATALOG_CACHE_CONTROL,
+                    media_type: str = "application/json") -> Response:
+    headers = {"ETag": etag, "Cache-Control": cache_control}
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type=media_type, headers=headers)
+
+
+class PlanCatalog:
+    """Validated, id-indexed plan catalog with pre-rendered JSON bodies."""
+
+    def __init__(self, plans: List[dict], model):
+        self.model = model
+        # Validate once at load time; requests only read from the index
+        self.plans = [model(**plan) for plan in plans]
+        self._by_id = {plan.id: plan for plan in self.plans}
+        if len(self._by_id) != len(self.plans):
+            raise ValueError("Duplicate plan id in catalog")
+
+        self.body = render_json([plan.model_dump(mode="json") for plan in self.plans])
+        self.etag = make_etag(self.body)
+        self._item_bodies: Dict[str, Tuple[bytes, str]] = {}
+        for plan in self.plans:
+            body = render_json(plan.model_dump(mode="json"))
+            self._item_bodies[plan.id] = (body, make_etag(body))
+        # Filters, sorting and pagination read only from these
+        self.index = PlanIndex(self.plans, self.etag[1:9])
+
+    @classmethod
+    def from_file(cls, path: str, model) -> "PlanCatalog":
+        with open(path, "r") as f:
+            data = json.load(f)
+        plans = data["esim_packages"] if isinstance(data, dict) else data
+        # package_data.json carries extra storefront fields; keep what the model knows
+        fields = model.model_fields.keys()
+        return cls([{k: v for k, v in plan.items() if k in fields} for plan in plans], model)
+
+    def __len__(self) -> int:
+        return len(self.plans)
+
+    def __contains__(self, plan_id: str) -> bool:
+        return plan_id in self._by_id
+
+    def get(self, plan_id: str):
+        return self._by_id.get(plan_id)
+
+    def list_response(self, request: Request) -> Response:
+        return cached_response(request, self.body, self.etag)
+
+    def item_response(self, request: Request, plan_id: str) -> Optional[Response]:
+        entry = self._item_bodies.get(plan_id)
+        if entry is None:
+            return None
+        return cached_response(request, *entry)
+
+    def item_entry(self, plan_id: str) -> Optional[Tuple[bytes, str]]:
+        return self._item_bodies.get(plan_id)
+
+    def search(self, query: PlanQuery) -> SearchPage:
+        try:
+            return self.index.search(query)
+        except InvalidQuery as e:
+            raise HTTPException(status_code=400, detail=str(e))
+
+    def page_response(self, request: Request, page: SearchPage,
+                      item_entry: Callable[[str], Optional[Tuple[bytes, str]]]) -> Response:
+        """A page as a JSON array, stitched from the pre-rendered item bodies."""
+        body = b"[" + b",".join(item_entry(self.plans[position].id)[0] for position in page.positions) + b"]"
+        response = cached_response(request, body, make_etag(body))
+        response.headers["X-Total-Count"] = str(page.total)
+        if page.next_cursor:
+            response.headers["X-Next-Cursor"] = page.next_cursor
+            response.headers["Link"] = f'<{request.url.include_query_params(cursor=page.next_cursor)}>; rel="next"'
+        return response
+
+
+# name -> (PlanQuery range field, which end); documented on the route via LISTING_PARAMETERS
+RANGE_PARAMS = {
+    "min_price_usd": ("price_usd", 0), "max_price_usd": ("price_usd", 1),
+    "min_data_gb": ("data_gb", 0), "max_data_gb": ("data_gb", 1),
+    "min_duration_days": ("duration_days", 0), "max_duration_days": ("duration_days", 1),
+}
+LISTING_KEYS = frozenset(RANGE_PARAMS) | {"feature", "sort", "limit", "cursor"}
+LISTING_PARAMETERS = [
+    *({"name": name, "in": "query", "required": False, "schema": {"type": "number"}} for name in RANGE_PARAMS),
+    {"name": "feature", "in": "query", "required": False, "schema": {"type": "array", "items": {"type": "string"}},
+     "description": "Feature tag the plan must have, e.g. instant-activation; repeat to require several"},
+    {"name": "sort", "in": "query", "required": False, "schema": {"type": "string"},
+     "description": "price_usd, data_gb or duration_days; prefix - for descending"},
+    {"name": "limit", "in": "query", "required": False,
+     "schema": {"type": "integer", "minimum": 1, "maximum": MAX_PAGE_SIZE, "default": PAGE_SIZE}},
+    {"name": "cursor", "in": "query", "required": False, "schema": {"type": "string"},
+     "description": "X-Next-Cursor from the previous page"},
+]
+
+
+def _number(params, name: str) -> Optional[float]:
+    value = params.get(name)
+    if value is None:
+        return None
+    try:
+        number = float(value)
+    except ValueError:
+        raise HTTPException(status_code=422, detail=f"{name} must be a number")
+    if number != number:
+        raise HTTPException(status_code=422, detail=f"{name} must be a number")
+    return number
+
+
+async def plan_query(request: Request) -> Optional[PlanQuery]:
+    """Listing parameters for /packages; None when the plain full catalog was asked for.
+
+    Parsed by hand so the unfiltered listing doesn't pay for validating ten
+    declared parameters on every request.
+    """
+    params = request.query_params
+    if LISTING_KEYS.isdisjoint(params.keys()):
+        return None
+    ranges = {field: [None, None] for field, _ in RANGE_PARAMS.values()}
+    for name, (field, end) in RANGE_PARAMS.items():
+        ranges[field][end] = _number(params, name)
+    limit = PAGE_SIZE
+    if "limit" in params:
+        try:
+            limit = int(params["limit"])
+        except ValueError:
+            limit = 0
+        if not 1 <= limit <= MAX_PAGE_SIZE:
+            raise HTTPException(status_code=422, detail=f"limit must be an integer from 1 to {MAX_PAGE_SIZE}")
+    return PlanQuery({field: tuple(bounds) for field, bounds in ranges.items()},
+                     params.getlist("feature"), params.get("sort"), limit, params.get("cursor"))
+
+
+def load_catalog(default_plans: List[dict], model) -> PlanCatalog:
+    if CATALOG_PATH:
+        return PlanCatalog.from_file(CATALOG_PATH, model)
+    return PlanCatalog(default_plans, model)
@@ -0,0 +1,111 @@
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, Tuple
+import asyncio
+import logging
+import os
+import time
+from metrics import registry
+from storage import ACTIVATION_STATUS_FIELDS, storage
+
+logger = logging.getLogger(__name__)
+
+# Activation status reads: fresh for TTL seconds, then served stale for up to
+# STALE more while one background read refreshes them. TTL=0 keeps only coalescing.
+ACTIVATION_CACHE_TTL = float(os.getenv("ACTIVATION_CACHE_TTL", "1"))
+ACTIVATION_CACHE_STALE = float(os.getenv("ACTIVATION_CACHE_STALE", "4"))
+ACTIVATION_CACHE_SIZE = int(os.getenv("ACTIVATION_CACHE_SIZE", "100000"))
+
+
+class CoalescingCache:
+    """Single-flight loads behind a micro-cache with stale-while-revalidate.
+
+    Concurrent gets for a key share one in-flight load. None results (not found)
+    are coalesced but never cached.
+    """
+
+    def __init__(self, loader: Callable[[Hashable], Awaitable[Any]], ttl: float = 1.0,
+                 stale: float = 4.0, max_size: int = 100000):
+        self.loader = loader
+        self.ttl = ttl
+        self.stale = stale
+        self.max_size = max_size
+        # key -> (value, loaded_at); insertion order doubles as eviction order
+        self._entries: Dict[Hashable, Tuple[Any, float]] = {}
+        self._inflight: Dict[Hashable, asyncio.Task] = {}
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.refresh_errors = 0
+
+    async def get(self, key: Hashable) -> Any:
+        entry = self._entries.get(key)
+        if entry is not None:
+            value, loaded_at = entry
+            age = time.monotonic() - loaded_at
+            if age < self.ttl:
+                self.hits += 1
+                return value
+            if age < self.ttl + self.stale:
+                self.stale_hits += 1
+                if key not in self._inflight:
+                    self._load(key).add_done_callback(self._log_refresh_error)
+                return value
+        task = self._inflight.get(key)
+        if task is not None:
+            self.coalesced += 1
+        else:
+            self.misses += 1
+            task = self._load(key)
+        # Shielded: a caller that disconnects doesn't cancel the read the others wait on
+        return await asyncio.shield(task)
+
+    def _load(self, key: Hashable) -> asyncio.Task:
+        task = asyncio.ensure_future(self._fetch(key))
+        self._inflight[key] = task
+        return task
+
+    async def _fetch(self, key: Hashable) -> Any:
+        try:
+            value = await self.loader(key)
+        finally:
+            self._inflight.pop(key, None)
+        self._entries.pop(key, None)
+        if value is not None and self.ttl > 0:
+            self._entries[key] = (value, time.monotonic())
+            if len(self._entries) > self.max_size:
+                del self._entries[next(iter(self._entries))]
+        return value
+
+    def _log_refresh_error(self, task: asyncio.Task):
+        if not task.cancelled() and task.exception() is not None:
+            self.refresh_errors += 1
+            logger.warning("Background refresh failed; serving stale until it expires: %r", task.exception())
+
+    def discard(self, key: Hashable):
+        self._entries.pop(key, None)
+
+    def clear(self):
+        self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+async def _read_activation(activation_id: str) -> Optional[dict]:
+    return await storage.activations.get(activation_id, ACTIVATION_STATUS_FIELDS)
+
+
+# Balance and usage reads for one activation, shared across concurrent requests.
+# Cached records are shared: copy before mutating.
+activation_reads = CoalescingCache(_read_activation, ACTIVATION_CACHE_TTL,
+                                   ACTIVATION_CACHE_STALE, ACTIVATION_CACHE_SIZE)
+
+registry.counter_function(
+    "activation_read_cache_total", "Activation status reads by outcome: hit, stale, miss or coalesced",
+    lambda: {("hit",): activation_reads.hits, ("stale",): activation_reads.stale_hits,
+             ("miss",): activation_reads.misses, ("coalesced",): activation_reads.coalesced},
+    ("result",))
+registry.counter_function("activation_read_refresh_errors_total",
+                          "Background revalidations that failed", lambda: activation_reads.refresh_errors)
+registry.gauge("activation_read_cache_entries", "Activation records held in the micro-cache",
+               lambda: len(activation_reads))
@@ -0,0 +1,160 @@
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from fastapi import HTTPException
+from typing import List, Optional, Tuple
+import asyncio
+import functools
+import os
+import time
+from metrics import password_hash_duration, registry
+
+# bcrypt cost; stored hashes with a different cost are rehashed on next login
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+# "thread" (bcrypt releases the GIL) or "process"
+HASH_EXECUTOR = os.getenv("PASSWORD_HASH_EXECUTOR", "thread")
+HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", str(min(4, os.cpu_count() or 1))))
+# Hash jobs allowed queued or running before new ones are turned away
+HASH_MAX_PENDING = int(os.getenv("PASSWORD_HASH_MAX_PENDING", "64"))
+
+@functools.lru_cache(maxsize=None)
+def get_pwd_context():
+    # Built on first use: importing passlib and loading the bcrypt backend is
+    # kept off worker startup (see server.warm_up)
+    from passlib.context import CryptContext
+    return CryptContext(
+        schemes=["bcrypt"],
+        deprecated="auto",
+        bcrypt__default_rounds=BCRYPT_ROUNDS,
+        bcrypt__min_rounds=BCRYPT_ROUNDS,
+        bcrypt__max_rounds=BCRYPT_ROUNDS,
+    )
+
+
+# Module-level so they can be pickled into a process pool
+def _hash(password: str) -> str:
+    return get_pwd_context().hash(password)
+
+
+def _hash_many(passwords: List[str]) -> List[str]:
+    context = get_pwd_context()
+    return [context.hash(password) for password in passwords]
+
+
+def _verify_and_update(password: str, hashed: str) -> Tuple[bool, Optional[str]]:
+    return get_pwd_context().verify_and_update(password, hashed)
+
+
+class PasswordHasher:
+    """Runs bcrypt off the event loop on a bounded worker pool."""
+
+    def __init__(self, executor: str = HASH_EXECUTOR, workers: int = HASH_WORKERS,
+                 max_pending: int = HASH_MAX_PENDING, nice: int = 0):
+        if executor not in ("thread", "process"):
+            raise ValueError(f"Unknown password hash executor: {executor}")
+        self.executor_kind = executor
+        self.workers = workers
+        self.max_pending = max_pending
+        # Process workers only: lowered CPU priority, so a pool can't crowd out the server
+        self.nice = nice
+        self._executor: Optional[Executor] = None
+        # Only touched from the event loop thread, so plain ints are enough
+        self.pending = 0
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+        self.rehashed = 0
+
+    @property
+    def executor(self) -> Executor:
+        if self._executor is None:
+            if self.executor_kind == "process":
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    initializer=os.nice if self.nice else None,
+                    initargs=(self.nice,) if self.nice else (),
+                )
+            else:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.workers, thread_name_prefix="bcrypt"
+                )
+        return self._executor
+
+    async def _run(self, operation: str, fn, *args):
+        # Admission control: fail fast instead of growing an unbounded queue
+        if self.pending >= self.max_pending:
+            self.rejected += 1
+            raise HTTPException(
+                status_code=503,
+                detail="Authentication service busy, please retry",
+                headers={"Retry-After": "1"},
+            )
+        self.pending += 1
+        start = time.perf_counter()
+        try:
+            result = await asyncio.get_running_loop().run_in_executor(self.executor, fn, *args)
+        except Exception:
+            # e.g. a malformed stored hash, or a process worker that died
+            self.failed += 1
+            raise
+        finally:
+            self.pending -= 1
+            password_hash_duration.labels(operation).observe(time.perf_counter() - start)
+        self.completed += 1
+        return result
+
+    async def hash(self, password: str) -> str:
+        return await self._run("hash", _hash, password)
+
+    async def hash_many(self, passwords: List[str]) -> List[str]:
+        """Hash a batch as one job per worker; the caller bounds how much it queues."""
+        if not passwords:
+            return []
+        size = -(-len(passwords) // self.workers)
+        chunks = [passwords[i:i + size] for i in range(0, len(passwords), size)]
+        hashed = await asyncio.gather(*(self._run("hash_many", _hash_many, chunk) for chunk in chunks))
+        return [h for chunk in hashed for h in chunk]
+
+    async def verify(self, password: str, hashed: str) -> Tuple[bool, Optional[str]]:
+        """Return (valid, new_hash); new_hash is set when the stored hash is outdated."""
+        valid, new_hash = await self._run("verify", _verify_and_update, password, hashed)
+        if valid and new_hash:
+            self.rehashed += 1
+        return valid, new_hash
+
+    def stats(self) -> dict:
+        return {
+            "executor": self.executor_kind,
+            "workers": self.workers,
+            "max_pending": self.max_pending,
+            "in_flight": min(self.pending, self.workers),
+            "queue_depth": max(0, self.pending - self.workers),
+            "completed": self.completed,
+            "failed": self.failed,
+            "rejected": self.rejected,
+            "rehashed": self.rehashed,
+        }
+
+    async def check_capacity(self):
+        # Readiness probe: a saturated pool would turn every login away with a 503
+        if self.pending >= self.max_pending:
+            raise RuntimeError(f"Password hashing saturated ({self.pending} jobs pending)")
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+password_hasher = PasswordHasher()
+
+registry.gauge("password_hash_queue_depth", "Hash jobs waiting for a pool worker",
+               lambda: password_hasher.stats()["queue_depth"])
+registry.gauge("password_hash_in_flight", "Hash jobs running on pool workers",
+               lambda: password_hasher.stats()["in_flight"])
+registry.counter_function("password_hash_completed_total", "Hash jobs that returned a result",
+                          lambda: password_hasher.completed)
+registry.counter_function("password_hash_failed_total", "Hash jobs that raised",
+                          lambda: password_hasher.failed)
+registry.counter_function("password_hash_rejected_total", "Hash jobs refused by admission control",
+                          lambda: password_hasher.rejected)
+registry.counter_function("password_hash_rehashed_total", "Stored hashes upgraded on login",
+                          lambda: password_hasher.rehashed)
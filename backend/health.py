@@ -0,0 +1,102 @@
+from fastapi import APIRouter, Response
+from typing import Awaitable, Callable, Dict, List, NamedTuple
+import asyncio
+import logging
+import os
+import time
+from coalesce import CoalescingCache
+from metrics import registry
+from responses import fast_json
+
+logger = logging.getLogger(__name__)
+
+# One probe run answers every /ready poll for this long, however often the
+# load balancers ask; failures are cached too, so a sick dependency isn't hammered
+READY_CACHE_TTL = float(os.getenv("READY_CACHE_TTL", "2"))
+# Per-probe limit; a probe that takes longer counts as failed
+READY_PROBE_TIMEOUT = float(os.getenv("READY_PROBE_TIMEOUT", "1"))
+
+# Outside /api/, so probes are never rate limited
+router = APIRouter(tags=["monitoring"])
+
+
+class Probe(NamedTuple):
+    name: str
+    # Raises (or times out) when the dependency isn't usable; cancelled on timeout
+    check: Callable[[], Awaitable[object]]
+    timeout: float
+
+
+class ReadinessChecks:
+    """Registered dependency probes, run concurrently each under its own timeout."""
+
+    def __init__(self, ttl: float = READY_CACHE_TTL):
+        self.probes: List[Probe] = []
+        self.draining = False
+        # Polls arriving while probes run wait for that run instead of starting another
+        self._reports = CoalescingCache(self._run_all, ttl=ttl, stale=0, max_size=1)
+        self.last: Dict[str, bool] = {}
+        self.runs = 0
+
+    def register(self, name: str, check: Callable[[], Awaitable[object]],
+                 timeout: float = READY_PROBE_TIMEOUT):
+        # Re-registering a name (create_app called again) replaces the old probe
+        self.probes = [p for p in self.probes if p.name != name] + [Probe(name, check, timeout)]
+        self._reports.clear()
+
+    async def _run_probe(self, probe: Probe) -> dict:
+        start = time.perf_counter()
+        try:
+            await asyncio.wait_for(probe.check(), probe.timeout)
+            result = {"status": "ok"}
+        except asyncio.TimeoutError:
+            result = {"status": "fail", "error": f"Timed out after {probe.timeout}s"}
+        except Exception as e:
+            result = {"status": "fail", "error": str(e) or type(e).__name__}
+        result["duration_ms"] = round((time.perf_counter() - start) * 1000, 3)
+        return result
+
+    async def _run_all(self, _key=None) -> dict:
+        self.runs += 1
+        results = await asyncio.gather(*(self._run_probe(probe) for probe in self.probes))
+        checks = {probe.name: result for probe, result in zip(self.probes, results)}
+        self.last = {name: result["status"] == "ok" for name, result in checks.items()}
+        failed = [name for name, ok in self.last.items() if not ok]
+        if failed:
+            logger.warning("Not ready: %s", ", ".join(failed))
+        return {"status": "fail" if failed else "ok", "checks": checks}
+
+    async def report(self) -> dict:
+        if self.draining:
+            return {"status": "fail", "checks": {}, "draining": True}
+        return await self._reports.get(None)
+
+    async def drain(self):
+        # First shutdown hook: fail /ready so balancers stop routing here while
+        # the rest of shutdown drains in-flight work
+        self.draining = True
+
+
+readiness = ReadinessChecks()
+
+_LIVE_BODY = fast_json({"status": "ok"})
+
+
+@router.get("/live")
+async def live():
+    """The process is up and its event loop is turning; checks no dependencies."""
+    return Response(_LIVE_BODY, media_type="application/json")
+
+
+@router.get("/ready")
+async def ready():
+    """200 when every registered dependency probe passes, else 503."""
+    report = await readiness.report()
+    return Response(fast_json(report), status_code=200 if report["status"] == "ok" else 503,
+                    media_type="application/json", headers={"Cache-Control": "no-store"})
+
+
+registry.gauge("readiness_check_up", "1 if the dependency passed its last readiness probe",
+               lambda: {(name,): int(ok) for name, ok in readiness.last.items()}, ("check",))
+registry.counter_function("readiness_probe_runs_total", "Readiness probe runs (cached reports excluded)",
+                          lambda: readiness.runs)
@@ -0,0 +1,324 @@
+"""Production entry point: pre-forked uvicorn workers sharing one listening socket.
+
+    python launcher.py --workers 4 --port 8000
+
+The app is imported once in the master and forked into each worker. SIGTERM or
+SIGINT drains every worker (in-flight requests finish, lifespan shutdown runs).
+SIGHUP reloads without downtime: the master re-executes itself with the new code
+on the same socket, then replaces the old workers one at a time.
+"""
+
+from typing import Dict, List, Optional
+import argparse
+import importlib
+import logging
+import os
+import select
+import signal
+import socket
+import subprocess
+import sys
+import time
+
+logger = logging.getLogger("launcher")
+
+WEB_CONCURRENCY = int(os.getenv("WEB_CONCURRENCY", str(os.cpu_count() or 1)))
+HOST = os.getenv("HOST", "0.0.0.0")
+PORT = int(os.getenv("PORT", "8000"))
+# Seconds a draining worker gets to finish in-flight requests before it is killed
+GRACEFUL_TIMEOUT = float(os.getenv("GRACEFUL_TIMEOUT", "30"))
+WORKER_BOOT_TIMEOUT = float(os.getenv("WORKER_BOOT_TIMEOUT", "60"))
+# Workers dying this many times in a row without becoming ready stop the launcher
+MAX_BOOT_FAILURES = 5
+
+# Handed across a SIGHUP re-exec
+LISTEN_FD_ENV = "ESIM_LISTEN_FD"
+DRAIN_PIDS_ENV = "ESIM_DRAIN_PIDS"
+
+
+def process_local_state() -> List[str]:
+    """Stores configured in a way that would diverge between worker processes."""
+    from ratelimit import rate_limiter
+    from storage import storage
+    local = []
+    if storage.process_local:
+        # Also where logout revocations are shared between workers
+        local.append("storage (set MONGO_URL)")
+    if rate_limiter.process_local:
+        local.append("rate limiter (set RATE_LIMIT_BACKEND=mongo or RATE_LIMIT_ENABLED=false)")
+    return local
+
+
+def load_app(target: str):
+    module_name, _, attribute = target.partition(":")
+    return getattr(importlib.import_module(module_name), attribute or "app")
+
+
+class Worker:
+    __slots__ = ("pid", "ready")
+
+    def __init__(self, pid: int):
+        self.pid = pid
+        self.ready = False
+
+
+class Launcher:
+    def __init__(self, target: str, host: str, port: int, workers: int,
+                 graceful_timeout: float = GRACEFUL_TIMEOUT):
+        self.target = target
+        self.host = host
+        self.port = port
+        self.worker_count = workers
+        self.graceful_timeout = graceful_timeout
+        self.workers: Dict[int, Worker] = {}
+        # Previous generation's workers, still serving until replaced
+        self.draining: Dict[int, Worker] = {}
+        self.app = None
+        self.sock: Optional[socket.socket] = None
+        self._signals: List[int] = []
+        self._wakeup_r = self._wakeup_w = -1
+        self._boot_failures = 0
+        self._stopping = False
+
+    # ----- master -----
+
+    def listen(self) -> socket.socket:
+        inherited = os.environ.pop(LISTEN_FD_ENV, None)
+        if inherited is not None:
+            sock = socket.socket(fileno=int(inherited))
+        else:
+            family = socket.AF_INET6 if ":" in self.host else socket.AF_INET
+            sock = socket.socket(family, socket.SOCK_STREAM)
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            sock.bind((self.host, self.port))
+            sock.listen(2048)
+        sock.set_inheritable(True)
+        return sock
+
+    def _on_signal(self, signum, frame):
+        self._signals.append(signum)
+
+    def install_signal_handlers(self):
+        self._wakeup_r, self._wakeup_w = os.pipe()
+        os.set_blocking(self._wakeup_r, False)
+        os.set_blocking(self._wakeup_w, False)
+        signal.set_wakeup_fd(self._wakeup_w)
+        for signum in (signal.SIGTERM, signal.SIGINT, signal.SIGHUP, signal.SIGCHLD):
+            signal.signal(signum, self._on_signal)
+
+    def run(self) -> int:
+        self.sock = self.listen()
+        # Preload: import once here, share the pages with every forked worker
+        self.app = load_app(self.target)
+        self.install_signal_handlers()
+        self.draining = {int(pid): Worker(int(pid))
+                         for pid in os.environ.pop(DRAIN_PIDS_ENV, "").split(",") if pid}
+        logger.info("Listening on %s:%d with %d workers", self.host, self.port, self.worker_count)
+
+        if self.draining:
+            self.replace_workers()
+        while len(self.workers) < self.worker_count and not self._stopping:
+            self.spawn()
+
+        while not self._stopping:
+            self.wait_for_signal(1.0)
+            self.handle_signals()
+            self.reap()
+            if not self._stopping:
+                self.maintain()
+        return self.shutdown()
+
+    def wait_for_signal(self, timeout: float):
+        if not self._signals:
+            select.select([self._wakeup_r], [], [], timeout)
+        try:
+            while os.read(self._wakeup_r, 4096):
+                pass
+        except BlockingIOError:
+            pass
+
+    def handle_signals(self):
+        while self._signals:
+            signum = self._signals.pop(0)
+            if signum in (signal.SIGTERM, signal.SIGINT):
+                logger.info("Received %s, draining workers", signal.Signals(signum).name)
+                self._stopping = True
+            elif signum == signal.SIGHUP:
+                self.reload()
+
+    def reap(self):
+        while True:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                return
+            if pid == 0:
+                return
+            if pid in self.draining:
+                del self.draining[pid]
+                continue
+            worker = self.workers.pop(pid, None)
+            if worker is not None and not self._stopping:
+                logger.warning("Worker %d exited with %d", pid, os.waitstatus_to_exitcode(status))
+                if not worker.ready:
+                    self._boot_failures += 1
+
+    def maintain(self):
+        if self._boot_failures >= MAX_BOOT_FAILURES:
+            logger.error("Workers keep failing to boot; stopping")
+            self._stopping = True
+            return
+        while len(self.workers) < self.worker_count:
+            if self._boot_failures:
+                # Back off while new workers keep crashing during boot
+                time.sleep(min(5.0, 0.1 * 2 ** self._boot_failures))
+            self.spawn()
+
+    def spawn(self) -> Worker:
+        # Serial is fine: with the app preloaded, a worker only runs lifespan startup
+        ready_r, ready_w = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            os.close(ready_r)
+            code = 1
+            try:
+                code = self.run_worker(ready_w)
+            except BaseException:
+                logger.exception("Worker crashed")
+            finally:
+                # os._exit skips atexit; write out queued log lines first
+                logging.shutdown()
+                os._exit(code)
+        os.close(ready_w)
+        worker = Worker(pid)
+        self.workers[pid] = worker
+        worker.ready = self.wait_ready(ready_r, WORKER_BOOT_TIMEOUT)
+        os.close(ready_r)
+        if worker.ready:
+            self._boot_failures = 0
+        return worker
+
+    @staticmethod
+    def wait_ready(ready_r: int, timeout: float) -> bool:
+        readable, _, _ = select.select([ready_r], [], [], timeout)
+        return bool(readable) and os.read(ready_r, 1) == b"R"
+
+    def replace_workers(self):
+        """Start new workers one by one, retiring an old one as each becomes ready."""
+        logger.info("Replacing %d workers from the previous generation", len(self.draining))
+        while len(self.workers) < self.worker_count:
+            worker = self.spawn()
+            if not worker.ready:
+                logger.error("New worker %d did not become ready; keeping the old generation", worker.pid)
+                self.terminate(list(self.workers))
+                self.workers.update(self.draining)
+                self.draining = {}
+                return
+            old = next(iter(self.draining), None)
+            if old is not None:
+                self.terminate([old])
+        self.terminate(list(self.draining))
+
+    def reload(self):
+        # Check the new code imports before giving up this process image
+        module_name = self.target.partition(":")[0]
+        check = subprocess.run([sys.executable, "-c", f"import {module_name}"],
+                               capture_output=True, text=True)
+        if check.returncode != 0:
+            logger.error("Reload aborted, new code fails to import:\n%s", check.stderr[-2000:])
+            return
+        logger.info("Reloading: re-executing with the listening socket")
+        env = dict(os.environ)
+        env[LISTEN_FD_ENV] = str(self.sock.fileno())
+        env[DRAIN_PIDS_ENV] = ",".join(str(pid) for pid in [*self.workers, *self.draining])
+        signal.set_wakeup_fd(-1)
+        # Same pid, so the current workers stay our children and can be reaped after exec
+        os.execve(sys.executable, sys.orig_argv, env)
+
+    def terminate(self, pids: List[int]):
+        for pid in pids:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    def shutdown(self) -> int:
+        pids = [*self.workers, *self.draining]
+        self.terminate(pids)
+        deadline = time.monotonic() + self.graceful_timeout + 5
+        while (self.workers or self.draining) and time.monotonic() < deadline:
+            self.reap()
+            time.sleep(0.1)
+        for pid in [*self.workers, *self.draining]:
+            logger.warning("Worker %d did not drain in time, killing it", pid)
+            try:
+                os.kill(pid, signal.SIGKILL)
+            except ProcessLookupError:
+                pass
+        self.reap()
+        return 0
+
+    # ----- worker -----
+
+    def run_worker(self, ready_w: int) -> int:
+        import asyncio
+        import uvicorn
+
+        for signum in (signal.SIGTERM, signal.SIGINT, signal.SIGHUP, signal.SIGCHLD):
+            signal.signal(signum, signal.SIG_DFL)
+        signal.set_wakeup_fd(-1)
+        os.close(self._wakeup_r)
+        os.close(self._wakeup_w)
+
+        config = uvicorn.Config(
+            self.app,
+            lifespan="on",
+            # The app's AccessLogMiddleware logs requests; uvicorn's own loggers
+            # propagate to the root handler instead of writing to stderr directly
+            log_config=None,
+            access_log=False,
+            # Leave room for lifespan shutdown inside the master's drain window
+            timeout_graceful_shutdown=max(1, int(self.graceful_timeout) - 5),
+        )
+        config.setup_event_loop()
+        server = uvicorn.Server(config)
+
+        async def serve():
+            # uvicorn handles SIGTERM/SIGINT itself: stop accepting, drain, shut down
+            task = asyncio.create_task(server.serve(sockets=[self.sock]))
+            while not server.started and not task.done():
+                await asyncio.sleep(0.05)
+            if server.started:
+                os.write(ready_w, b"R")
+            os.close(ready_w)
+            await task
+
+        asyncio.run(serve())
+        return 0 if server.started else 3
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="eSIM Myanmar API launcher")
+    parser.add_argument("target", nargs="?", default="server:app", help="module:attribute of the ASGI app")
+    parser.add_argument("--host", default=HOST)
+    parser.add_argument("--port", type=int, default=PORT)
+    parser.add_argument("--workers", type=int, default=WEB_CONCURRENCY,
+                        help="Worker processes (default: WEB_CONCURRENCY or the number of cores)")
+    parser.add_argument("--graceful-timeout", type=float, default=GRACEFUL_TIMEOUT)
+    args = parser.parse_args()
+
+    # Workers inherit the pipeline across fork; the app's startup hook then finds it in place
+    from logs import configure_logging
+    configure_logging()
+    if args.workers > 1:
+        local = process_local_state()
+        if local:
+            logger.error("Refusing to start %d workers with process-local state: %s. "
+                         "Each worker would see different data; run with --workers 1 instead.",
+                         args.workers, "; ".join(local))
+            return 2
+    return Launcher(args.target, args.host, args.port, args.workers, args.graceful_timeout).run()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,277 @@
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from collections import deque
+from typing import Deque, Optional
+import asyncio
+import atexit
+import json
+import logging
+import os
+import random
+import re
+import sys
+import threading
+import time
+from metrics import registry
+
+# json (one object per line) or text (the classic human-readable format)
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json").lower()
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+# Append to this file instead of stderr
+LOG_FILE = os.getenv("LOG_FILE")
+# Records waiting for the writer thread; beyond this they are dropped and counted
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+LOG_BATCH_SIZE = 512
+# Longest a record waits before the writer thread picks it up
+LOG_FLUSH_INTERVAL = float(os.getenv("LOG_FLUSH_INTERVAL", "0.2"))
+# Successful requests to these routes are logged at ACCESS_LOG_SAMPLE_RATE;
+# errors (status >= 400) and slow requests are always logged
+ACCESS_LOG_SAMPLED_ROUTES = {r.strip() for r in os.getenv(
+    "ACCESS_LOG_SAMPLED_ROUTES",
+    "/api/packages,/api/packages/{plan_id},/api/health,/api/company,/metrics,/live,/ready",
+).split(",") if r.strip()}
+ACCESS_LOG_SAMPLE_RATE = float(os.getenv("ACCESS_LOG_SAMPLE_RATE", "0.01"))
+ACCESS_LOG_SLOW_MS = float(os.getenv("ACCESS_LOG_SLOW_MS", "500"))
+
+TEXT_FORMAT = "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+REQUEST_ID_HEADER = b"x-request-id"
+# Incoming ids are echoed only if they look like ids, not arbitrary header content
+VALID_REQUEST_ID = re.compile(rb"^[A-Za-z0-9._:-]{1,64}$")
+
+request_id_var: ContextVar[Optional[str]] = ContextVar("request_id", default=None)
+access_logger = logging.getLogger("access")
+
+# Attributes every LogRecord has; anything else came in through extra=
+_RECORD_FIELDS = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "request_id"}
+_plain = logging.Formatter()
+
+
+class JSONFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        request_id = getattr(record, "request_id", None)
+        if request_id is not None:
+            entry["request_id"] = request_id
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_FIELDS:
+                entry[key] = value
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry["exc"] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class QueueingHandler(logging.Handler):
+    """Hands records to the writer thread; never blocks the caller."""
+
+    def __init__(self, pipeline: "LogPipeline"):
+        super().__init__()
+        self.pipeline = pipeline
+
+    def emit(self, record: logging.LogRecord):
+        # Context is only visible here, on the emitting thread / task
+        record.request_id = request_id_var.get()
+        # Like QueueHandler: merge args and render tracebacks now, since both may
+        # change once the caller moves on; JSON encoding and I/O happen on the writer
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = record.exc_text or _plain.formatException(record.exc_info)
+            record.exc_info = None
+        self.pipeline.put(record)
+
+    def close(self):
+        self.pipeline.stop()
+        super().close()
+
+
+class LogPipeline:
+    """Bounded buffer drained in batches by one writer thread.
+
+    The writer wakes on an interval, or early once the buffer is half full, rather
+    than per record: every wakeup makes the event loop hand over the GIL mid-request.
+    """
+
+    def __init__(self, stream=None, formatter: Optional[logging.Formatter] = None,
+                 max_size: int = LOG_QUEUE_SIZE, interval: float = LOG_FLUSH_INTERVAL):
+        self.stream = stream or sys.stderr
+        self.formatter = formatter or JSONFormatter()
+        self.max_size = max_size
+        self.interval = interval
+        self.dropped = 0
+        self.written = 0
+        self.sampled_out = 0
+        # deque append/popleft are atomic, so emitting takes no lock
+        self.records: Deque[logging.LogRecord] = deque()
+        self._wake = threading.Event()
+        self._stopping = False
+        self._writing = False
+        self._thread: Optional[threading.Thread] = None
+
+    def put(self, record: logging.LogRecord):
+        if len(self.records) >= self.max_size:
+            self.dropped += 1
+            return
+        self.records.append(record)
+        if len(self.records) == self.max_size // 2:
+            self._wake.set()
+
+    def start(self):
+        self._stopping = False
+        self._thread = threading.Thread(target=self._run, name="log-writer", daemon=True)
+        self._thread.start()
+
+    def after_fork(self):
+        # Threads don't survive fork; the parent writes what was buffered before it
+        self.records = deque()
+        self._wake = threading.Event()
+        self._writing = False
+        self.start()
+
+    def _format(self, record: logging.LogRecord) -> str:
+        try:
+            return self.formatter.format(record)
+        except Exception as e:
+            return json.dumps({"level": "ERROR", "logger": "logs", "msg": f"Unformattable record: {e!r}"})
+
+    def _drain(self):
+        self._writing = True
+        try:
+            while self.records:
+                batch = []
+                while self.records and len(batch) < LOG_BATCH_SIZE:
+                    batch.append(self.records.popleft())
+                try:
+                    self.stream.write("".join(self._format(r) + "\n" for r in batch))
+                    self.stream.flush()
+                except Exception:
+                    pass
+                self.written += len(batch)
+        finally:
+            self._writing = False
+
+    def _run(self):
+        while not self._stopping:
+            self._wake.wait(self.interval)
+            self._wake.clear()
+            self._drain()
+        self._drain()
+
+    def flush(self, timeout: float = 5.0):
+        """Wait until everything buffered so far has been written."""
+        self._wake.set()
+        deadline = time.monotonic() + timeout
+        while (self.records or self._writing) and time.monotonic() < deadline:
+            time.sleep(0.005)
+
+    def stop(self, timeout: float = 5.0):
+        if self._thread is None or not self._thread.is_alive():
+            return
+        self._stopping = True
+        self._wake.set()
+        self._thread.join(timeout)
+        self._thread = None
+
+
+pipeline: Optional[LogPipeline] = None
+
+
+def configure_logging(level: str = LOG_LEVEL, fmt: str = LOG_FORMAT) -> LogPipeline:
+    """Route all logging through the queue; replaces whatever handlers root had."""
+    global pipeline
+    if pipeline is not None:
+        return pipeline
+    formatter = JSONFormatter() if fmt == "json" else logging.Formatter(TEXT_FORMAT)
+    stream = open(LOG_FILE, "a", encoding="utf-8") if LOG_FILE else None
+    pipeline = LogPipeline(stream, formatter)
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(QueueingHandler(pipeline))
+    root.setLevel(level)
+    pipeline.start()
+    os.register_at_fork(after_in_child=pipeline.after_fork)
+    atexit.register(pipeline.stop)
+    return pipeline
+
+
+async def flush_logs():
+    # Last shutdown hook: lines about draining make it out before the worker exits
+    if pipeline is not None:
+        await asyncio.to_thread(pipeline.flush)
+
+
+def _request_id(scope) -> str:
+    for name, value in scope["headers"]:
+        if name == REQUEST_ID_HEADER:
+            if VALID_REQUEST_ID.match(value):
+                return value.decode()
+            break
+    # Same shape as uuid4().hex, without building a UUID per request
+    return os.urandom(16).hex()
+
+
+class AccessLogMiddleware:
+    """Tags each request with an id (X-Request-ID in and out) and logs it, sampled."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        request_id = _request_id(scope)
+        token = request_id_var.set(request_id)
+        status = 500
+        start = time.perf_counter()
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                message["headers"] = [*message.get("headers", ()), (REQUEST_ID_HEADER, request_id.encode())]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            duration_ms = (time.perf_counter() - start) * 1000
+            route = getattr(scope.get("route"), "path", None)
+            sample_rate = 1.0
+            if status < 400 and duration_ms < ACCESS_LOG_SLOW_MS and route in ACCESS_LOG_SAMPLED_ROUTES:
+                sample_rate = ACCESS_LOG_SAMPLE_RATE
+                if random.random() >= sample_rate:
+                    if pipeline is not None:
+                        pipeline.sampled_out += 1
+                    sample_rate = 0.0
+            if sample_rate and access_logger.isEnabledFor(logging.INFO):
+                client = scope.get("client")
+                access_logger.info("request", extra={
+                    "method": scope["method"],
+                    "path": scope["path"],
+                    "route": route,
+                    "status": status,
+                    "duration_ms": round(duration_ms, 3),
+                    "client": client[0] if client else None,
+                    # Weight for reconstructing totals from sampled lines
+                    "sample_rate": sample_rate,
+                })
+            request_id_var.reset(token)
+
+
+registry.counter_function("log_records_dropped_total", "Log records dropped because the queue was full",
+                          lambda: pipeline.dropped if pipeline else 0)
+registry.counter_function("log_records_written_total", "Log records written by the writer thread",
+                          lambda: pipeline.written if pipeline else 0)
+registry.counter_function("access_log_sampled_out_total", "Successful requests not logged due to sampling",
+                          lambda: pipeline.sampled_out if pipeline else 0)
+registry.gauge("log_queue_depth", "Log records waiting for the writer thread",
+               lambda: len(pipeline.records) if pipeline else 0)
@@ -0,0 +1,301 @@
+from abc import ABC, abstractmethod
+from bisect import bisect_left
+from fastapi import APIRouter, HTTPException, Request
+from fastapi.responses import PlainTextResponse
+from typing import Callable, Dict, Optional, Sequence, Tuple, Union
+import asyncio
+import ipaddress
+import os
+import time
+
+router = APIRouter(tags=["monitoring"])
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+LOOP_LAG_INTERVAL = 0.5
+# Peers allowed to scrape /metrics: loopback and the private ranges an internal
+# scraper sits on. The app port may be reachable from outside, so nothing else is
+METRICS_ALLOWED_NETWORKS = [
+    ipaddress.ip_network(net.strip())
+    for net in os.getenv("METRICS_ALLOWED_NETWORKS",
+                         "127.0.0.0/8,::1/128,10.0.0.0/8,172.16.0.0/12,192.168.0.0/16").split(",")
+    if net.strip()
+]
+
+# All updates happen on the event loop thread, so metrics are plain attribute
+# increments with no locks. Record from worker threads via the loop instead.
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class _CounterChild:
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0
+
+    def inc(self, amount: float = 1):
+        self.value += amount
+
+
+class _HistogramChild:
+    __slots__ = ("bounds", "counts", "sum", "count")
+
+    def __init__(self, bounds: Tuple[float, ...]):
+        self.bounds = bounds
+        # Preallocated: one slot per bucket plus +Inf
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class _Family(ABC):
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+
+    def header(self) -> str:
+        return f"# HELP {self.name} {self.documentation}\n# TYPE {self.name} {self.kind}\n"
+
+    @abstractmethod
+    def render(self) -> str:
+        """Exposition text for every sample in the family."""
+
+
+class _LabelledFamily(_Family):
+    """Family whose samples are children recorded into, one per set of label values."""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._children: Dict[Tuple[str, ...], object] = {}
+
+    @abstractmethod
+    def _new_child(self):
+        """A fresh child for one combination of label values."""
+
+    def labels(self, *values: str):
+        child = self._children.get(values)
+        if child is None:
+            child = self._children[values] = self._new_child()
+        return child
+
+
+class Counter(_LabelledFamily):
+    kind = "counter"
+
+    def _new_child(self):
+        return _CounterChild()
+
+    def inc(self, amount: float = 1):
+        self.labels().inc(amount)
+
+    def render(self) -> str:
+        lines = [self.header()]
+        for values, child in self._children.items():
+            lines.append(f"{self.name}{_format_labels(self.labelnames, values)} {child.value}\n")
+        return "".join(lines)
+
+
+class Histogram(_LabelledFamily):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.bounds = tuple(sorted(buckets))
+
+    def _new_child(self):
+        return _HistogramChild(self.bounds)
+
+    def observe(self, value: float):
+        self.labels().observe(value)
+
+    def render(self) -> str:
+        lines = [self.header()]
+        for values, child in self._children.items():
+            cumulative = 0
+            for bound, count in zip(self.bounds + (float("inf"),), child.counts):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                labels = _format_labels(self.labelnames, values, f'le="{le}"')
+                lines.append(f"{self.name}_bucket{labels} {cumulative}\n")
+            labels = _format_labels(self.labelnames, values)
+            lines.append(f"{self.name}_sum{labels} {child.sum}\n")
+            lines.append(f"{self.name}_count{labels} {child.count}\n")
+        return "".join(lines)
+
+
+class CallbackMetric(_Family):
+    """Gauge or counter whose value is read from a callback at scrape time."""
+
+    def __init__(self, name: str, documentation: str,
+                 callback: Callable[[], Union[float, Dict[Tuple[str, ...], float]]],
+                 labelnames: Sequence[str] = (), kind: str = "gauge"):
+        super().__init__(name, documentation, labelnames)
+        self.callback = callback
+        self.kind = kind
+
+    def render(self) -> str:
+        value = self.callback()
+        samples = value if isinstance(value, dict) else {(): value}
+        lines = [self.header()]
+        for values, sample in samples.items():
+            lines.append(f"{self.name}{_format_labels(self.labelnames, values)} {sample}\n")
+        return "".join(lines)
+
+
+class Registry:
+    def __init__(self):
+        self._families: Dict[str, _Family] = {}
+
+    def _add(self, family: _Family) -> _Family:
+        if family.name in self._families:
+            raise ValueError(f"Metric {family.name} already registered")
+        self._families[family.name] = family
+        return family
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._add(Counter(name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = LATENCY_BUCKETS) -> Histogram:
+        return self._add(Histogram(name, documentation, labelnames, buckets))
+
+    def gauge(self, name: str, documentation: str, callback,
+              labelnames: Sequence[str] = ()) -> CallbackMetric:
+        return self._add(CallbackMetric(name, documentation, callback, labelnames))
+
+    def counter_function(self, name: str, documentation: str, callback,
+                         labelnames: Sequence[str] = ()) -> CallbackMetric:
+        # For counters other modules already keep, e.g. pool rejection totals
+        return self._add(CallbackMetric(name, documentation, callback, labelnames, kind="counter"))
+
+    def render(self) -> str:
+        return "".join(family.render() for family in self._families.values())
+
+
+registry = Registry()
+
+request_duration = registry.histogram(
+    "http_request_duration_seconds", "HTTP request latency by route", ("method", "route"))
+requests_total = registry.counter(
+    "http_requests_total", "HTTP responses by route and status code", ("method", "route", "status"))
+loop_lag = registry.histogram(
+    "event_loop_lag_seconds", "Delay of event loop wakeups past their schedule",
+    buckets=(0.0005, 0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0))
+password_hash_duration = registry.histogram(
+    "password_hash_duration_seconds", "bcrypt time including pool queueing", ("operation",),
+    buckets=(0.01, 0.025, 0.05, 0.1, 0.2, 0.3, 0.5, 1.0, 2.5, 5.0))
+jwt_decode_duration = registry.histogram(
+    "jwt_decode_duration_seconds", "JWT signature verification time on cache misses",
+    buckets=(0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.01))
+
+requests_in_flight = _CounterChild()
+registry.gauge("http_requests_in_flight", "Requests currently being served",
+               lambda: requests_in_flight.value)
+
+
+class MetricsMiddleware:
+    """ASGI middleware recording per-route latency, status codes and in-flight requests."""
+
+    def __init__(self, app):
+        self.app = app
+        self._route_metrics: Dict[Tuple[str, str], object] = {}
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = 500
+        start = time.perf_counter()
+        requests_in_flight.value += 1
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            requests_in_flight.value -= 1
+            # Route templates keep label cardinality bounded; unmatched paths share one label
+            route = scope.get("route")
+            route_path = getattr(route, "path", None) or "unmatched"
+            key = (scope["method"], route_path)
+            histogram = self._route_metrics.get(key)
+            if histogram is None:
+                histogram = self._route_metrics[key] = request_duration.labels(*key)
+            histogram.observe(time.perf_counter() - start)
+            requests_total.labels(scope["method"], route_path, str(status)).inc()
+
+
+class LoopLagMonitor:
+    def __init__(self, interval: float = LOOP_LAG_INTERVAL):
+        self.interval = interval
+        self.last_lag = 0.0
+        self._task: Optional[asyncio.Task] = None
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            scheduled = loop.time() + self.interval
+            await asyncio.sleep(self.interval)
+            self.last_lag = max(0.0, loop.time() - scheduled)
+            loop_lag.observe(self.last_lag)
+
+    async def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+
+loop_lag_monitor = LoopLagMonitor()
+registry.gauge("event_loop_lag_last_seconds", "Most recent event loop lag sample",
+               lambda: loop_lag_monitor.last_lag)
+
+
+def scrape_allowed(peer: Optional[str], forwarded_for: Optional[str]) -> bool:
+    # A request relayed by a proxy is a public client, whatever the proxy's own address
+    if forwarded_for:
+        return False
+    try:
+        ip = ipaddress.ip_address(peer or "")
+    except ValueError:
+        return False
+    return any(ip in network for network in METRICS_ALLOWED_NETWORKS)
+
+
+@router.get("/metrics", response_class=PlainTextResponse, include_in_schema=False)
+async def get_metrics(request: Request):
+    client = request.client
+    if not scrape_allowed(client.host if client else None, request.headers.get("x-forwarded-for")):
+        # Indistinguishable from a missing route
+        raise HTTPException(status_code=404, detail="Not Found")
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
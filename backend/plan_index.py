@@ -0,0 +1,148 @@
+from bisect import bisect_left, bisect_right
+from typing import Dict, List, NamedTuple, Optional, Sequence, Tuple
+import base64
+import hashlib
+import json
+import re
+
+# Numeric plan fields that can be range-filtered and sorted on
+INDEXED_FIELDS = ("price_usd", "data_gb", "duration_days")
+# Positions per precomputed prefix bitset; a range mask costs two lookups plus
+# at most 2 * BLOCK single-bit fixups at its edges
+BLOCK = 64
+
+
+def feature_tag(feature: str) -> str:
+    """'5GB High-Speed Data' -> '5gb-high-speed-data'"""
+    return re.sub(r"[^a-z0-9]+", "-", feature.lower()).strip("-")
+
+
+class PlanQuery(NamedTuple):
+    # field -> (min, max), either end may be None
+    ranges: Dict[str, Tuple[Optional[float], Optional[float]]]
+    features: Sequence[str]
+    sort: Optional[str]
+    limit: int
+    cursor: Optional[str]
+
+
+class SearchPage(NamedTuple):
+    positions: List[int]
+    total: int
+    next_cursor: Optional[str]
+
+
+class InvalidQuery(ValueError):
+    pass
+
+
+class _FieldIndex:
+    """Plan positions sorted by one field, with block prefix bitsets over that order."""
+
+    def __init__(self, values: List[float]):
+        self.order = sorted(range(len(values)), key=lambda i: (values[i], i))
+        self.keys = [values[i] for i in self.order]
+        self.prefix = [0]
+        mask = 0
+        for rank, position in enumerate(self.order, 1):
+            mask |= 1 << position
+            if rank % BLOCK == 0:
+                self.prefix.append(mask)
+
+    def bounds(self, low: Optional[float], high: Optional[float]) -> Tuple[int, int]:
+        """Rank range [start, stop) of plans with low <= value <= high"""
+        start = 0 if low is None else bisect_left(self.keys, low)
+        stop = len(self.keys) if high is None else bisect_right(self.keys, high)
+        return start, max(start, stop)
+
+    def _mask_before(self, rank: int) -> int:
+        block = rank // BLOCK
+        mask = self.prefix[block]
+        for position in self.order[block * BLOCK:rank]:
+            mask |= 1 << position
+        return mask
+
+    def mask(self, start: int, stop: int) -> int:
+        return self._mask_before(stop) & ~self._mask_before(start)
+
+
+class PlanIndex:
+    """Sorted field indexes and feature-tag bitsets, built once per catalog.
+
+    Bit i of every mask stands for the plan at position i in catalog order.
+    """
+
+    def __init__(self, plans: Sequence, version: str):
+        self.size = len(plans)
+        self.version = version
+        self.all = (1 << self.size) - 1
+        self.fields = {field: _FieldIndex([getattr(plan, field) for plan in plans])
+                       for field in INDEXED_FIELDS}
+        self.tags: Dict[str, int] = {}
+        for position, plan in enumerate(plans):
+            for feature in plan.features:
+                tag = feature_tag(feature)
+                self.tags[tag] = self.tags.get(tag, 0) | (1 << position)
+
+    def _listing(self, query: PlanQuery) -> str:
+        """Identifies the result set a cursor walks: catalog version, filters and sort"""
+        ranges = sorted((f, r) for f, r in query.ranges.items() if r != (None, None))
+        key = json.dumps([ranges, sorted(feature_tag(f) for f in query.features), query.sort])
+        return self.version + hashlib.sha256(key.encode()).hexdigest()[:8]
+
+    def encode_cursor(self, query: PlanQuery, rank: int) -> str:
+        raw = json.dumps([self._listing(query), rank], separators=(",", ":")).encode()
+        return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+    def decode_cursor(self, query: PlanQuery) -> int:
+        try:
+            raw = base64.urlsafe_b64decode(query.cursor + "=" * (-len(query.cursor) % 4))
+            listing, rank = json.loads(raw)
+        except (ValueError, TypeError):
+            raise InvalidQuery("Malformed cursor")
+        if listing != self._listing(query) or not isinstance(rank, int) or rank < 0:
+            raise InvalidQuery("Cursor does not belong to this listing; start again without it")
+        return rank
+
+    def search(self, query: PlanQuery) -> SearchPage:
+        mask = self.all
+        bounds = {}
+        for field, (low, high) in query.ranges.items():
+            if low is None and high is None:
+                continue
+            start, stop = bounds[field] = self.fields[field].bounds(low, high)
+            mask &= self.fields[field].mask(start, stop)
+        for feature in query.features:
+            mask &= self.tags.get(feature_tag(feature), 0)
+
+        descending = bool(query.sort) and query.sort.startswith("-")
+        field = query.sort.lstrip("-") if query.sort else None
+        if field is not None and field not in self.fields:
+            raise InvalidQuery(f"Unsupported sort; choose one of {', '.join(INDEXED_FIELDS)} (prefix - for descending)")
+        rank = self.decode_cursor(query) if query.cursor else 0
+
+        positions = []
+        if field is None:
+            # Catalog order: walk set bits directly; the cursor is the next position to return
+            remaining = mask >> rank << rank if rank < self.size else 0
+            while remaining and len(positions) <= query.limit:
+                low_bit = remaining & -remaining
+                positions.append(low_bit.bit_length() - 1)
+                remaining ^= low_bit
+            next_rank = positions[query.limit] if len(positions) > query.limit else None
+        else:
+            # Walk the sort order from the cursor, only inside the filtered range on that field
+            index = self.fields[field]
+            start, stop = bounds.get(field, (0, self.size))
+            ranks = range(stop - 1 - rank, start - 1, -1) if descending else range(start + rank, stop)
+            next_rank = None
+            for offset, at in enumerate(ranks):
+                position = index.order[at]
+                if mask >> position & 1:
+                    if len(positions) == query.limit:
+                        next_rank = rank + offset
+                        break
+                    positions.append(position)
+        positions = positions[:query.limit]
+        next_cursor = None if next_rank is None else self.encode_cursor(query, next_rank)
+        return SearchPage(positions, mask.bit_count(), next_cursor)
@@ -0,0 +1,191 @@
+from fastapi import HTTPException, Request, Response
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+import asyncio
+import json
+import logging
+import os
+from catalog import cached_response, make_etag, render_json
+
+logger = logging.getLogger(__name__)
+
+# Same shape as package_data.json's currency_rates: {"USD_to_MMK": 2100, ..., "last_updated": "..."}
+FX_RATES_PATH = os.getenv("FX_RATES_PATH")
+FX_REFRESH_INTERVAL = float(os.getenv("FX_REFRESH_INTERVAL", "60"))
+# Price tables kept for recent rate versions, so a flip-flopping feed doesn't recompute
+PRICE_TABLE_CACHE_SIZE = 4
+
+DEFAULT_USD_RATES = {"USD": 1.0, "MMK": 2100.0, "THB": 36.5, "SGD": 1.35, "CNY": 7.25}
+# Prices are rounded to the nearest step of the local currency
+PRICE_STEPS = {"USD": 0.01, "MMK": 50, "THB": 1, "SGD": 0.01, "CNY": 0.01}
+
+
+class FXRates:
+    """USD conversion rates; version changes whenever any rate does."""
+
+    def __init__(self, rates: Dict[str, float]):
+        self.rates = {code.upper(): float(rate) for code, rate in rates.items()}
+        self.rates["USD"] = 1.0
+        unknown = set(self.rates) - set(PRICE_STEPS)
+        if unknown:
+            raise ValueError(f"No price step configured for {', '.join(sorted(unknown))}")
+        self.currencies = sorted(self.rates)
+        self.version = make_etag(render_json(sorted(self.rates.items())))[1:17]
+
+    @classmethod
+    def from_feed(cls, data: dict) -> "FXRates":
+        rates = dict(DEFAULT_USD_RATES)
+        for key, value in data.items():
+            if key.startswith("USD_to_"):
+                rates[key[len("USD_to_"):]] = value
+        return cls(rates)
+
+    @classmethod
+    def from_file(cls, path: str) -> "FXRates":
+        with open(path, "r") as f:
+            data = json.load(f)
+        return cls.from_feed(data.get("currency_rates", data))
+
+
+class PriceTable:
+    """Localized prices for every plan and currency, with pre-rendered bodies."""
+
+    def __init__(self, catalog, rates: FXRates):
+        import numpy as np  # only needed when rates change
+
+        self.version = rates.version
+        self.currencies = rates.currencies
+        usd = np.array([plan.price_usd for plan in catalog.plans], dtype=np.float64)
+        fx = np.array([rates.rates[c] for c in self.currencies], dtype=np.float64)
+        steps = np.array([PRICE_STEPS[c] for c in self.currencies], dtype=np.float64)
+        # (plans x currencies) in one pass: convert, then round to each currency's step
+        prices = np.round(np.outer(usd, fx) / steps) * steps
+        decimals = [max(0, -int(np.floor(np.log10(step)))) for step in steps]
+
+        self._lists: Dict[str, Tuple[bytes, str]] = {}
+        self._items: Dict[Tuple[str, str], Tuple[bytes, str]] = {}
+        base = [plan.model_dump(mode="json") for plan in catalog.plans]
+        for column, currency in enumerate(self.currencies):
+            localized = []
+            for row, plan in enumerate(base):
+                amount = round(float(prices[row, column]), decimals[column])
+                item = dict(plan, currency=currency,
+                            price=int(amount) if decimals[column] == 0 else amount,
+                            fx_version=self.version)
+                body = render_json(item)
+                self._items[(plan["id"], currency)] = (body, make_etag(body))
+                localized.append(item)
+            body = render_json(localized)
+            self._lists[currency] = (body, make_etag(body))
+
+    def list_entry(self, currency: str) -> Optional[Tuple[bytes, str]]:
+        return self._lists.get(currency)
+
+    def item_entry(self, plan_id: str, currency: str) -> Optional[Tuple[bytes, str]]:
+        return self._items.get((plan_id, currency))
+
+
+class PricingEngine:
+    """Serves localized catalog prices; tables are built when rates change, never per request."""
+
+    def __init__(self, catalog, rates: Optional[FXRates] = None, rates_path: Optional[str] = FX_RATES_PATH):
+        self.catalog = catalog
+        self.rates_path = rates_path
+        self._tables: "OrderedDict[str, PriceTable]" = OrderedDict()
+        self._rates_mtime: Optional[float] = None
+        self._task: Optional[asyncio.Task] = None
+        self.computations = 0
+        self.table: Optional[PriceTable] = None
+        self._rates = rates
+        self._initial_build: Optional[asyncio.Future] = None
+
+    def update_rates(self, rates: FXRates):
+        table = self._tables.get(rates.version)
+        if table is None:
+            table = PriceTable(self.catalog, rates)
+            self.computations += 1
+            self._tables[rates.version] = table
+            if len(self._tables) > PRICE_TABLE_CACHE_SIZE:
+                self._tables.popitem(last=False)
+        else:
+            self._tables.move_to_end(rates.version)
+        self.table = table
+
+    def reload(self):
+        """Re-read FX_RATES_PATH if it changed since the last load."""
+        mtime = os.stat(self.rates_path).st_mtime
+        if mtime != self._rates_mtime:
+            self.update_rates(FXRates.from_file(self.rates_path))
+            self._rates_mtime = mtime
+
+    def _current(self) -> PriceTable:
+        if self.table is None:
+            if self.rates_path:
+                self.reload()
+            else:
+                self.update_rates(self._rates or FXRates(DEFAULT_USD_RATES))
+        return self.table
+
+    async def _built(self):
+        """Wait for the background build; one that failed is retried on a thread."""
+        if self.table is not None or self._initial_build is None:
+            return
+        build = self._initial_build
+        if build.done() and (build.cancelled() or build.exception() is not None):
+            self._initial_build = asyncio.get_running_loop().run_in_executor(None, self._current)
+        await asyncio.shield(self._initial_build)
+
+    async def _entry(self, currency: str, lookup) -> Optional[Tuple[bytes, str]]:
+        await self._built()
+        table = self._current()
+        currency = currency.upper()
+        if currency not in table.currencies:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Unsupported currency; choose one of {', '.join(table.currencies)}",
+            )
+        return lookup(table, currency)
+
+    async def list_response(self, request: Request, currency: str) -> Response:
+        return cached_response(request, *await self._entry(currency, lambda t, c: t.list_entry(c)))
+
+    async def item_response(self, request: Request, plan_id: str, currency: str) -> Optional[Response]:
+        entry = await self._entry(currency, lambda t, c: t.item_entry(plan_id, c))
+        if entry is None:
+            return None
+        return cached_response(request, *entry)
+
+    async def item_lookup(self, currency: str):
+        """plan_id -> localized (body, etag), for stitching filtered pages."""
+        return await self._entry(currency, lambda t, c: lambda plan_id: t.item_entry(plan_id, c))
+
+    async def wait_ready(self):
+        await self._built()
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(FX_REFRESH_INTERVAL)
+            try:
+                # Rebuilding the table and its localized bodies is CPU work; keep it off the loop
+                await asyncio.to_thread(self.reload)
+            except Exception:
+                table = self.table
+                logger.exception("FX rate reload failed; keeping %s",
+                                 f"version {table.version}" if table is not None else "no price table")
+
+    async def start(self):
+        # The first table (and the numpy import) is built on a thread while the
+        # worker starts serving; localized requests arriving before it wait for it
+        if self._initial_build is None:
+            self._initial_build = asyncio.get_running_loop().run_in_executor(None, self._current)
+        if self.rates_path and self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
@@ -0,0 +1,319 @@
+"""Bulk user provisioning from CSV or JSONL, over the API or from the command line.
+
+    python provisioning.py employees.csv --dry-run
+    python provisioning.py employees.jsonl --report results.jsonl
+
+Rows carry email, password, full_name and phone. They are validated as the
+input streams in, then provisioned in batches: one existence check, passwords
+hashed across a process pool, one insert. Results are reported per input line.
+"""
+
+from fastapi import APIRouter, Header, HTTPException, Request, Response
+from pydantic import ValidationError
+from typing import Iterator, List, Optional, Tuple, Union
+import argparse
+import asyncio
+import codecs
+import csv
+import hmac
+import json
+import os
+import sys
+import time
+from auth import MIN_PASSWORD_LENGTH, UserRegister, new_user
+from hashing import PasswordHasher
+from metrics import registry
+from responses import fast_json
+from storage import storage
+
+# Bulk import is off unless this is set; requests send it as X-Provision-Token
+PROVISION_TOKEN = os.getenv("PROVISION_TOKEN")
+# Rows hashed and inserted together
+PROVISION_BATCH_SIZE = int(os.getenv("PROVISION_BATCH_SIZE", "200"))
+PROVISION_MAX_ROWS = int(os.getenv("PROVISION_MAX_ROWS", "50000"))
+# Imports one worker runs at a time; more are turned away with a 503
+PROVISION_MAX_CONCURRENT = int(os.getenv("PROVISION_MAX_CONCURRENT", "2"))
+# A process pool of its own, at lowered CPU priority: imports never queue ahead of
+# interactive logins on the password_hasher pool, and yield the CPU to them
+PROVISION_HASH_WORKERS = int(os.getenv("PROVISION_HASH_WORKERS", str(os.cpu_count() or 1)))
+PROVISION_HASH_NICE = int(os.getenv("PROVISION_HASH_NICE", "10"))
+
+REQUIRED_COLUMNS = ("email", "password", "full_name", "phone")
+CONTENT_TYPES = {
+    "text/csv": "csv",
+    "application/x-ndjson": "jsonl",
+    "application/jsonl": "jsonl",
+    "application/json-lines": "jsonl",
+}
+READ_CHUNK_SIZE = 64 * 1024
+# A CSV record (a quoted field may span lines) longer than this is reported and skipped
+MAX_RECORD_CHARS = 64 * 1024
+
+router = APIRouter(prefix="/auth", tags=["authentication"])
+
+bulk_hasher = PasswordHasher("process", PROVISION_HASH_WORKERS,
+                             max_pending=PROVISION_HASH_WORKERS * PROVISION_MAX_CONCURRENT,
+                             nice=PROVISION_HASH_NICE)
+
+provisioned = registry.counter("users_provisioned_total", "Bulk import rows by outcome", ("result",))
+
+
+class InvalidImport(ValueError):
+    """The input as a whole can't be read, e.g. a CSV header without required columns."""
+
+
+class RowReader:
+    """Splits a CSV or JSONL byte stream into (line, row) as it arrives.
+
+    row is a dict of fields, or an error message for a line that can't be parsed.
+    """
+
+    def __init__(self, fmt: str):
+        if fmt not in ("csv", "jsonl"):
+            raise InvalidImport(f"Unsupported format: {fmt}")
+        self.fmt = fmt
+        self._decoder = codecs.getincrementaldecoder("utf-8-sig")(errors="replace")
+        self._buffer = ""
+        self.line = 0
+        # CSV: a record whose quoted field runs past the end of its line
+        self._record = ""
+        self._record_line = 0
+        self._header: Optional[List[str]] = None
+
+    def feed(self, data: bytes, final: bool = False) -> Iterator[Tuple[int, Union[dict, str]]]:
+        *lines, self._buffer = (self._buffer + self._decoder.decode(data, final)).split("\n")
+        if final:
+            lines.append(self._buffer)
+            self._buffer = ""
+        for line in lines:
+            self.line += 1
+            yield from self._csv(line) if self.fmt == "csv" else self._jsonl(line)
+        if final and self._record:
+            self._record = ""
+            yield self._record_line, "Unterminated quoted field"
+
+    def _jsonl(self, line: str):
+        if not line.strip():
+            return
+        try:
+            row = json.loads(line)
+        except ValueError as e:
+            yield self.line, f"Invalid JSON: {e}"
+            return
+        yield self.line, row if isinstance(row, dict) else "Expected a JSON object"
+
+    def _csv(self, line: str):
+        continued = bool(self._record)
+        if not continued:
+            self._record_line = self.line
+        self._record += line + "\n"
+        # A line without a quote can't close the quoted field a record was left open in
+        if continued and '"' not in line and len(self._record) <= MAX_RECORD_CHARS:
+            return
+        try:
+            # strict: a quoted field still open at the end of the record is an error
+            # rather than a field; a bare quote inside an unquoted field is just text
+            values = next(csv.reader([self._record], strict=True), [])
+        except csv.Error as e:
+            if str(e) != "unexpected end of data":
+                self._record = ""
+                if self._header is None:
+                    raise InvalidImport(f"CSV header can't be parsed: {e}")
+                yield self._record_line, f"Invalid CSV: {e}"
+            elif len(self._record) > MAX_RECORD_CHARS:
+                self._record = ""
+                yield self._record_line, f"Record runs past {MAX_RECORD_CHARS} characters (unterminated quoted field?)"
+            return
+        self._record = ""
+        if not any(value.strip() for value in values):
+            return
+        if self._header is None:
+            self._header = [value.strip().lower() for value in values]
+            missing = [c for c in REQUIRED_COLUMNS if c not in self._header]
+            if missing:
+                raise InvalidImport(f"CSV header is missing column(s): {', '.join(missing)}")
+            return
+        if len(values) != len(self._header):
+            yield self._record_line, f"Expected {len(self._header)} columns, found {len(values)}"
+            return
+        yield self._record_line, dict(zip(self._header, values))
+
+
+class UserImport:
+    """Validates rows as they arrive and provisions them in batches."""
+
+    def __init__(self, fmt: str, store=storage, hasher: PasswordHasher = bulk_hasher,
+                 batch_size: int = PROVISION_BATCH_SIZE, max_rows: int = PROVISION_MAX_ROWS,
+                 dry_run: bool = False):
+        self.reader = RowReader(fmt)
+        self.store = store
+        self.hasher = hasher
+        self.batch_size = batch_size
+        self.max_rows = max_rows
+        self.dry_run = dry_run
+        self.rows = 0
+        self.counts = dict.fromkeys(("created", "valid", "exists", "duplicate", "invalid"), 0)
+        self.results: List[dict] = []
+        self._batch: List[Tuple[int, UserRegister]] = []
+        self._seen = set()
+
+    def _result(self, line: int, status: str, **fields):
+        self.results.append({"line": line, "status": status, **fields})
+        self.counts[status] += 1
+        provisioned.labels(status).inc()
+
+    def _validate(self, line: int, row: Union[dict, str]):
+        if isinstance(row, str):
+            self._result(line, "invalid", error=row)
+            return
+        self.rows += 1
+        email = row.get("email")
+        if self.rows > self.max_rows:
+            self._result(line, "invalid", email=email, error=f"Import is limited to {self.max_rows} rows")
+            return
+        try:
+            user = UserRegister.model_validate(row)
+        except ValidationError as e:
+            error = "; ".join(f"{'.'.join(map(str, err['loc']))}: {err['msg']}" for err in e.errors())
+            self._result(line, "invalid", email=email, error=error)
+            return
+        if len(user.password) < MIN_PASSWORD_LENGTH:
+            self._result(line, "invalid", email=user.email,
+                         error=f"Password must be at least {MIN_PASSWORD_LENGTH} characters")
+        elif user.email in self._seen:
+            self._result(line, "duplicate", email=user.email, error="Email repeated earlier in this import")
+        else:
+            self._seen.add(user.email)
+            self._batch.append((line, user))
+
+    async def _provision(self, batch: List[Tuple[int, UserRegister]]):
+        # Accounts that already exist are reported before any bcrypt work is spent on them
+        existing = await self.store.users.emails_in_use([user.email for _, user in batch])
+        fresh = []
+        for line, user in batch:
+            if user.email in existing:
+                self._result(line, "exists", email=user.email)
+            else:
+                fresh.append((line, user))
+        if self.dry_run:
+            for line, user in fresh:
+                self._result(line, "valid", email=user.email)
+            return
+        hashes = await self.hasher.hash_many([user.password for _, user in fresh])
+        records = [new_user(user, hashed) for (_, user), hashed in zip(fresh, hashes)]
+        # Registered through /register since the existence check
+        failed = set(await self.store.users.create_many(records))
+        for index, ((line, user), record) in enumerate(zip(fresh, records)):
+            if index in failed:
+                self._result(line, "exists", email=user.email)
+            else:
+                self._result(line, "created", email=user.email, user_id=record["id"])
+
+    async def _drain(self, final: bool = False):
+        while len(self._batch) >= self.batch_size or (final and self._batch):
+            batch, self._batch = self._batch[:self.batch_size], self._batch[self.batch_size:]
+            await self._provision(batch)
+
+    async def feed(self, data: bytes):
+        for line, row in self.reader.feed(data):
+            self._validate(line, row)
+        await self._drain()
+
+    async def finish(self) -> dict:
+        for line, row in self.reader.feed(b"", final=True):
+            self._validate(line, row)
+        await self._drain(final=True)
+        self.results.sort(key=lambda result: result["line"])
+        return {**self.counts, "dry_run": self.dry_run, "results": self.results}
+
+
+active_imports = 0
+
+
+@router.post("/users/import")
+async def import_users(request: Request, dry_run: bool = False,
+                       x_provision_token: Optional[str] = Header(None)):
+    """Create users from a CSV (text/csv, header row) or JSONL (application/x-ndjson) body."""
+    global active_imports
+    if not PROVISION_TOKEN:
+        raise HTTPException(status_code=403, detail="Bulk provisioning is disabled")
+    if x_provision_token is None or not hmac.compare_digest(x_provision_token, PROVISION_TOKEN):
+        raise HTTPException(status_code=401, detail="Invalid provisioning token")
+    fmt = CONTENT_TYPES.get(request.headers.get("content-type", "").split(";")[0].strip().lower())
+    if fmt is None:
+        raise HTTPException(status_code=415, detail="Send text/csv or application/x-ndjson")
+    if active_imports >= PROVISION_MAX_CONCURRENT:
+        raise HTTPException(status_code=503, detail="Too many imports running, please retry",
+                            headers={"Retry-After": "30"})
+
+    active_imports += 1
+    try:
+        job = UserImport(fmt, dry_run=dry_run)
+        # Rows are validated as the body arrives instead of buffering it whole
+        async for chunk in request.stream():
+            await job.feed(chunk)
+        report = await job.finish()
+    except InvalidImport as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    finally:
+        active_imports -= 1
+    return Response(fast_json(report), media_type="application/json")
+
+
+async def _run_cli(args) -> dict:
+    job = UserImport(args.format, batch_size=args.batch_size, dry_run=args.dry_run)
+    await storage.start()
+    try:
+        source = sys.stdin.buffer if args.path == "-" else open(args.path, "rb")
+        with source:
+            while True:
+                data = source.read(READ_CHUNK_SIZE)
+                if not data:
+                    break
+                await job.feed(data)
+        return await job.finish()
+    finally:
+        bulk_hasher.shutdown()
+        await storage.close()
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Bulk user provisioning from CSV or JSONL")
+    parser.add_argument("path", help="Input file, or - for stdin")
+    parser.add_argument("--format", choices=("csv", "jsonl"), help="Default: from the file extension")
+    parser.add_argument("--dry-run", action="store_true",
+                        help="Validate rows and check for existing accounts; create nothing")
+    parser.add_argument("--report", help="Write per-line results as JSONL here (default: stdout)")
+    parser.add_argument("--batch-size", type=int, default=PROVISION_BATCH_SIZE)
+    args = parser.parse_args()
+
+    if args.format is None:
+        extension = os.path.splitext(args.path)[1].lower()
+        args.format = {".csv": "csv", ".jsonl": "jsonl", ".ndjson": "jsonl"}.get(extension)
+        if args.format is None:
+            parser.error("can't tell the format from the file name; pass --format")
+    if storage.process_local and not args.dry_run:
+        print("MONGO_URL is not set: users would only go to this process's in-memory store", file=sys.stderr)
+        return 2
+
+    start = time.perf_counter()
+    try:
+        report = asyncio.run(_run_cli(args))
+    except InvalidImport as e:
+        print(f"error: {e}", file=sys.stderr)
+        return 2
+
+    lines = (json.dumps(result) + "\n" for result in report["results"])
+    if args.report:
+        with open(args.report, "w") as f:
+            f.writelines(lines)
+    else:
+        sys.stdout.writelines(lines)
+    summary = ", ".join(f"{report[status]} {status}" for status in
+                        ("valid" if args.dry_run else "created", "exists", "duplicate", "invalid"))
+    print(f"{summary} in {time.perf_counter() - start:.1f}s", file=sys.stderr)
+    return 1 if report["invalid"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
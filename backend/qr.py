@@ -0,0 +1,165 @@
+from collections import OrderedDict
+from concurrent.futures import Executor, ProcessPoolExecutor
+from fastapi import APIRouter, HTTPException, Query, Request
+from typing import Dict, Optional, Tuple
+import asyncio
+import hashlib
+import io
+import os
+import tempfile
+from catalog import cached_response
+from storage import storage
+
+router = APIRouter(prefix="/qr", tags=["qr"])
+
+SMDP_ADDRESS = os.getenv("SMDP_ADDRESS", "smdp.esim.com.mm")
+QR_RENDER_WORKERS = int(os.getenv("QR_RENDER_WORKERS", str(min(2, os.cpu_count() or 1))))
+# Rendered images held in memory, in bytes
+QR_MEMORY_CACHE_BYTES = int(os.getenv("QR_MEMORY_CACHE_BYTES", str(32 * 1024 * 1024)))
+QR_CACHE_DIR = os.getenv("QR_CACHE_DIR", os.path.join(tempfile.gettempdir(), "esim-qr-cache"))
+QR_SCALE = 8
+# A code's QR image never changes, so clients and nginx may keep it for good
+QR_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+MEDIA_TYPES = {"png": "image/png", "svg": "image/svg+xml"}
+
+
+# Module-level so it can be pickled into the render process pool
+def render_qr(payload: str, kind: str, scale: int) -> bytes:
+    import segno
+    buffer = io.BytesIO()
+    segno.make(payload, error="m").save(buffer, kind=kind, scale=scale, border=4)
+    return buffer.getvalue()
+
+
+def lpa_payload(activation_code: str) -> str:
+    # GSMA SGP.22 activation code format read by eSIM-capable devices
+    return f"LPA:1${SMDP_ADDRESS}${activation_code}"
+
+
+class ByteLRU:
+    """LRU bounded by the total size of its values rather than entry count."""
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._entries: "OrderedDict[str, bytes]" = OrderedDict()
+
+    def get(self, key: str) -> Optional[bytes]:
+        value = self._entries.get(key)
+        if value is not None:
+            self._entries.move_to_end(key)
+        return value
+
+    def put(self, key: str, value: bytes):
+        if len(value) > self.max_bytes:
+            return
+        old = self._entries.pop(key, None)
+        if old is not None:
+            self.size -= len(old)
+        self._entries[key] = value
+        self.size += len(value)
+        while self.size > self.max_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self.size -= len(evicted)
+
+
+class QRService:
+    """Renders activation QR codes off the event loop, cached in memory and on disk."""
+
+    def __init__(self, store=storage, cache_dir: str = QR_CACHE_DIR,
+                 workers: int = QR_RENDER_WORKERS, memory_bytes: int = QR_MEMORY_CACHE_BYTES):
+        self.store = store
+        self.cache_dir = cache_dir
+        self.workers = workers
+        self.memory = ByteLRU(memory_bytes)
+        # (activation_id, kind) -> content hash, so repeat hits skip the storage read
+        self._digests: "OrderedDict[Tuple[str, str], str]" = OrderedDict()
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self._executor: Optional[Executor] = None
+        self.renders = 0
+        self.disk_hits = 0
+
+    @property
+    def executor(self) -> Executor:
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self.workers)
+        return self._executor
+
+    def _path(self, digest: str, kind: str) -> str:
+        return os.path.join(self.cache_dir, digest[:2], f"{digest}.{kind}")
+
+    def _read_disk(self, path: str) -> Optional[bytes]:
+        try:
+            with open(path, "rb") as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def _write_disk(self, path: str, body: bytes):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path))
+        with os.fdopen(fd, "wb") as f:
+            f.write(body)
+        os.replace(tmp_path, path)
+
+    async def _load(self, digest: str, payload: str, kind: str) -> bytes:
+        loop = asyncio.get_running_loop()
+        path = self._path(digest, kind)
+        body = await loop.run_in_executor(None, self._read_disk, path)
+        if body is not None:
+            self.disk_hits += 1
+            return body
+        body = await loop.run_in_executor(self.executor, render_qr, payload, kind, QR_SCALE)
+        self.renders += 1
+        await loop.run_in_executor(None, self._write_disk, path, body)
+        return body
+
+    async def image(self, activation_id: str, kind: str) -> Optional[Tuple[str, bytes]]:
+        digest = self._digests.get((activation_id, kind))
+        if digest is not None:
+            body = self.memory.get(digest)
+            if body is not None:
+                return digest, body
+
+        record = await self.store.activations.get(activation_id, ("activation_code",))
+        if record is None or not record.get("activation_code"):
+            return None
+        payload = lpa_payload(record["activation_code"])
+        digest = hashlib.sha256(f"{kind}:{QR_SCALE}:{payload}".encode()).hexdigest()
+        self._digests[(activation_id, kind)] = digest
+        self._digests.move_to_end((activation_id, kind))
+        while len(self._digests) > 100000:
+            self._digests.popitem(last=False)
+
+        body = self.memory.get(digest)
+        if body is not None:
+            return digest, body
+
+        # Single flight: concurrent requests for one image share one render
+        future = self._inflight.get(digest)
+        if future is None:
+            future = asyncio.ensure_future(self._load(digest, payload, kind))
+            self._inflight[digest] = future
+            future.add_done_callback(lambda _: self._inflight.pop(digest, None))
+        body = await asyncio.shield(future)
+        self.memory.put(digest, body)
+        return digest, body
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+qr_service = QRService()
+
+
+@router.get("/{activation_id}")
+async def get_activation_qr(activation_id: str, request: Request,
+                            format: str = Query("png", pattern="^(png|svg)$")):
+    result = await qr_service.image(activation_id, format)
+    if result is None:
+        raise HTTPException(status_code=404, detail="Activation not found")
+    digest, body = result
+    return cached_response(request, body, f'"{digest[:32]}"', QR_CACHE_CONTROL, MEDIA_TYPES[format])
@@ -0,0 +1,252 @@
+from collections import OrderedDict
+from fastapi import HTTPException
+from datetime import datetime, timedelta
+from typing import List, NamedTuple, Optional, Tuple
+import hashlib
+import ipaddress
+import json
+import math
+import os
+import time
+from metrics import registry
+from storage import storage
+
+RATE_LIMIT_ENABLED = os.getenv("RATE_LIMIT_ENABLED", "true").lower() != "false"
+# "memory" (per process) or "mongo" (shared by all workers); defaults to match storage
+RATE_LIMIT_BACKEND = os.getenv("RATE_LIMIT_BACKEND", storage.backend)
+# Peers allowed to set X-Forwarded-For; anything else is taken as the client itself
+TRUSTED_PROXIES = [
+    ipaddress.ip_network(net.strip())
+    for net in os.getenv("TRUSTED_PROXIES", "127.0.0.1/32,::1/128").split(",") if net.strip()
+]
+MEMORY_MAX_BUCKETS = 100000
+
+
+def api_key_digest(api_key: bytes) -> str:
+    # Buckets are keyed by digest, so raw keys never reach the bucket store
+    return hashlib.sha256(api_key).hexdigest()[:32]
+
+
+# Comma-separated API keys issued to resellers; a request presenting one of these is
+# limited per key, anything else (no key, unknown key) is limited per IP
+RATE_LIMIT_API_KEYS = {
+    api_key_digest(key.strip().encode("latin-1"))
+    for key in os.getenv("RATE_LIMIT_API_KEYS", "").split(",") if key.strip()
+}
+
+rejections = registry.counter(
+    "rate_limit_rejections_total", "Requests refused by the in-app rate limiter", ("scope",))
+
+
+class Limit(NamedTuple):
+    scope: str      # "ip", "api_key" or "email"
+    rate: float     # tokens refilled per second
+    burst: int      # bucket capacity
+
+
+# (method, path prefix) -> limits; first match wins. Requests carrying a known
+# X-API-Key are limited per key instead of per IP (resellers behind NAT).
+ROUTE_POLICIES: List[Tuple[str, str, List[Limit]]] = [
+    ("POST", "/api/auth/login", [Limit("ip", 5, 10), Limit("api_key", 20, 50)]),
+    ("POST", "/api/auth/register", [Limit("ip", 1, 5), Limit("api_key", 5, 20)]),
+    ("POST", "/api/esim/activate", [Limit("ip", 5, 20), Limit("api_key", 50, 200)]),
+    ("*", "/api/", [Limit("ip", 20, 40), Limit("api_key", 200, 400)]),
+]
+# Checked inside login_user after parsing the body, before any bcrypt work
+LOGIN_EMAIL_LIMIT = Limit("email", 5 / 60, 5)
+
+if os.getenv("RATE_LIMIT_POLICIES"):
+    # e.g. [["POST", "/api/auth/login", [["ip", 5, 10]]], ...]
+    ROUTE_POLICIES = [
+        (method, prefix, [Limit(*limit) for limit in limits])
+        for method, prefix, limits in json.loads(os.environ["RATE_LIMIT_POLICIES"])
+    ]
+
+
+class InMemoryBucketStore:
+    process_local = True
+
+    def __init__(self, max_buckets: int = MEMORY_MAX_BUCKETS):
+        self.max_buckets = max_buckets
+        self._buckets: "OrderedDict[str, List[float]]" = OrderedDict()
+
+    async def take(self, key: str, limit: Limit, cost: float = 1.0) -> Tuple[bool, float]:
+        now = time.monotonic()
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = [float(limit.burst), now]
+            if len(self._buckets) > self.max_buckets:
+                self._buckets.popitem(last=False)
+        else:
+            self._buckets.move_to_end(key)
+        tokens = min(limit.burst, bucket[0] + (now - bucket[1]) * limit.rate)
+        bucket[1] = now
+        if tokens >= cost:
+            bucket[0] = tokens - cost
+            return True, 0.0
+        bucket[0] = tokens
+        return False, (cost - tokens) / limit.rate
+
+
+class MongoBucketStore:
+    """Token buckets shared across workers, refilled and drained in one atomic update."""
+
+    process_local = False
+
+    def __init__(self, db):
+        self.collection = db["rate_limits"]
+
+    async def ensure_indexes(self):
+        await self.collection.create_index("expires_at", expireAfterSeconds=0)
+
+    async def take(self, key: str, limit: Limit, cost: float = 1.0) -> Tuple[bool, float]:
+        from pymongo import ReturnDocument
+        now = time.time()
+        # Buckets idle long enough to be full again carry no state worth keeping
+        expires_at = datetime.utcnow() + timedelta(seconds=limit.burst / limit.rate + 60)
+        refilled = {"$min": [limit.burst, {"$add": [
+            {"$ifNull": ["$tokens", limit.burst]},
+            {"$multiply": [{"$subtract": [now, {"$ifNull": ["$updated", now]}]}, limit.rate]},
+        ]}]}
+        doc = await self.collection.find_one_and_update(
+            {"_id": key},
+            [
+                {"$set": {"tokens": refilled, "updated": now, "expires_at": expires_at}},
+                {"$set": {"allowed": {"$gte": ["$tokens", cost]}}},
+                {"$set": {"tokens": {"$cond": ["$allowed", {"$subtract": ["$tokens", cost]}, "$tokens"]}}},
+            ],
+            upsert=True,
+            return_document=ReturnDocument.AFTER,
+        )
+        if doc["allowed"]:
+            return True, 0.0
+        return False, (cost - doc["tokens"]) / limit.rate
+
+
+def client_ip(client: Optional[Tuple[str, int]], forwarded_for: Optional[str]) -> str:
+    peer = client[0] if client else "unknown"
+    if not forwarded_for or not _is_trusted(peer):
+        return peer
+    # Walk X-Forwarded-For from the right, skipping our own proxies
+    for address in reversed([a.strip() for a in forwarded_for.split(",") if a.strip()]):
+        if not _is_trusted(address):
+            return address
+    return peer
+
+
+def _is_trusted(address: str) -> bool:
+    try:
+        ip = ipaddress.ip_address(address)
+    except ValueError:
+        return False
+    return any(ip in network for network in TRUSTED_PROXIES)
+
+
+class RateLimiter:
+    def __init__(self, backend: str = RATE_LIMIT_BACKEND, enabled: bool = RATE_LIMIT_ENABLED,
+                 api_keys: Optional[set] = None):
+        self.enabled = enabled
+        # Digests of the keys allowed their own buckets
+        self.api_keys = RATE_LIMIT_API_KEYS if api_keys is None else api_keys
+        if backend == "mongo":
+            if storage.client is None:
+                raise ValueError("RATE_LIMIT_BACKEND=mongo requires MONGO_URL")
+            self.store = MongoBucketStore(storage.client[storage.db_name])
+        else:
+            self.store = InMemoryBucketStore()
+
+    @property
+    def process_local(self) -> bool:
+        return self.enabled and self.store.process_local
+
+    async def start(self):
+        if hasattr(self.store, "ensure_indexes"):
+            await self.store.ensure_indexes()
+
+    async def check(self, limit: Limit, identity: str, route: str = "") -> Optional[float]:
+        """Take one token; returns seconds to wait if the bucket is empty, else None."""
+        allowed, retry_after = await self.store.take(f"{limit.scope}:{route}:{identity}", limit)
+        if allowed:
+            return None
+        rejections.labels(limit.scope).inc()
+        return retry_after
+
+    async def check_email(self, email: str):
+        if not self.enabled:
+            return
+        retry_after = await self.check(LOGIN_EMAIL_LIMIT, email.lower(), "login")
+        if retry_after is not None:
+            raise HTTPException(
+                status_code=429,
+                detail="Too many login attempts, please retry later",
+                headers={"Retry-After": str(math.ceil(retry_after))},
+            )
+
+    def api_key_identity(self, api_key: Optional[bytes]) -> Optional[str]:
+        """Bucket identity for a known API key; None for no key or an unknown one."""
+        if api_key is None:
+            return None
+        digest = api_key_digest(api_key)
+        return digest if digest in self.api_keys else None
+
+    @staticmethod
+    def policy_for(method: str, path: str) -> Tuple[str, List[Limit]]:
+        for policy_method, prefix, limits in ROUTE_POLICIES:
+            if (policy_method == "*" or policy_method == method) and path.startswith(prefix):
+                return prefix, limits
+        return "", []
+
+
+rate_limiter = RateLimiter()
+
+
+class RateLimitMiddleware:
+    """Rejects over-limit requests with 429 before routing or body parsing."""
+
+    def __init__(self, app, limiter: RateLimiter = rate_limiter):
+        self.app = app
+        self.limiter = limiter
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not self.limiter.enabled:
+            await self.app(scope, receive, send)
+            return
+
+        route, limits = self.limiter.policy_for(scope["method"], scope["path"])
+        if limits:
+            headers = dict(scope["headers"])
+            # Unknown keys count as anonymous: inventing a key must not escape the IP limits
+            api_key = self.limiter.api_key_identity(headers.get(b"x-api-key"))
+            for limit in limits:
+                if limit.scope == "api_key":
+                    if api_key is None:
+                        continue
+                    identity = api_key
+                elif limit.scope == "ip":
+                    if api_key is not None:
+                        continue
+                    forwarded_for = headers.get(b"x-forwarded-for")
+                    identity = client_ip(scope.get("client"),
+                                         forwarded_for.decode("latin-1") if forwarded_for else None)
+                else:
+                    continue
+                retry_after = await self.limiter.check(limit, identity, route)
+                if retry_after is not None:
+                    await self._reject(send, retry_after)
+                    return
+
+        await self.app(scope, receive, send)
+
+    @staticmethod
+    async def _reject(send, retry_after: float):
+        body = b'{"detail":"Too many requests"}'
+        await send({
+            "type": "http.response.start",
+            "status": 429,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode()),
+                (b"retry-after", str(math.ceil(retry_after)).encode()),
+            ],
+        })
+        await send({"type": "http.response.body", "body": body})
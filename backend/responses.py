@@ -0,0 +1,55 @@
+from fastapi import Response
+from pydantic import BaseModel
+from typing import Any
+import functools
+import os
+import pydantic_core
+
+try:
+    import orjson
+except ImportError:  # optional; pydantic-core's encoder is used instead
+    orjson = None
+
+# Return typed route results without FastAPI's response_model re-validation
+FAST_RESPONSES = os.getenv("FAST_RESPONSES", "true").lower() != "false"
+
+
+def _orjson_default(value):
+    if isinstance(value, BaseModel):
+        return value.model_dump(mode="json")
+    raise TypeError(f"Type is not JSON serializable: {type(value).__name__}")
+
+
+def fast_json(content: Any) -> bytes:
+    """Encode JSON natively; datetimes and UUIDs come out as FastAPI renders them."""
+    if isinstance(content, BaseModel):
+        return content.__pydantic_serializer__.to_json(content)
+    if orjson is not None:
+        return orjson.dumps(content, default=_orjson_default)
+    return pydantic_core.to_json(content)
+
+
+class FastJSONResponse(Response):
+    media_type = "application/json"
+
+    def render(self, content: Any) -> bytes:
+        return fast_json(content)
+
+
+def trusted_response(endpoint):
+    """Serialize an endpoint's result directly, skipping response_model validation.
+
+    Only for routes whose result is already the response model (or a dict built
+    field-for-field from it); response_model still documents the schema.
+    """
+    if not FAST_RESPONSES:
+        return endpoint
+
+    @functools.wraps(endpoint)
+    async def wrapper(*args, **kwargs):
+        result = await endpoint(*args, **kwargs)
+        if isinstance(result, Response):
+            return result
+        return FastJSONResponse(result)
+
+    return wrapper
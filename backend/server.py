@@ -1,18 +1,30 @@
-from fastapi import FastAPI, APIRouter, HTTPException
+from fastapi import FastAPI, APIRouter, Depends, Header, HTTPException, Request
+from fastapi.responses import StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel, Field
-from typing import List, Optional
+from typing import List, Literal, Optional
+import os
 import uuid
-from datetime import datetime
+from datetime import datetime, timedelta
 import logging
-from auth import router as auth_router
+import math
+import asyncio
+import importlib
+from activation import ActivationService
+from catalog import LISTING_PARAMETERS, load_catalog, plan_query
+from coalesce import activation_reads
+from health import readiness, router as health_router
+from logs import AccessLogMiddleware, configure_logging, flush_logs
+from metrics import MetricsMiddleware, loop_lag_monitor, router as metrics_router
+from plan_index import PlanQuery
+from pricing import PricingEngine
+from ratelimit import RateLimitMiddleware, rate_limiter
+from responses import fast_json, trusted_response
+from storage import ACTIVATION_STATUS_FIELDS, storage
+from usage import aggregator, router as usage_router, usage_stream
 
-# Create the main app
-app = FastAPI(
-    title="eSIM Myanmar API",
-    description="API for eSIM Myanmar Company Limited",
-    version="1.0.0"
-)
+# Feature routers left out of this worker entirely, e.g. DISABLED_ROUTERS=qr,topup
+DISABLED_ROUTERS = {r.strip() for r in os.getenv("DISABLED_ROUTERS", "").split(",") if r.strip()}
 
 # Create a router with the /api prefix
 api_router = APIRouter(prefix="/api")
@@ -94,8 +106,47 @@ class ESIMUsage(BaseModel):
     usage_percentage: float
     last_updated: datetime
 
+class ESIMBulkActivation(BaseModel):
+    orders: List[ESIMActivation]
+
+class ESIMBatchRequest(BaseModel):
+    activation_ids: List[str]
+    include: List[Literal["usage", "balance"]] = ["usage", "balance"]
+
+# Largest number of activation ids accepted by one batch lookup
+ESIM_BATCH_MAX_SIZE = int(os.getenv("ESIM_BATCH_MAX_SIZE", "1000"))
+# Result lines rendered per streamed chunk
+ESIM_BATCH_CHUNK_SIZE = 100
+
+# Plan catalog, validated and pre-rendered once at startup
+catalog = load_catalog(ESIM_PLANS, ESIMPlan)
+activation_service = ActivationService(catalog)
+pricing = PricingEngine(catalog)
+
+def balance_from_record(record: dict) -> ESIMBalance:
+    valid_until = record["created_at"] + timedelta(days=record["duration_days"])
+    days_remaining = max(0, math.ceil((valid_until - datetime.utcnow()).total_seconds() / 86400))
+    return ESIMBalance(
+        activation_id=record["activation_id"],
+        data_remaining_gb=round(max(0.0, record["data_total_gb"] - record["data_used_gb"]), 3),
+        days_remaining=days_remaining,
+        status=record["status"] if days_remaining > 0 else "expired"
+    )
+
+def usage_from_record(record: dict) -> ESIMUsage:
+    total = record["data_total_gb"]
+    used = record["data_used_gb"]
+    return ESIMUsage(
+        activation_id=record["activation_id"],
+        data_used_gb=round(used, 3),
+        data_total_gb=total,
+        usage_percentage=round(min(100.0, used / total * 100), 2) if total else 0.0,
+        last_updated=record.get("usage_updated_at") or record["created_at"]
+    )
+
 # API Routes
 @api_router.get("/health", response_model=HealthCheck)
+@trusted_response
 async def health_check():
     return HealthCheck(
         status="OK",
@@ -108,85 +159,114 @@ async def health_check():
 async def get_company_info():
     return COMPANY_INFO
 
-@api_router.get("/packages", response_model=List[ESIMPlan])
-async def get_esim_packages():
-    return [ESIMPlan(**plan) for plan in ESIM_PLANS]
+@api_router.get("/packages", response_model=List[ESIMPlan], openapi_extra={"parameters": LISTING_PARAMETERS})
+async def get_esim_packages(request: Request, currency: Optional[str] = None,
+                            query: Optional[PlanQuery] = Depends(plan_query)):
+    # With ?currency=, each plan also carries a localized price and the FX version used
+    if query is not None:
+        # Filtered/sorted/paged: X-Total-Count, and X-Next-Cursor + Link while more remain
+        page = catalog.search(query)
+        item_entry = await pricing.item_lookup(currency) if currency else catalog.item_entry
+        return catalog.page_response(request, page, item_entry)
+    if currency:
+        return await pricing.list_response(request, currency)
+    return catalog.list_response(request)
 
 @api_router.get("/packages/{plan_id}", response_model=ESIMPlan)
-async def get_esim_package(plan_id: str):
-    plan = next((p for p in ESIM_PLANS if p["id"] == plan_id), None)
-    if not plan:
+async def get_esim_package(plan_id: str, request: Request, currency: Optional[str] = None):
+    if currency:
+        response = await pricing.item_response(request, plan_id, currency)
+    else:
+        response = catalog.item_response(request, plan_id)
+    if response is None:
         raise HTTPException(status_code=404, detail="Plan not found")
-    return ESIMPlan(**plan)
+    return response
 
 @api_router.post("/esim/activate", response_model=ESIMActivationResponse)
-async def activate_esim(activation: ESIMActivation):
+@trusted_response
+async def activate_esim(activation: ESIMActivation, idempotency_key: Optional[str] = Header(None)):
     # Validate plan exists
-    plan = next((p for p in ESIM_PLANS if p["id"] == activation.plan_id), None)
-    if not plan:
+    if activation.plan_id not in catalog:
         raise HTTPException(status_code=400, detail="Invalid plan ID")
     
-    activation_id = str(uuid.uuid4())
-    return ESIMActivationResponse(
-        activation_id=activation_id,
-        qr_code_url=f"https://api.esim.com.mm/qr/{activation_id}",
-        activation_code=f"ESM{activation_id[:8].upper()}",
-        status="pending",
-        expires_at=datetime.utcnow().replace(hour=23, minute=59, second=59)
-    )
+    # Retries with the same Idempotency-Key get the original activation back
+    result = await activation_service.activate(activation.model_dump(), idempotency_key)
+    return ESIMActivationResponse(**result)
+
+@api_router.post("/esim/activate/bulk")
+async def activate_esim_bulk(bulk: ESIMBulkActivation, idempotency_key: Optional[str] = Header(None)):
+    orders = [order.model_dump() for order in bulk.orders]
+    return await activation_service.activate_many(orders, idempotency_key)
 
 @api_router.get("/esim/{activation_id}/balance", response_model=ESIMBalance)
+@trusted_response
 async def get_esim_balance(activation_id: str):
-    # Mock data - in production, fetch from database
-    return ESIMBalance(
-        activation_id=activation_id,
-        data_remaining_gb=3.2,
-        days_remaining=5,
-        status="active"
-    )
+    # Concurrent reads of one activation share a storage read and a ~1s micro-cache
+    record = await activation_reads.get(activation_id)
+    if record is None:
+        raise HTTPException(status_code=404, detail="Activation not found")
+    return balance_from_record(aggregator.apply_to(dict(record)))
 
 @api_router.get("/esim/{activation_id}/usage", response_model=ESIMUsage)
+@trusted_response
 async def get_esim_usage(activation_id: str):
-    # Mock data - in production, fetch from database
-    return ESIMUsage(
-        activation_id=activation_id,
-        data_used_gb=1.8,
-        data_total_gb=5,
-        usage_percentage=36.0,
-        last_updated=datetime.utcnow()
-    )
+    # Served from the in-memory aggregate; storage is only read on first access
+    counter = await aggregator.get(activation_id)
+    if counter is None:
+        raise HTTPException(status_code=404, detail="Activation not found")
+    return usage_from_record(counter.as_record())
 
-@api_router.post("/esim/{activation_id}/topup")
-async def topup_esim(activation_id: str, amount_usd: int):
-    return {
-        "activation_id": activation_id,
-        "topup_amount_usd": amount_usd,
-        "status": "success",
-        "transaction_id": str(uuid.uuid4())
-    }
+@api_router.get("/esim/{activation_id}/usage/stream")
+async def stream_esim_usage(activation_id: str):
+    # Pushes ESIMUsage as server-sent events instead of clients polling /usage
+    counter = await aggregator.get(activation_id)
+    if counter is None:
+        raise HTTPException(status_code=404, detail="Activation not found")
+    # Refused up front; the slot itself is taken once the stream starts
+    aggregator.check_stream_capacity()
+    return StreamingResponse(
+        usage_stream(activation_id, lambda record: fast_json(usage_from_record(record))),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
-# Include the routers in the main app
-app.include_router(api_router)
-app.include_router(auth_router, prefix="/api")
-
-# CORS middleware
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=["https://www.esim.com.mm", "http://localhost:3000"],
-    allow_credentials=True,
-    allow_methods=["GET", "POST", "PUT", "DELETE"],
-    allow_headers=["*"],
-)
-
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-)
-logger = logging.getLogger(__name__)
+@api_router.post("/esim/batch")
+async def get_esim_batch(batch: ESIMBatchRequest):
+    activation_ids = list(dict.fromkeys(batch.activation_ids))
+    if len(activation_ids) > ESIM_BATCH_MAX_SIZE:
+        raise HTTPException(
+            status_code=413,
+            detail=f"Batch exceeds {ESIM_BATCH_MAX_SIZE} activation ids"
+        )
+    
+    # Single bulk read for the whole batch
+    records = await storage.activations.get_many(activation_ids, ACTIVATION_STATUS_FIELDS)
+    for record in records.values():
+        aggregator.apply_to(record)
+    
+    def render_item(activation_id: str) -> dict:
+        record = records.get(activation_id)
+        if record is None:
+            return {"activation_id": activation_id, "error": "Activation not found"}
+        item = {"activation_id": activation_id}
+        if "usage" in batch.include:
+            item["usage"] = usage_from_record(record)
+        if "balance" in batch.include:
+            item["balance"] = balance_from_record(record)
+        return item
+    
+    # One JSON object per line, streamed in chunks as they are rendered
+    def render_lines():
+        for start in range(0, len(activation_ids), ESIM_BATCH_CHUNK_SIZE):
+            chunk = activation_ids[start:start + ESIM_BATCH_CHUNK_SIZE]
+            yield b"".join(fast_json(render_item(a)) + b"\n" for a in chunk)
+    
+    return StreamingResponse(render_lines(), media_type="application/x-ndjson")
 
 # Root endpoint
-@app.get("/")
+root_router = APIRouter()
+
+@root_router.get("/")
 async def root():
     return {
         "message": "eSIM Myanmar API",
@@ -194,3 +274,137 @@ async def root():
         "version": "1.0.0",
         "docs": "/docs"
     }
+
+def _install_auth(app: FastAPI, module):
+    app.include_router(module.router, prefix="/api")
+    # Release the password hashing pool on shutdown
+    password_hasher = importlib.import_module("hashing").password_hasher
+    app.add_event_handler("shutdown", password_hasher.shutdown)
+    readiness.register("password_hashing", password_hasher.check_capacity)
+    # Logouts made on other workers; loaded before serving, then synced in the background
+    if not storage.process_local:
+        app.add_event_handler("startup", module.revoked_tokens.start)
+        app.add_event_handler("shutdown", module.revoked_tokens.stop)
+    # On a thread: the first round trip may still be importing the JWT backend
+    readiness.register("token_keys", lambda: asyncio.to_thread(module.key_ring.self_test))
+    # Bulk user import on its own, lower-priority hashing pool
+    provisioning = importlib.import_module("provisioning")
+    app.include_router(provisioning.router, prefix="/api")
+    app.add_event_handler("shutdown", provisioning.bulk_hasher.shutdown)
+
+def _install_topup(app: FastAPI, module):
+    app.include_router(module.router, prefix="/api")
+    # Top-up settlement workers; in-flight batches drain before storage closes
+    app.add_event_handler("startup", module.topup_processor.start)
+    app.router.on_shutdown.insert(0, module.topup_processor.stop)
+
+def _install_qr(app: FastAPI, module):
+    app.include_router(module.router)
+    app.add_event_handler("shutdown", module.qr_service.shutdown)
+
+# name -> (module, installer); a module is only imported when its router is enabled
+FEATURE_ROUTERS = {
+    "auth": ("auth", _install_auth),
+    "topup": ("topup", _install_topup),
+    "qr": ("qr", _install_qr),
+}
+
+def warm_up():
+    # Load the JWT and bcrypt backends on a thread once the worker is serving,
+    # instead of at import time or on the first login
+    from hashing import get_pwd_context
+    importlib.import_module("jose.jwt")
+    get_pwd_context().handler().get_backend()
+
+crypto_warm_up: Optional[asyncio.Future] = None
+
+async def schedule_warm_up():
+    global crypto_warm_up
+    crypto_warm_up = asyncio.get_running_loop().run_in_executor(None, warm_up)
+
+async def wait_until_warm():
+    """Wait for the work startup leaves running in the background."""
+    await pricing.wait_ready()
+    await activation_service.code_pool.wait_filled()
+    if crypto_warm_up is not None:
+        # Shielded: a readiness probe timing out must not cancel the warm-up itself
+        await asyncio.shield(crypto_warm_up)
+
+def create_app() -> FastAPI:
+    app = FastAPI(
+        title="eSIM Myanmar API",
+        description="API for eSIM Myanmar Company Limited",
+        version="1.0.0"
+    )
+
+    # Include the routers in the main app
+    app.include_router(root_router)
+    app.include_router(api_router)
+    app.include_router(usage_router, prefix="/api")
+    app.include_router(metrics_router)
+    app.include_router(health_router)
+    for name, (module_name, install) in FEATURE_ROUTERS.items():
+        if name not in DISABLED_ROUTERS:
+            install(app, importlib.import_module(module_name))
+
+    # /ready probes the datastore and waits out background warm-up
+    readiness.register("storage", storage.ping)
+    readiness.register("warm_up", wait_until_warm)
+
+    # Storage lifecycle: create indexes on startup, release the client pool on shutdown
+    app.add_event_handler("startup", storage.start)
+    app.add_event_handler("shutdown", storage.close)
+
+    # Usage aggregation: periodic batch flushes, final flush before storage closes
+    app.add_event_handler("startup", aggregator.start)
+    app.router.on_shutdown.insert(0, aggregator.stop)
+
+    # Activation code pool: filled and topped up in the background
+    app.add_event_handler("startup", activation_service.start)
+    app.add_event_handler("shutdown", activation_service.stop)
+
+    # Localized price tables: first one built in the background, rebuilt when FX rates change
+    app.add_event_handler("startup", pricing.start)
+    app.add_event_handler("shutdown", pricing.stop)
+
+    # Shared rate-limit buckets need their TTL index
+    app.add_event_handler("startup", rate_limiter.start)
+
+    # Event loop lag sampling for /metrics
+    app.add_event_handler("startup", loop_lag_monitor.start)
+    app.add_event_handler("shutdown", loop_lag_monitor.stop)
+
+    if "auth" not in DISABLED_ROUTERS:
+        app.add_event_handler("startup", schedule_warm_up)
+
+    # Per-IP / per-API-key token buckets; rejects before routing and body parsing
+    app.add_middleware(RateLimitMiddleware)
+
+    # CORS middleware, added after the rate limiter so it wraps it and 429s carry CORS headers
+    app.add_middleware(
+        CORSMiddleware,
+        allow_origins=["https://www.esim.com.mm", "http://localhost:3000"],
+        allow_credentials=True,
+        allow_methods=["GET", "POST", "PUT", "DELETE"],
+        allow_headers=["*"],
+    )
+
+    # Per-route latency and status metrics, exposed at /metrics (so 429s count)
+    app.add_middleware(MetricsMiddleware)
+
+    # Request ids and sampled JSON access logs, outermost so every response is tagged
+    app.add_middleware(AccessLogMiddleware)
+    app.add_event_handler("shutdown", flush_logs)
+
+    # Registered last so it runs first: /ready fails while the rest of shutdown drains
+    app.router.on_shutdown.insert(0, readiness.drain)
+
+    # JSON lines through a queue to a writer thread; LOG_FORMAT=text for the classic format.
+    # Installed at startup, ahead of every other hook, rather than when this module is imported
+    app.router.on_startup.insert(0, configure_logging)
+    return app
+
+logger = logging.getLogger(__name__)
+
+# `uvicorn server:app`, or `uvicorn --factory server:create_app`
+app = create_app()
@@ -0,0 +1,492 @@
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Optional, Tuple
+import copy
+import os
+import uuid
+
+# Leave MONGO_URL unset to use the process-local in-memory store (dev/tests)
+MONGO_URL = os.getenv("MONGO_URL")
+DB_NAME = os.getenv("DB_NAME", "esim_myanmar")
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+DB_TIMEOUT = int(os.getenv("DB_TIMEOUT", "30"))
+
+# Projections for the hot read paths, so only needed fields cross the wire
+USER_AUTH_FIELDS = ("email", "hashed_auth", "is_active")
+USER_PROFILE_FIELDS = ("id", "email", "full_name", "phone", "is_active")
+ACTIVATION_STATUS_FIELDS = (
+    "activation_id", "status", "data_total_gb", "data_used_gb",
+    "duration_days", "created_at", "usage_updated_at",
+)
+
+
+class DuplicateKeyError(Exception):
+    pass
+
+
+def _project(doc: Optional[dict], fields: Optional[Iterable[str]]) -> Optional[dict]:
+    if doc is None:
+        return None
+    if fields is None:
+        return copy.deepcopy(doc)
+    return {k: copy.deepcopy(doc[k]) for k in fields if k in doc}
+
+
+def _claimable(transaction: dict, now: datetime) -> bool:
+    # Queued and due, or leased by a worker that never reported back
+    if transaction["status"] == "queued":
+        return transaction["next_attempt_at"] <= now
+    return transaction["status"] == "processing" and transaction["lease_until"] <= now
+
+
+def _mongo_projection(fields: Optional[Iterable[str]]) -> dict:
+    projection = {"_id": 0}
+    if fields is not None:
+        projection.update({k: 1 for k in fields})
+    return projection
+
+
+# ----- In-memory implementations -----
+
+class InMemoryUserRepository:
+    def __init__(self):
+        self._users: Dict[str, dict] = {}
+
+    async def get_by_email(self, email: str, fields: Optional[Iterable[str]] = None) -> Optional[dict]:
+        return _project(self._users.get(email), fields)
+
+    async def exists(self, email: str) -> bool:
+        return email in self._users
+
+    async def create(self, user: dict):
+        if user["email"] in self._users:
+            raise DuplicateKeyError(user["email"])
+        self._users[user["email"]] = copy.deepcopy(user)
+
+    async def create_many(self, users: List[dict]) -> List[int]:
+        """Insert what can be inserted; returns indexes rejected as duplicates."""
+        failed = []
+        for index, user in enumerate(users):
+            try:
+                await self.create(user)
+            except DuplicateKeyError:
+                failed.append(index)
+        return failed
+
+    async def emails_in_use(self, emails: Iterable[str]) -> set:
+        return {e for e in emails if e in self._users}
+
+    async def update_password_hash(self, email: str, hashed_auth: str):
+        if email in self._users:
+            self._users[email]["hashed_auth"] = hashed_auth
+
+
+class InMemoryActivationRepository:
+    def __init__(self):
+        self._activations: Dict[str, dict] = {}
+        self._codes = set()
+
+    async def create(self, activation: dict):
+        if activation["activation_id"] in self._activations:
+            raise DuplicateKeyError(activation["activation_id"])
+        code = activation.get("activation_code")
+        if code is not None:
+            if code in self._codes:
+                raise DuplicateKeyError(code)
+            self._codes.add(code)
+        self._activations[activation["activation_id"]] = copy.deepcopy(activation)
+
+    async def create_many(self, activations: List[dict]) -> List[int]:
+        """Insert what can be inserted; returns indexes rejected as duplicates."""
+        failed = []
+        for index, activation in enumerate(activations):
+            try:
+                await self.create(activation)
+            except DuplicateKeyError:
+                failed.append(index)
+        return failed
+
+    async def codes_in_use(self, codes: Iterable[str]) -> set:
+        return {code for code in codes if code in self._codes}
+
+    async def get(self, activation_id: str, fields: Optional[Iterable[str]] = None) -> Optional[dict]:
+        return _project(self._activations.get(activation_id), fields)
+
+    async def get_many(self, activation_ids: Iterable[str], fields: Optional[Iterable[str]] = None) -> Dict[str, dict]:
+        found = {}
+        for activation_id in activation_ids:
+            doc = self._activations.get(activation_id)
+            if doc is not None:
+                found[activation_id] = _project(doc, fields)
+        return found
+
+    async def apply_usage(self, updates: Dict[str, Tuple[float, datetime]]):
+        for activation_id, (delta_gb, updated_at) in updates.items():
+            doc = self._activations.get(activation_id)
+            if doc is None:
+                continue
+            doc["data_used_gb"] += delta_gb
+            if doc.get("usage_updated_at") is None or doc["usage_updated_at"] < updated_at:
+                doc["usage_updated_at"] = updated_at
+
+    async def apply_topups(self, credits: Dict[str, Tuple[str, int]]):
+        """Add transaction_id -> (activation_id, data_gb) credits, each at most once."""
+        for transaction_id, (activation_id, data_gb) in credits.items():
+            doc = self._activations.get(activation_id)
+            if doc is None or transaction_id in doc.setdefault("topups_applied", []):
+                continue
+            doc["data_total_gb"] += data_gb
+            doc["topups_applied"].append(transaction_id)
+
+
+class InMemoryIdempotencyRepository:
+    def __init__(self):
+        self._records: Dict[str, dict] = {}
+
+    async def reserve(self, key: str, fingerprint: str, ttl: float) -> Optional[dict]:
+        """Claim key for a new request; returns the existing record if already claimed."""
+        now = datetime.utcnow()
+        record = self._records.get(key)
+        if record is not None and record["expires_at"] > now:
+            return copy.deepcopy(record)
+        if len(self._records) > 10000:
+            for stale in [k for k, r in self._records.items() if r["expires_at"] <= now]:
+                del self._records[stale]
+        self._records[key] = {
+            "key": key,
+            "fingerprint": fingerprint,
+            "response": None,
+            "expires_at": now + timedelta(seconds=ttl),
+        }
+        return None
+
+    async def complete(self, key: str, response: dict):
+        if key in self._records:
+            self._records[key]["response"] = copy.deepcopy(response)
+
+    async def release(self, key: str):
+        self._records.pop(key, None)
+
+
+class InMemoryTopupRepository:
+    def __init__(self):
+        self._transactions: Dict[str, dict] = {}
+
+    async def create(self, transaction: dict):
+        if transaction["transaction_id"] in self._transactions:
+            raise DuplicateKeyError(transaction["transaction_id"])
+        self._transactions[transaction["transaction_id"]] = copy.deepcopy(transaction)
+
+    async def get(self, transaction_id: str) -> Optional[dict]:
+        return _project(self._transactions.get(transaction_id), None)
+
+    async def claim(self, limit: int, lease: float) -> List[dict]:
+        """Lease up to limit due transactions to the caller for settlement."""
+        now = datetime.utcnow()
+        claimed = []
+        for doc in self._transactions.values():
+            if len(claimed) >= limit:
+                break
+            if _claimable(doc, now):
+                doc["status"] = "processing"
+                doc["lease_until"] = now + timedelta(seconds=lease)
+                claimed.append(copy.deepcopy(doc))
+        return claimed
+
+    async def update_many(self, updates: Dict[str, dict]):
+        for transaction_id, fields in updates.items():
+            doc = self._transactions.get(transaction_id)
+            if doc is not None:
+                doc.update(copy.deepcopy(fields))
+
+
+class InMemoryRevocationRepository:
+    def __init__(self):
+        self._revoked: Dict[bytes, Tuple[float, datetime]] = {}
+
+    async def add(self, digest: bytes, exp: float):
+        self._revoked[digest] = (exp, datetime.utcnow())
+
+    async def since(self, revoked_after: Optional[datetime]) -> List[Tuple[bytes, float, datetime]]:
+        """Unexpired revocations made after revoked_after (all of them for None)."""
+        now = datetime.utcnow().timestamp()
+        return [(digest, exp, at) for digest, (exp, at) in self._revoked.items()
+                if exp > now and (revoked_after is None or at > revoked_after)]
+
+
+# ----- MongoDB (Motor) implementations -----
+
+class MongoUserRepository:
+    def __init__(self, db):
+        self.collection = db["users"]
+
+    async def ensure_indexes(self):
+        await self.collection.create_index("email", unique=True)
+
+    async def get_by_email(self, email: str, fields: Optional[Iterable[str]] = None) -> Optional[dict]:
+        return await self.collection.find_one({"email": email}, _mongo_projection(fields))
+
+    async def exists(self, email: str) -> bool:
+        return await self.collection.find_one({"email": email}, {"_id": 1}) is not None
+
+    async def create(self, user: dict):
+        from pymongo.errors import DuplicateKeyError as MongoDuplicateKeyError
+        try:
+            await self.collection.insert_one(dict(user))
+        except MongoDuplicateKeyError:
+            raise DuplicateKeyError(user["email"])
+
+    async def create_many(self, users: List[dict]) -> List[int]:
+        from pymongo.errors import BulkWriteError
+        if not users:
+            return []
+        try:
+            await self.collection.insert_many([dict(u) for u in users], ordered=False)
+        except BulkWriteError as e:
+            failed = [err["index"] for err in e.details["writeErrors"] if err["code"] == 11000]
+            if len(failed) != len(e.details["writeErrors"]):
+                raise
+            return failed
+        return []
+
+    async def emails_in_use(self, emails: Iterable[str]) -> set:
+        cursor = self.collection.find({"email": {"$in": list(emails)}}, {"_id": 0, "email": 1})
+        return {doc["email"] async for doc in cursor}
+
+    async def update_password_hash(self, email: str, hashed_auth: str):
+        await self.collection.update_one({"email": email}, {"$set": {"hashed_auth": hashed_auth}})
+
+
+class MongoActivationRepository:
+    def __init__(self, db):
+        self.collection = db["activations"]
+
+    async def ensure_indexes(self):
+        await self.collection.create_index("activation_id", unique=True)
+        await self.collection.create_index("activation_code", unique=True, sparse=True)
+
+    async def create(self, activation: dict):
+        from pymongo.errors import DuplicateKeyError as MongoDuplicateKeyError
+        try:
+            await self.collection.insert_one(dict(activation))
+        except MongoDuplicateKeyError:
+            raise DuplicateKeyError(activation["activation_id"])
+
+    async def create_many(self, activations: List[dict]) -> List[int]:
+        from pymongo.errors import BulkWriteError
+        if not activations:
+            return []
+        try:
+            await self.collection.insert_many([dict(a) for a in activations], ordered=False)
+        except BulkWriteError as e:
+            failed = [err["index"] for err in e.details["writeErrors"] if err["code"] == 11000]
+            if len(failed) != len(e.details["writeErrors"]):
+                raise
+            return failed
+        return []
+
+    async def codes_in_use(self, codes: Iterable[str]) -> set:
+        cursor = self.collection.find({"activation_code": {"$in": list(codes)}}, {"_id": 0, "activation_code": 1})
+        return {doc["activation_code"] async for doc in cursor}
+
+    async def get(self, activation_id: str, fields: Optional[Iterable[str]] = None) -> Optional[dict]:
+        return await self.collection.find_one({"activation_id": activation_id}, _mongo_projection(fields))
+
+    async def get_many(self, activation_ids: Iterable[str], fields: Optional[Iterable[str]] = None) -> Dict[str, dict]:
+        # One $in query for the whole batch instead of a round trip per id
+        projection = _mongo_projection(fields)
+        if fields is not None:
+            projection["activation_id"] = 1
+        cursor = self.collection.find({"activation_id": {"$in": list(activation_ids)}}, projection)
+        return {doc["activation_id"]: doc async for doc in cursor}
+
+    async def apply_usage(self, updates: Dict[str, Tuple[float, datetime]]):
+        from pymongo import UpdateOne
+        if not updates:
+            return
+        await self.collection.bulk_write([
+            UpdateOne(
+                {"activation_id": activation_id},
+                {"$inc": {"data_used_gb": delta_gb}, "$max": {"usage_updated_at": updated_at}},
+            )
+            for activation_id, (delta_gb, updated_at) in updates.items()
+        ], ordered=False)
+
+    async def apply_topups(self, credits: Dict[str, Tuple[str, int]]):
+        from pymongo import UpdateOne
+        if not credits:
+            return
+        # The transaction id goes on the activation with the credit, so a replayed
+        # settlement matches nothing and credits nothing
+        await self.collection.bulk_write([
+            UpdateOne(
+                {"activation_id": activation_id, "topups_applied": {"$ne": transaction_id}},
+                {"$inc": {"data_total_gb": data_gb}, "$push": {"topups_applied": transaction_id}},
+            )
+            for transaction_id, (activation_id, data_gb) in credits.items()
+        ], ordered=False)
+
+
+class MongoIdempotencyRepository:
+    def __init__(self, db):
+        self.collection = db["idempotency_keys"]
+
+    async def ensure_indexes(self):
+        await self.collection.create_index("key", unique=True)
+        # MongoDB's TTL monitor removes records once expires_at passes
+        await self.collection.create_index("expires_at", expireAfterSeconds=0)
+
+    async def reserve(self, key: str, fingerprint: str, ttl: float) -> Optional[dict]:
+        from pymongo.errors import DuplicateKeyError as MongoDuplicateKeyError
+        while True:
+            now = datetime.utcnow()
+            # The TTL monitor runs about once a minute, so clear expired leftovers first
+            await self.collection.delete_one({"key": key, "expires_at": {"$lte": now}})
+            try:
+                await self.collection.insert_one({
+                    "key": key,
+                    "fingerprint": fingerprint,
+                    "response": None,
+                    "expires_at": now + timedelta(seconds=ttl),
+                })
+                return None
+            except MongoDuplicateKeyError:
+                existing = await self.collection.find_one({"key": key}, {"_id": 0})
+            if existing is not None:
+                return existing
+            # The holder released the key between our insert and the read; claim it again
+
+    async def complete(self, key: str, response: dict):
+        await self.collection.update_one({"key": key}, {"$set": {"response": response}})
+
+    async def release(self, key: str):
+        await self.collection.delete_one({"key": key})
+
+
+class MongoTopupRepository:
+    def __init__(self, db):
+        self.collection = db["topups"]
+
+    async def ensure_indexes(self):
+        await self.collection.create_index("transaction_id", unique=True)
+        await self.collection.create_index([("status", 1), ("next_attempt_at", 1)])
+        await self.collection.create_index("claim_id", sparse=True)
+
+    async def create(self, transaction: dict):
+        from pymongo.errors import DuplicateKeyError as MongoDuplicateKeyError
+        try:
+            await self.collection.insert_one(dict(transaction))
+        except MongoDuplicateKeyError:
+            raise DuplicateKeyError(transaction["transaction_id"])
+
+    async def get(self, transaction_id: str) -> Optional[dict]:
+        return await self.collection.find_one({"transaction_id": transaction_id}, {"_id": 0})
+
+    async def claim(self, limit: int, lease: float) -> List[dict]:
+        now = datetime.utcnow()
+        claimable = {"$or": [
+            {"status": "queued", "next_attempt_at": {"$lte": now}},
+            {"status": "processing", "lease_until": {"$lte": now}},
+        ]}
+        cursor = self.collection.find(claimable, {"_id": 0, "transaction_id": 1}) \
+            .sort("next_attempt_at", 1).limit(limit)
+        candidates = [doc["transaction_id"] async for doc in cursor]
+        if not candidates:
+            return []
+        # Tag in one update; rows another worker took in between no longer match
+        claim_id = uuid.uuid4().hex
+        await self.collection.update_many(
+            {"transaction_id": {"$in": candidates}, **claimable},
+            {"$set": {"status": "processing", "claim_id": claim_id,
+                      "lease_until": now + timedelta(seconds=lease)}},
+        )
+        return [doc async for doc in self.collection.find({"claim_id": claim_id}, {"_id": 0})]
+
+    async def update_many(self, updates: Dict[str, dict]):
+        from pymongo import UpdateOne
+        if not updates:
+            return
+        await self.collection.bulk_write([
+            UpdateOne({"transaction_id": transaction_id}, {"$set": fields})
+            for transaction_id, fields in updates.items()
+        ], ordered=False)
+
+
+class MongoRevocationRepository:
+    def __init__(self, db):
+        self.collection = db["revoked_tokens"]
+
+    async def ensure_indexes(self):
+        # Dropped by the server once the token would have expired anyway
+        await self.collection.create_index("expires_at", expireAfterSeconds=0)
+        await self.collection.create_index("revoked_at")
+
+    async def add(self, digest: bytes, exp: float):
+        await self.collection.update_one(
+            {"_id": digest},
+            {"$set": {"exp": exp, "expires_at": datetime.utcfromtimestamp(exp),
+                      "revoked_at": datetime.utcnow()}},
+            upsert=True,
+        )
+
+    async def since(self, revoked_after: Optional[datetime]) -> List[Tuple[bytes, float, datetime]]:
+        query = {"expires_at": {"$gt": datetime.utcnow()}}
+        if revoked_after is not None:
+            query["revoked_at"] = {"$gt": revoked_after}
+        cursor = self.collection.find(query, {"exp": 1, "revoked_at": 1})
+        return [(bytes(doc["_id"]), doc["exp"], doc["revoked_at"]) async for doc in cursor]
+
+
+class Storage:
+    """Holds the repositories and the shared, pooled database client."""
+
+    def __init__(self, mongo_url: Optional[str] = MONGO_URL, db_name: str = DB_NAME):
+        self.mongo_url = mongo_url
+        self.db_name = db_name
+        self.client = None
+        if mongo_url:
+            self.backend = "mongo"
+            # Motor connects lazily, so creating the client here does no I/O
+            from motor.motor_asyncio import AsyncIOMotorClient
+            self.client = AsyncIOMotorClient(
+                mongo_url,
+                maxPoolSize=DB_POOL_SIZE,
+                serverSelectionTimeoutMS=DB_TIMEOUT * 1000,
+                tz_aware=False,
+            )
+            db = self.client[db_name]
+            self.users = MongoUserRepository(db)
+            self.activations = MongoActivationRepository(db)
+            self.idempotency = MongoIdempotencyRepository(db)
+            self.topups = MongoTopupRepository(db)
+            self.revocations = MongoRevocationRepository(db)
+        else:
+            self.backend = "memory"
+            self.users = InMemoryUserRepository()
+            self.activations = InMemoryActivationRepository()
+            self.idempotency = InMemoryIdempotencyRepository()
+            self.topups = InMemoryTopupRepository()
+            self.revocations = InMemoryRevocationRepository()
+
+    @property
+    def process_local(self) -> bool:
+        return self.backend == "memory"
+
+    def repositories(self) -> List[object]:
+        return [self.users, self.activations, self.idempotency, self.topups, self.revocations]
+
+    async def start(self):
+        for repository in self.repositories():
+            if hasattr(repository, "ensure_indexes"):
+                await repository.ensure_indexes()
+
+    async def ping(self):
+        # Readiness probe: one round trip to the server; nothing to reach in memory
+        if self.client is not None:
+            await self.client.admin.command("ping")
+
+    async def close(self):
+        if self.client is not None:
+            self.client.close()
+
+
+storage = Storage()
@@ -0,0 +1,196 @@
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+import asyncio
+import hashlib
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class InvalidTokenError(Exception):
+    pass
+
+
+def token_digest(token: str) -> bytes:
+    # Cache and revocation entries never hold the bearer token itself
+    return hashlib.blake2b(token.encode("ascii", "replace"), digest_size=16).digest()
+
+
+def key_id(secret: str) -> str:
+    return hashlib.sha256(secret.encode("utf-8")).hexdigest()[:8]
+
+
+class KeyRing:
+    """Signs with the current secret and still accepts tokens from previous ones."""
+
+    def __init__(self, current: str, previous: List[str] = (), algorithm: str = "HS256"):
+        self.algorithm = algorithm
+        self.current_kid = key_id(current)
+        self.keys: Dict[str, str] = {self.current_kid: current}
+        for secret in previous:
+            self.keys.setdefault(key_id(secret), secret)
+
+    # python-jose loads its crypto backends on import; it is imported on first
+    # use so workers don't pay for it before they can serve
+
+    def encode(self, claims: dict) -> str:
+        from jose import jwt
+        return jwt.encode(
+            claims,
+            self.keys[self.current_kid],
+            algorithm=self.algorithm,
+            headers={"kid": self.current_kid},
+        )
+
+    def decode(self, token: str) -> dict:
+        from jose import JWTError, jwt
+        try:
+            kid = jwt.get_unverified_header(token).get("kid")
+            if kid is not None:
+                secret = self.keys.get(kid)
+                if secret is None:
+                    raise InvalidTokenError("Unknown signing key")
+                return jwt.decode(token, secret, algorithms=[self.algorithm])
+            # Tokens issued before key ids were added: try every key, newest first
+            for secret in self.keys.values():
+                try:
+                    return jwt.decode(token, secret, algorithms=[self.algorithm])
+                except JWTError:
+                    continue
+        except JWTError as e:
+            raise InvalidTokenError(str(e)) from e
+        raise InvalidTokenError("Signature verification failed")
+
+    def self_test(self):
+        """Sign and verify a throwaway token with the current key (readiness probe)."""
+        if self.decode(self.encode({"sub": "readiness-probe"})).get("sub") != "readiness-probe":
+            raise InvalidTokenError("Token round trip returned the wrong claims")
+
+    @staticmethod
+    def unverified_claims(token: str) -> dict:
+        from jose import jwt
+        return jwt.get_unverified_claims(token)
+
+
+class VerifiedTokenCache:
+    """LRU of already-verified tokens; entries never outlive the token's exp."""
+
+    def __init__(self, max_size: int = 10000, ttl: float = 300.0):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries: "OrderedDict[bytes, Tuple[str, float]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, digest: bytes) -> Optional[str]:
+        entry = self._entries.get(digest)
+        if entry is None:
+            self.misses += 1
+            return None
+        subject, expires_at = entry
+        if expires_at <= time.time():
+            del self._entries[digest]
+            self.misses += 1
+            return None
+        self._entries.move_to_end(digest)
+        self.hits += 1
+        return subject
+
+    def put(self, digest: bytes, subject: str, exp: float):
+        self._entries[digest] = (subject, min(exp, time.time() + self.ttl))
+        self._entries.move_to_end(digest)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def discard(self, digest: bytes):
+        self._entries.pop(digest, None)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class RevocationList:
+    """Revoked token digests, each kept only until the token would expire anyway."""
+
+    def __init__(self):
+        self._revoked: Dict[bytes, float] = {}
+        self._next_purge = 0.0
+
+    def revoke(self, digest: bytes, exp: float):
+        self._revoked[digest] = exp
+        self._purge()
+
+    async def publish(self, digest: bytes, exp: float):
+        """Revoke everywhere this list is shared; a plain list is only this process."""
+        self.revoke(digest, exp)
+
+    def __contains__(self, digest: bytes) -> bool:
+        # Fast path for the common case of nothing revoked
+        return bool(self._revoked) and digest in self._revoked
+
+    def _purge(self):
+        now = time.time()
+        if now < self._next_purge:
+            return
+        self._next_purge = now + 60
+        for digest in [d for d, exp in self._revoked.items() if exp <= now]:
+            del self._revoked[digest]
+
+    def __len__(self) -> int:
+        return len(self._revoked)
+
+
+class SharedRevocationList(RevocationList):
+    """Revocations stored in shared storage and pulled in by every worker.
+
+    Lookups stay in memory; a logout on one worker reaches the others within one
+    sync interval.
+    """
+
+    # Re-read revocations this much older than the newest seen, for clock skew
+    # between workers and writes landing out of order
+    SYNC_OVERLAP = timedelta(seconds=5)
+
+    def __init__(self, repository, interval: float = 1.0):
+        super().__init__()
+        self.repository = repository
+        self.interval = interval
+        self._synced_until: Optional[datetime] = None
+        self._task: Optional[asyncio.Task] = None
+
+    async def publish(self, digest: bytes, exp: float):
+        self.revoke(digest, exp)
+        await self.repository.add(digest, exp)
+
+    async def sync(self):
+        since = None if self._synced_until is None else self._synced_until - self.SYNC_OVERLAP
+        for digest, exp, revoked_at in await self.repository.since(since):
+            if digest not in self._revoked:
+                self.revoke(digest, exp)
+            if self._synced_until is None or revoked_at > self._synced_until:
+                self._synced_until = revoked_at
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.sync()
+            except Exception:
+                logger.exception("Token revocation sync failed; will retry")
+
+    async def start(self):
+        # Everything still unexpired is loaded before the worker serves
+        await self.sync()
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
@@ -0,0 +1,256 @@
+from fastapi import APIRouter, Header, HTTPException, Query
+from fastapi.responses import JSONResponse
+from datetime import datetime, timedelta
+from pydantic import BaseModel
+from typing import Dict, List, Literal, NamedTuple, Optional
+import asyncio
+import logging
+import os
+import random
+import time
+import uuid
+from activation import idempotent
+from coalesce import activation_reads
+from metrics import registry
+from storage import storage
+from usage import aggregator
+
+router = APIRouter(prefix="/esim", tags=["topup"])
+logger = logging.getLogger(__name__)
+
+TOPUP_WORKERS = int(os.getenv("TOPUP_WORKERS", "4"))
+# Transactions sent to the provider per settlement call
+TOPUP_BATCH_SIZE = int(os.getenv("TOPUP_BATCH_SIZE", "50"))
+# How long a woken worker lingers so a burst of enqueues lands in one batch
+TOPUP_BATCH_WAIT = float(os.getenv("TOPUP_BATCH_WAIT", "0.05"))
+# Idle workers also poll for retries coming due and leases left by crashed workers
+TOPUP_POLL_INTERVAL = float(os.getenv("TOPUP_POLL_INTERVAL", "1"))
+TOPUP_MAX_ATTEMPTS = int(os.getenv("TOPUP_MAX_ATTEMPTS", "6"))
+TOPUP_BACKOFF_BASE = float(os.getenv("TOPUP_BACKOFF_BASE", "1"))
+TOPUP_BACKOFF_MAX = float(os.getenv("TOPUP_BACKOFF_MAX", "300"))
+TOPUP_PROVIDER_TIMEOUT = float(os.getenv("TOPUP_PROVIDER_TIMEOUT", "15"))
+# A claimed batch is handed to another worker if not settled within this time
+TOPUP_LEASE = float(os.getenv("TOPUP_LEASE", "60"))
+TOPUP_MAX_AMOUNT_USD = int(os.getenv("TOPUP_MAX_AMOUNT_USD", "500"))
+# Data added to the activation per USD once a top-up settles
+TOPUP_GB_PER_USD = int(os.getenv("TOPUP_GB_PER_USD", "1"))
+TOPUP_PROVIDER = os.getenv("TOPUP_PROVIDER", "fake")
+FAKE_TOPUP_LATENCY = float(os.getenv("FAKE_TOPUP_LATENCY", "0.2"))
+FAKE_TOPUP_FAILURE_RATE = float(os.getenv("FAKE_TOPUP_FAILURE_RATE", "0"))
+
+transactions_total = registry.counter(
+    "topup_transactions_total", "Top-up transactions by final or retry outcome", ("outcome",))
+settlement_duration = registry.histogram(
+    "topup_settlement_duration_seconds", "Provider time per settlement batch",
+    buckets=(0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0))
+
+
+class TopupTransaction(BaseModel):
+    transaction_id: str
+    activation_id: str
+    topup_amount_usd: int
+    data_gb: Optional[int] = None
+    status: Literal["queued", "processing", "completed", "failed"]
+    attempts: int
+    created_at: datetime
+    updated_at: datetime
+    provider_reference: Optional[str] = None
+    error: Optional[str] = None
+
+
+class SettlementResult(NamedTuple):
+    outcome: str                        # "settled", "declined" or "retry"
+    reference: Optional[str] = None     # provider's id for a settled charge
+    reason: Optional[str] = None
+
+
+class FakeTopupProvider:
+    """Stand-in for the payment provider and carrier, for development and tests."""
+
+    def __init__(self, latency: float = FAKE_TOPUP_LATENCY, failure_rate: float = FAKE_TOPUP_FAILURE_RATE,
+                 seed: Optional[int] = None):
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.random = random.Random(seed)
+        self.calls = 0
+        # transaction_id -> reference; replays of a settled id return the same charge
+        self.settled: Dict[str, str] = {}
+
+    async def settle(self, transactions: List[dict]) -> Dict[str, SettlementResult]:
+        self.calls += 1
+        await asyncio.sleep(self.latency)
+        results = {}
+        for transaction in transactions:
+            transaction_id = transaction["transaction_id"]
+            if transaction_id in self.settled:
+                results[transaction_id] = SettlementResult("settled", self.settled[transaction_id])
+            elif self.random.random() < self.failure_rate:
+                results[transaction_id] = SettlementResult("retry", reason="Carrier timeout")
+            else:
+                self.settled[transaction_id] = reference = f"fake_{uuid.uuid4().hex[:16]}"
+                results[transaction_id] = SettlementResult("settled", reference)
+        return results
+
+
+def create_provider(name: str = TOPUP_PROVIDER):
+    if name == "fake":
+        return FakeTopupProvider()
+    raise ValueError(f"Unknown top-up provider: {name}")
+
+
+def backoff_delay(attempts: int) -> float:
+    # Exponential with jitter, so a provider outage doesn't end in a synchronized retry wave
+    delay = min(TOPUP_BACKOFF_MAX, TOPUP_BACKOFF_BASE * 2 ** (attempts - 1))
+    return delay * random.uniform(0.5, 1.0)
+
+
+class TopupProcessor:
+    """Queues top-ups in storage and settles them in batches on background workers."""
+
+    def __init__(self, provider=None, store=storage, workers: int = TOPUP_WORKERS,
+                 batch_size: int = TOPUP_BATCH_SIZE, max_attempts: int = TOPUP_MAX_ATTEMPTS):
+        self.provider = provider or create_provider()
+        self.store = store
+        self.workers = workers
+        self.batch_size = batch_size
+        self.max_attempts = max_attempts
+        self._wake = asyncio.Event()
+        self._stopping = False
+        self._tasks: List[asyncio.Task] = []
+
+    async def enqueue(self, activation_id: str, amount_usd: int) -> dict:
+        now = datetime.utcnow()
+        transaction = {
+            "transaction_id": str(uuid.uuid4()),
+            "activation_id": activation_id,
+            "topup_amount_usd": amount_usd,
+            # Fixed when accepted, so a rate change doesn't alter queued top-ups
+            "data_gb": amount_usd * TOPUP_GB_PER_USD,
+            "status": "queued",
+            "attempts": 0,
+            "created_at": now,
+            "updated_at": now,
+            "next_attempt_at": now,
+            "lease_until": None,
+            "provider_reference": None,
+            "error": None,
+        }
+        await self.store.topups.create(transaction)
+        self._wake.set()
+        return transaction
+
+    def outcome(self, transaction: dict, result: Optional[SettlementResult], now: datetime) -> dict:
+        attempts = transaction["attempts"] + 1
+        fields = {"attempts": attempts, "updated_at": now, "lease_until": None}
+        if result is not None and result.outcome == "settled":
+            fields.update(status="completed", provider_reference=result.reference, error=None)
+        elif result is not None and result.outcome == "declined":
+            fields.update(status="failed", error=result.reason or "Declined by provider")
+        elif attempts >= self.max_attempts:
+            fields.update(status="failed", error="Retries exhausted: " + (result and result.reason or "no response"))
+        else:
+            fields.update(status="queued", error=result and result.reason,
+                          next_attempt_at=now + timedelta(seconds=backoff_delay(attempts)))
+        return fields
+
+    async def settle(self, batch: List[dict]):
+        # transaction_id doubles as the provider's idempotency key, so a batch
+        # re-run after a lost update or expired lease is not charged twice
+        start = time.perf_counter()
+        try:
+            results = await asyncio.wait_for(self.provider.settle(batch), TOPUP_PROVIDER_TIMEOUT)
+        except Exception as e:
+            logger.warning("Top-up settlement of %d transactions failed: %r", len(batch), e)
+            reason = "Provider timeout" if isinstance(e, asyncio.TimeoutError) else "Provider error"
+            results = {t["transaction_id"]: SettlementResult("retry", reason=reason) for t in batch}
+        settlement_duration.observe(time.perf_counter() - start)
+
+        now = datetime.utcnow()
+        updates = {}
+        credits = {}
+        for transaction in batch:
+            fields = self.outcome(transaction, results.get(transaction["transaction_id"]), now)
+            updates[transaction["transaction_id"]] = fields
+            if fields["status"] == "completed":
+                data_gb = transaction.get("data_gb")
+                if data_gb is None:
+                    data_gb = transaction["topup_amount_usd"] * TOPUP_GB_PER_USD
+                credits[transaction["transaction_id"]] = (transaction["activation_id"], data_gb)
+            transactions_total.labels(fields["status"] if fields["status"] != "queued" else "retried").inc()
+        # Credit before marking completed: a batch that dies in between is re-claimed,
+        # replays as settled at the provider, and the credit (keyed by transaction id)
+        # is not applied twice
+        await self.store.activations.apply_topups(credits)
+        await self.store.topups.update_many(updates)
+        if credits:
+            credited = {activation_id for activation_id, _ in credits.values()}
+            records = await self.store.activations.get_many(credited, ("activation_id", "data_total_gb"))
+            for activation_id in credited:
+                activation_reads.discard(activation_id)
+            aggregator.set_totals({a: record["data_total_gb"] for a, record in records.items()})
+
+    async def _worker(self):
+        while not self._stopping:
+            try:
+                batch = await self.store.topups.claim(self.batch_size, TOPUP_LEASE)
+                if batch:
+                    await self.settle(batch)
+                    continue
+            except Exception:
+                logger.exception("Top-up worker failed")
+            self._wake.clear()
+            try:
+                await asyncio.wait_for(self._wake.wait(), TOPUP_POLL_INTERVAL)
+                await asyncio.sleep(TOPUP_BATCH_WAIT)
+            except asyncio.TimeoutError:
+                pass
+
+    async def start(self):
+        if not self._tasks:
+            self._stopping = False
+            self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self, timeout: float = 10.0):
+        # Let batches already at the provider finish; anything left is re-claimed
+        # by another process once its lease expires
+        if not self._tasks:
+            return
+        self._stopping = True
+        self._wake.set()
+        done, pending = await asyncio.wait(self._tasks, timeout=timeout)
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+        self._tasks = []
+
+
+topup_processor = TopupProcessor()
+
+
+@router.post("/{activation_id}/topup", response_model=TopupTransaction, status_code=202)
+async def topup_esim(activation_id: str, amount_usd: int = Query(..., gt=0, le=TOPUP_MAX_AMOUNT_USD),
+                     idempotency_key: Optional[str] = Header(None)):
+    if await storage.activations.get(activation_id, ("activation_id",)) is None:
+        raise HTTPException(status_code=404, detail="Activation not found")
+
+    async def enqueue():
+        transaction = await topup_processor.enqueue(activation_id, amount_usd)
+        return TopupTransaction(**transaction).model_dump(mode="json")
+
+    # Accepted, not settled: poll the Location for the outcome
+    transaction = await idempotent(
+        idempotency_key, "topup", {"activation_id": activation_id, "amount_usd": amount_usd}, enqueue
+    )
+    return JSONResponse(
+        transaction,
+        status_code=202,
+        headers={"Location": f"/api/esim/topups/{transaction['transaction_id']}"},
+    )
+
+
+@router.get("/topups/{transaction_id}", response_model=TopupTransaction)
+async def get_topup(transaction_id: str):
+    transaction = await storage.topups.get(transaction_id)
+    if transaction is None:
+        raise HTTPException(status_code=404, detail="Transaction not found")
+    return TopupTransaction(**transaction)
@@ -0,0 +1,390 @@
+from fastapi import APIRouter, Header, HTTPException, Request
+from datetime import datetime, timezone
+from typing import AsyncIterator, Callable, Dict, Iterable, List, Optional, Set, Tuple
+import asyncio
+import hmac
+import json
+import logging
+import os
+import time
+from coalesce import CoalescingCache, activation_reads
+from metrics import registry
+from storage import ACTIVATION_STATUS_FIELDS, storage
+
+router = APIRouter(prefix="/usage", tags=["usage"])
+logger = logging.getLogger(__name__)
+
+BYTES_PER_GB = 1024 ** 3
+# Pending usage is written to storage every interval, or sooner once this many events queue up
+USAGE_FLUSH_INTERVAL = float(os.getenv("USAGE_FLUSH_INTERVAL", "5"))
+USAGE_FLUSH_EVENTS = int(os.getenv("USAGE_FLUSH_EVENTS", "50000"))
+# Events parsed per aggregation step while reading an ingest stream
+USAGE_INGEST_CHUNK = 1000
+# Shared secret the carrier feed sends as X-Ingest-Token; ingestion is off without it
+USAGE_INGEST_TOKEN = os.getenv("USAGE_INGEST_TOKEN")
+# Activations with a usage counter in memory; clean ones are dropped first
+USAGE_MAX_COUNTERS = int(os.getenv("USAGE_MAX_COUNTERS", "100000"))
+MAX_REPORTED_ERRORS = 20
+# Live usage streams: at most one push per client per interval, and a cap per worker
+USAGE_STREAM_INTERVAL = float(os.getenv("USAGE_STREAM_INTERVAL", "2"))
+USAGE_STREAM_MAX_CONNECTIONS = int(os.getenv("USAGE_STREAM_MAX_CONNECTIONS", "1000"))
+USAGE_STREAM_KEEPALIVE = float(os.getenv("USAGE_STREAM_KEEPALIVE", "15"))
+
+
+class UsageCounter:
+    __slots__ = ("activation_id", "total_gb", "used_gb", "pending_gb", "created_at", "updated_at")
+
+    def __init__(self, record: dict):
+        self.activation_id = record["activation_id"]
+        self.total_gb = record["data_total_gb"]
+        self.used_gb = record["data_used_gb"]
+        self.pending_gb = 0.0
+        self.created_at = record["created_at"]
+        self.updated_at = record.get("usage_updated_at")
+
+    def as_record(self) -> dict:
+        return {
+            "activation_id": self.activation_id,
+            "data_total_gb": self.total_gb,
+            "data_used_gb": self.used_gb,
+            "created_at": self.created_at,
+            "usage_updated_at": self.updated_at,
+        }
+
+
+class UsageSubscription:
+    __slots__ = ("activation_id", "changed")
+
+    def __init__(self, activation_id: str):
+        self.activation_id = activation_id
+        self.changed = asyncio.Event()
+
+
+class UsageAggregator:
+    """Per-activation usage totals kept in memory and flushed to storage in batches.
+
+    A counter lives until the flush after it was last changed, or for as long as
+    someone streams it; anything else is read from storage again on next use, so
+    usage flushed by other workers shows up within one flush interval.
+    """
+
+    def __init__(self, store=storage, reads: Optional[CoalescingCache] = None,
+                 max_counters: int = USAGE_MAX_COUNTERS):
+        self.store = store
+        # First reads of an activation, coalesced with concurrent balance reads
+        self.reads = reads
+        self.max_counters = max_counters
+        self.counters: Dict[str, UsageCounter] = {}
+        self._dirty = set()
+        # Written by a flush still in progress; not evictable until it lands
+        self._flushing = set()
+        self._pending_events = 0
+        self._flush_now = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._subscribers: Dict[str, Set[UsageSubscription]] = {}
+        self.subscriptions = 0
+        self.events_ingested = 0
+        self.flushes = 0
+
+    async def get(self, activation_id: str) -> Optional[UsageCounter]:
+        counter = self.counters.get(activation_id)
+        if counter is None:
+            if self.reads is not None:
+                record = await self.reads.get(activation_id)
+            else:
+                record = await self.store.activations.get(activation_id, ACTIVATION_STATUS_FIELDS)
+            if record is None:
+                return None
+            counter = self._load(record)
+        return counter
+
+    def _load(self, record: dict) -> UsageCounter:
+        counter = self.counters.get(record["activation_id"])
+        if counter is None:
+            if len(self.counters) >= self.max_counters:
+                self._evict(len(self.counters) - self.max_counters + 1)
+            counter = self.counters[record["activation_id"]] = UsageCounter(record)
+        return counter
+
+    def _evict(self, limit: Optional[int] = None):
+        """Drop counters with nothing left to flush and no live stream, oldest first."""
+        evicted = 0
+        for activation_id in list(self.counters):
+            if limit is not None and evicted >= limit:
+                return
+            if (activation_id not in self._dirty and activation_id not in self._flushing
+                    and activation_id not in self._subscribers):
+                del self.counters[activation_id]
+                evicted += 1
+        if limit is not None and evicted < limit:
+            # Everything held is unflushed; flushing makes room
+            self._flush_now.set()
+
+    def set_totals(self, totals: Dict[str, int]):
+        """Take data_total_gb read back from storage, e.g. after a top-up was credited."""
+        changed = []
+        for activation_id, total_gb in totals.items():
+            counter = self.counters.get(activation_id)
+            if counter is not None and counter.total_gb != total_gb:
+                counter.total_gb = total_gb
+                changed.append(activation_id)
+        self._notify(changed)
+
+    def apply_to(self, record: dict) -> dict:
+        """Add usage not yet flushed to storage onto a record read from it."""
+        counter = self.counters.get(record["activation_id"])
+        if counter is not None and counter.pending_gb:
+            record["data_used_gb"] += counter.pending_gb
+            updated_at = record.get("usage_updated_at")
+            if counter.updated_at is not None and (updated_at is None or updated_at < counter.updated_at):
+                record["usage_updated_at"] = counter.updated_at
+        return record
+
+    async def ingest(self, events: List[Tuple[str, int, datetime]]) -> List[str]:
+        """Add (activation_id, bytes, timestamp) events; returns ids of unknown activations."""
+        missing = {a for a, _, _ in events if a not in self.counters}
+        if missing:
+            # One bulk read seeds every counter this chunk needs
+            records = await self.store.activations.get_many(missing, ACTIVATION_STATUS_FIELDS)
+            for record in records.values():
+                self._load(record)
+
+        unknown = []
+        changed = set()
+        for activation_id, used_bytes, timestamp in events:
+            counter = self.counters.get(activation_id)
+            if counter is None:
+                unknown.append(activation_id)
+                continue
+            delta_gb = used_bytes / BYTES_PER_GB
+            counter.used_gb += delta_gb
+            counter.pending_gb += delta_gb
+            if counter.updated_at is None or counter.updated_at < timestamp:
+                counter.updated_at = timestamp
+            changed.add(activation_id)
+
+        self._dirty |= changed
+        self._notify(changed)
+        self.events_ingested += len(events) - len(unknown)
+        self._pending_events += len(events) - len(unknown)
+        if self._pending_events >= USAGE_FLUSH_EVENTS:
+            self._flush_now.set()
+        return unknown
+
+    async def flush(self):
+        dirty, self._dirty = self._dirty, set()
+        if dirty:
+            self._pending_events = 0
+            self._flushing |= dirty
+            flushed = {activation_id: self.counters[activation_id] for activation_id in dirty}
+            updates = {}
+            for activation_id, counter in flushed.items():
+                updates[activation_id] = (counter.pending_gb, counter.updated_at)
+                counter.pending_gb = 0.0
+            try:
+                await self.store.activations.apply_usage(updates)
+            except Exception:
+                # Put the deltas back so the next flush retries them; a counter that
+                # went missing regardless is put back as it was
+                for activation_id, (delta_gb, _) in updates.items():
+                    counter = self.counters.setdefault(activation_id, flushed[activation_id])
+                    counter.pending_gb += delta_gb
+                self._dirty |= dirty
+                raise
+            finally:
+                self._flushing -= dirty
+            self.flushes += 1
+            if self.reads is not None:
+                # Cached reads taken before this flush would hide it
+                for activation_id in dirty:
+                    self.reads.discard(activation_id)
+
+        # Counters still held are unflushed or streamed; streamed ones pick up usage
+        # flushed and top-ups credited by other workers
+        self._evict()
+        refresh = set() if self.store.process_local else set(self._subscribers) - self._dirty
+        if not refresh:
+            return
+        records = await self.store.activations.get_many(
+            refresh, ("activation_id", "data_total_gb", "data_used_gb", "usage_updated_at"))
+        changed = []
+        for activation_id, record in records.items():
+            counter = self.counters.get(activation_id)
+            if counter is None:
+                continue
+            used_gb = record["data_used_gb"] + counter.pending_gb
+            if used_gb != counter.used_gb or record["data_total_gb"] != counter.total_gb:
+                counter.used_gb = used_gb
+                counter.total_gb = record["data_total_gb"]
+                changed.append(activation_id)
+            updated_at = record.get("usage_updated_at")
+            if updated_at is not None and (counter.updated_at is None or counter.updated_at < updated_at):
+                counter.updated_at = updated_at
+        self._notify(changed)
+
+    def check_stream_capacity(self):
+        if self.subscriptions >= USAGE_STREAM_MAX_CONNECTIONS:
+            raise HTTPException(
+                status_code=503,
+                detail="Too many live usage connections, please poll instead",
+                headers={"Retry-After": "30"},
+            )
+
+    def subscribe(self, activation_id: str) -> UsageSubscription:
+        """Register for change notifications; keeps the activation's counter from eviction."""
+        self.check_stream_capacity()
+        subscription = UsageSubscription(activation_id)
+        self._subscribers.setdefault(activation_id, set()).add(subscription)
+        self.subscriptions += 1
+        return subscription
+
+    def unsubscribe(self, subscription: UsageSubscription):
+        subscribers = self._subscribers.get(subscription.activation_id)
+        if subscribers is None or subscription not in subscribers:
+            return
+        subscribers.discard(subscription)
+        if not subscribers:
+            del self._subscribers[subscription.activation_id]
+        self.subscriptions -= 1
+
+    def _notify(self, activation_ids: Iterable[str]):
+        if not self._subscribers:
+            return
+        for activation_id in activation_ids:
+            for subscription in self._subscribers.get(activation_id, ()):
+                subscription.changed.set()
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._flush_now.wait(), USAGE_FLUSH_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+            self._flush_now.clear()
+            try:
+                await self.flush()
+            except Exception:
+                logger.exception("Usage flush failed; will retry")
+
+    async def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+
+aggregator = UsageAggregator(reads=activation_reads)
+
+async def usage_stream(activation_id: str, render: Callable[[dict], bytes]) -> AsyncIterator[bytes]:
+    """Server-sent events for one activation: a usage event whenever it changes.
+
+    Changes arriving faster than USAGE_STREAM_INTERVAL are coalesced into one push.
+    The subscription is taken here, not by the route, so a response that is never
+    started (client gone, middleware error) holds no slot.
+    """
+    subscription = aggregator.subscribe(activation_id)
+    last_payload = None
+    last_sent = 0.0
+    try:
+        # Subscribed first: the counter can't be evicted between this read and the loop
+        counter = await aggregator.get(activation_id)
+        if counter is None:
+            return
+        while True:
+            payload = render(counter.as_record())
+            if payload != last_payload:
+                yield b"event: usage\ndata: " + payload + b"\n\n"
+                last_payload = payload
+                last_sent = time.monotonic()
+            try:
+                await asyncio.wait_for(subscription.changed.wait(), USAGE_STREAM_KEEPALIVE)
+            except asyncio.TimeoutError:
+                # Keeps proxies from closing an idle stream
+                yield b": keepalive\n\n"
+                continue
+            await asyncio.sleep(max(0.0, last_sent + USAGE_STREAM_INTERVAL - time.monotonic()))
+            subscription.changed.clear()
+    finally:
+        aggregator.unsubscribe(subscription)
+
+
+registry.gauge("usage_stream_connections", "Open live usage streams on this worker",
+               lambda: aggregator.subscriptions)
+
+
+def parse_event(line: bytes) -> Tuple[str, int, datetime]:
+    event = json.loads(line)
+    activation_id = event["activation_id"]
+    used_bytes = event["bytes"]
+    if not isinstance(activation_id, str) or not isinstance(used_bytes, int) or used_bytes < 0:
+        raise ValueError("activation_id must be a string and bytes a non-negative integer")
+    timestamp = event.get("timestamp")
+    if timestamp:
+        timestamp = datetime.fromisoformat(timestamp.replace("Z", "+00:00"))
+        if timestamp.tzinfo is not None:
+            timestamp = timestamp.astimezone(timezone.utc).replace(tzinfo=None)
+    else:
+        timestamp = datetime.utcnow()
+    return activation_id, used_bytes, timestamp
+
+
+@router.post("/events")
+async def ingest_usage_events(request: Request, x_ingest_token: Optional[str] = Header(None)):
+    """Ingest an NDJSON stream of {"activation_id", "bytes", "timestamp"} usage events."""
+    if not USAGE_INGEST_TOKEN:
+        raise HTTPException(status_code=403, detail="Usage ingestion is disabled")
+    if x_ingest_token is None or not hmac.compare_digest(x_ingest_token, USAGE_INGEST_TOKEN):
+        raise HTTPException(status_code=401, detail="Invalid ingest token")
+
+    accepted = 0
+    rejected = 0
+    errors = []
+    events = []
+    line_number = 0
+
+    def reject(error: dict):
+        nonlocal rejected
+        rejected += 1
+        if len(errors) < MAX_REPORTED_ERRORS:
+            errors.append(error)
+
+    async def aggregate():
+        nonlocal accepted
+        unknown = await aggregator.ingest(events)
+        accepted += len(events) - len(unknown)
+        for activation_id in unknown:
+            reject({"activation_id": activation_id, "error": "Activation not found"})
+        events.clear()
+
+    def parse_lines(lines: Iterable[bytes]):
+        nonlocal line_number
+        for line in lines:
+            line_number += 1
+            if not line.strip():
+                continue
+            try:
+                events.append(parse_event(line))
+            except (ValueError, KeyError, TypeError, AttributeError) as e:
+                reject({"line": line_number, "error": str(e) or type(e).__name__})
+
+    # Parse the body as it arrives instead of buffering it whole
+    buffer = b""
+    async for chunk in request.stream():
+        buffer += chunk
+        *lines, buffer = buffer.split(b"\n")
+        parse_lines(lines)
+        if len(events) >= USAGE_INGEST_CHUNK:
+            await aggregate()
+    parse_lines([buffer])
+    if events:
+        await aggregate()
+
+    return {"accepted": accepted, "rejected": rejected, "errors": errors}
@@ -0,0 +1,92 @@
+import hashlib
+import json
+import math
+import os
+import statistics
+import sys
+import time
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "backend")
+
+
+def setup_environment():
+    """Point the app at local stand-ins before anything from backend is imported."""
+    # In-memory storage, no MongoDB
+    os.environ.pop("MONGO_URL", None)
+    # Cheap bcrypt so login scenarios measure the server, not the hash cost;
+    # recorded in results so baselines are only compared like for like
+    os.environ.setdefault("BCRYPT_ROUNDS", "4")
+    # Every virtual client shares one address; measure the app, not the limiter
+    os.environ.setdefault("RATE_LIMIT_ENABLED", "false")
+    # Access logs are still formatted and written, just not onto the report
+    os.environ.setdefault("LOG_FILE", os.devnull)
+    if BACKEND_DIR not in sys.path:
+        sys.path.insert(0, BACKEND_DIR)
+
+
+def percentile(sorted_values, fraction: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = max(0, math.ceil(fraction * len(sorted_values)) - 1)
+    return sorted_values[index]
+
+
+def summarize(latencies, elapsed: float, errors: int = 0) -> dict:
+    latencies = sorted(latencies)
+    count = len(latencies)
+    return {
+        "count": count,
+        "errors": errors,
+        "throughput": round(count / elapsed, 1) if elapsed > 0 else 0.0,
+        "p50_ms": round(percentile(latencies, 0.50) * 1000, 4),
+        "p95_ms": round(percentile(latencies, 0.95) * 1000, 4),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 4),
+    }
+
+
+def median_summary(runs) -> dict:
+    """One summary from repetitions of the same benchmark: the median of each figure,
+    and every error any repetition saw."""
+    combined = dict(runs[0])
+    for key in ("throughput", "p50_ms", "p95_ms", "p99_ms"):
+        combined[key] = round(statistics.median(run[key] for run in runs), 4 if key.endswith("_ms") else 1)
+    combined["errors"] = max(run["errors"] for run in runs)
+    combined["repeats"] = len(runs)
+    return combined
+
+
+def reference_speed(rounds: int = 7, iterations: int = 2000) -> float:
+    """Ops/s of a fixed workload that touches none of the app's code.
+
+    Measured in every run and stored with the baseline, so results from a faster
+    or slower (or busier) host can be scaled before they are compared.
+    Median of several rounds, like the suites it stands in for, which see the
+    host's typical speed rather than its best moment.
+    """
+    document = {"plans": [{"id": f"plan-{i}", "price_usd": i * 5, "data_gb": i, "features": ["4g", "5g"]}
+                          for i in range(20)]}
+
+    def workload():
+        encoded = json.dumps(document, sort_keys=True)
+        hashlib.sha256(encoded.encode()).hexdigest()
+        sorted(json.loads(encoded)["plans"], key=lambda plan: -plan["price_usd"])
+
+    speeds = []
+    for _ in range(rounds):
+        _, elapsed = timed_calls(workload, iterations)
+        speeds.append(iterations / elapsed)
+    return round(statistics.median(speeds), 1)
+
+
+def timed_calls(fn, iterations: int):
+    """Call fn repeatedly, returning per-call latencies and total elapsed seconds."""
+    # One untimed call, so lazily imported backends don't land in the tail
+    fn()
+    latencies = []
+    perf_counter = time.perf_counter
+    started = perf_counter()
+    for _ in range(iterations):
+        start = perf_counter()
+        fn()
+        latencies.append(perf_counter() - start)
+    return latencies, perf_counter() - started
@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+"""Report what a backend worker spends its cold start on.
+
+    python benchmarks/importtime.py                  # summary of `-X importtime` + startup
+    python benchmarks/importtime.py --top 30 --json report.json
+    python benchmarks/importtime.py --budget-ms 900  # exit 1 if ready time exceeds the budget
+
+Each run is a fresh interpreter, so every import is cold. "ready" is import time
+plus the lifespan startup handlers, i.e. when the worker can take its first request.
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+from collections import defaultdict
+from common import BACKEND_DIR
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+
+READY_PROBE = """
+import asyncio, json, sys, time
+start = time.perf_counter()
+import {module}
+imported = time.perf_counter()
+sys.path.insert(0, {bench_dir!r})
+from loadgen import ASGIClient
+
+async def main():
+    client = ASGIClient({module}.app)
+    began = time.perf_counter()
+    await client.startup()
+    ready = time.perf_counter() - began
+    await client.shutdown()
+    return ready
+
+startup = asyncio.run(main())
+print(json.dumps({{"import_ms": (imported - start) * 1000, "startup_ms": startup * 1000}}))
+"""
+
+
+def child_env() -> dict:
+    # Same stand-ins as the benchmark suite: in-memory storage, no limiter
+    env = dict(os.environ)
+    env.pop("MONGO_URL", None)
+    env.setdefault("BCRYPT_ROUNDS", "4")
+    env.setdefault("RATE_LIMIT_ENABLED", "false")
+    env.setdefault("LOG_FILE", os.devnull)
+    env["PYTHONDONTWRITEBYTECODE"] = "1"
+    return env
+
+
+def parse_importtime(stderr: str):
+    """Yield (depth, self_us, cumulative_us, module) from -X importtime output."""
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        depth = (len(name) - len(name.lstrip())) // 2
+        yield depth, int(self_us), int(cumulative_us), name.strip()
+
+
+def profile_imports(module: str) -> list:
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=BACKEND_DIR, env=child_env(), capture_output=True, text=True,
+    )
+    if result.returncode != 0:
+        raise SystemExit(f"import {module} failed:\n{result.stderr[-2000:]}")
+    return list(parse_importtime(result.stderr))
+
+
+def measure_ready(module: str) -> dict:
+    result = subprocess.run(
+        [sys.executable, "-c", READY_PROBE.format(module=module, bench_dir=BENCH_DIR)],
+        cwd=BACKEND_DIR, env=child_env(), capture_output=True, text=True,
+    )
+    if result.returncode != 0:
+        raise SystemExit(f"startup of {module} failed:\n{result.stderr[-2000:]}")
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def summarize_imports(entries: list, module: str, top: int) -> dict:
+    by_package = defaultdict(int)
+    for _, self_us, _, name in entries:
+        by_package[name.split(".")[0]] += self_us
+    # Modules imported directly by the target, i.e. what its own import lines cost
+    direct = [(name, cumulative) for depth, _, cumulative, name in entries if depth == 1]
+    target = next((cumulative for depth, _, cumulative, name in entries if name == module and depth == 0), 0)
+    ms = lambda us: round(us / 1000, 2)
+    return {
+        "total_ms": ms(target),
+        "direct_imports": [{"module": n, "cumulative_ms": ms(c)}
+                           for n, c in sorted(direct, key=lambda x: -x[1])[:top]],
+        "packages": [{"package": p, "self_ms": ms(us)}
+                     for p, us in sorted(by_package.items(), key=lambda x: -x[1])[:top]],
+        "slowest_modules": [{"module": n, "self_ms": ms(s)}
+                            for _, s, _, n in sorted(entries, key=lambda e: -e[1])[:top]],
+    }
+
+
+def print_report(report: dict):
+    imports = report["imports"]
+    print(f"import {report['module']}: {imports['total_ms']} ms (single -X importtime run)")
+    for title, key, column in (("Direct imports (cumulative)", "direct_imports", "cumulative_ms"),
+                               ("Packages (self time)", "packages", "self_ms"),
+                               ("Slowest modules (self time)", "slowest_modules", "self_ms")):
+        print(f"\n{title}")
+        label = "module" if key != "packages" else "package"
+        for row in imports[key]:
+            print(f"  {row[label]:48} {row[column]:>9.2f} ms")
+    ready = report["ready"]
+    print(f"\nReady time over {ready['runs']} runs (median): import {ready['import_ms']} ms"
+          f" + startup {ready['startup_ms']} ms = {ready['ready_ms']} ms")
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Cold-start import and startup profile")
+    parser.add_argument("--module", default="server", help="Backend module exposing `app`")
+    parser.add_argument("--runs", type=int, default=5, help="Fresh interpreters for the ready time")
+    parser.add_argument("--top", type=int, default=15)
+    parser.add_argument("--budget-ms", type=float, help="Fail when median ready time exceeds this")
+    parser.add_argument("--json", dest="json_path", help="Also write the report to this file")
+    args = parser.parse_args()
+
+    samples = [measure_ready(args.module) for _ in range(args.runs)]
+    import_ms = statistics.median(s["import_ms"] for s in samples)
+    startup_ms = statistics.median(s["startup_ms"] for s in samples)
+    report = {
+        "module": args.module,
+        "imports": summarize_imports(profile_imports(args.module), args.module, args.top),
+        "ready": {
+            "runs": args.runs,
+            "import_ms": round(import_ms, 1),
+            "startup_ms": round(startup_ms, 1),
+            "ready_ms": round(statistics.median(s["import_ms"] + s["startup_ms"] for s in samples), 1),
+        },
+    }
+    print_report(report)
+    if args.json_path:
+        with open(args.json_path, "w") as f:
+            json.dump(report, f, indent=2)
+
+    if args.budget_ms is not None and report["ready"]["ready_ms"] > args.budget_ms:
+        print(f"\nREADY TIME {report['ready']['ready_ms']} ms exceeds budget {args.budget_ms} ms")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,198 @@
+from typing import Callable, Dict, List, Optional, Tuple
+import asyncio
+import json
+import random
+import time
+from common import median_summary, summarize
+
+
+class ASGIClient:
+    """Drives an ASGI app in-process: no sockets, no HTTP client library."""
+
+    def __init__(self, app):
+        self.app = app
+        self._lifespan_task: Optional[asyncio.Task] = None
+        self._lifespan_queue: Optional[asyncio.Queue] = None
+        self._lifespan_events: Optional[asyncio.Queue] = None
+
+    async def _lifespan(self, message_type: str):
+        if self._lifespan_task is None:
+            self._lifespan_queue = asyncio.Queue()
+            self._lifespan_events = asyncio.Queue()
+            scope = {"type": "lifespan", "asgi": {"version": "3.0"}, "state": {}}
+            self._lifespan_task = asyncio.create_task(
+                self.app(scope, self._lifespan_queue.get, self._lifespan_events.put)
+            )
+        await self._lifespan_queue.put({"type": message_type})
+        reply = await self._lifespan_events.get()
+        if reply["type"].endswith(".failed"):
+            raise RuntimeError(reply.get("message", message_type + " failed"))
+
+    async def startup(self):
+        await self._lifespan("lifespan.startup")
+
+    async def shutdown(self):
+        await self._lifespan("lifespan.shutdown")
+        await self._lifespan_task
+
+    async def request(self, method: str, path: str, body: Optional[dict] = None,
+                      headers: Tuple[Tuple[str, str], ...] = ()) -> Tuple[int, Dict[str, str], bytes]:
+        path, _, query = path.partition("?")
+        payload = json.dumps(body).encode() if body is not None else b""
+        raw_headers = [(b"host", b"bench"), (b"content-length", str(len(payload)).encode())]
+        if body is not None:
+            raw_headers.append((b"content-type", b"application/json"))
+        raw_headers.extend((k.lower().encode(), v.encode()) for k, v in headers)
+        scope = {
+            "type": "http",
+            "asgi": {"version": "3.0"},
+            "http_version": "1.1",
+            "method": method,
+            "scheme": "http",
+            "path": path,
+            "raw_path": path.encode(),
+            "query_string": query.encode(),
+            "root_path": "",
+            "headers": raw_headers,
+            "client": ("127.0.0.1", 50000),
+            "server": ("bench", 80),
+        }
+        done = asyncio.Event()
+        body_sent = False
+
+        async def receive():
+            nonlocal body_sent
+            if not body_sent:
+                body_sent = True
+                return {"type": "http.request", "body": payload, "more_body": False}
+            await done.wait()
+            return {"type": "http.disconnect"}
+
+        status = 0
+        response_headers = {}
+        chunks = []
+
+        async def send(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                response_headers.update(
+                    (k.decode().lower(), v.decode()) for k, v in message.get("headers", [])
+                )
+            elif message["type"] == "http.response.body":
+                chunks.append(message.get("body", b""))
+
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            done.set()
+        return status, response_headers, b"".join(chunks)
+
+
+# A scenario step returns (method, path, body, headers, expected statuses)
+Step = Tuple[str, str, Optional[dict], Tuple[Tuple[str, str], ...], Tuple[int, ...]]
+
+
+class Scenario:
+    def __init__(self, name: str, steps: List[Tuple[float, Callable[[random.Random], Step]]],
+                 setup: Optional[Callable] = None):
+        self.name = name
+        self.weights = [weight for weight, _ in steps]
+        self.factories = [factory for _, factory in steps]
+        self.setup = setup
+
+
+async def run_scenario(client: ASGIClient, scenario: Scenario, requests: int,
+                       concurrency: int, seed: int = 1234) -> dict:
+    context = {}
+    if scenario.setup is not None:
+        await scenario.setup(client, context)
+    rng = random.Random(seed)
+    plan = [rng.choices(scenario.factories, scenario.weights)[0] for _ in range(requests)]
+    steps = [factory(rng, context) for factory in plan]
+    latencies = []
+    errors = 0
+    position = 0
+
+    async def worker():
+        nonlocal errors, position
+        while position < len(steps):
+            method, path, body, headers, expected = steps[position]
+            position += 1
+            start = time.perf_counter()
+            status, _, _ = await client.request(method, path, body, headers)
+            latencies.append(time.perf_counter() - start)
+            if status not in expected:
+                errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return summarize(latencies, time.perf_counter() - started, errors)
+
+
+# ----- Scenario mixes -----
+
+PLAN_IDS = ("tourist-7d", "business-30d", "extended-90d")
+
+
+async def _catalog_setup(client, context):
+    _, headers, _ = await client.request("GET", "/api/packages")
+    context["etag"] = headers["etag"]
+
+
+CATALOG_BROWSE = Scenario("catalog_browse", [
+    (0.45, lambda rng, ctx: ("GET", "/api/packages", None, (), (200,))),
+    (0.25, lambda rng, ctx: ("GET", f"/api/packages/{rng.choice(PLAN_IDS)}", None, (), (200,))),
+    (0.20, lambda rng, ctx: ("GET", "/api/packages", None, (("If-None-Match", ctx["etag"]),), (304,))),
+    (0.10, lambda rng, ctx: ("GET", "/api/health", None, (), (200,))),
+], setup=_catalog_setup)
+
+
+LOGIN_USERS = 50
+
+
+async def _login_setup(client, context):
+    context["users"] = []
+    for i in range(LOGIN_USERS):
+        email = f"bench{i}@example.com"
+        await client.request("POST", "/api/auth/register", {
+            "email": email, "password": "bench-password", "full_name": "Bench", "phone": "0"
+        })
+        context["users"].append(email)
+
+
+LOGIN_STORM = Scenario("login_storm", [
+    (0.9, lambda rng, ctx: ("POST", "/api/auth/login",
+                            {"email": rng.choice(ctx["users"]), "password": "bench-password"}, (), (200,))),
+    (0.1, lambda rng, ctx: ("POST", "/api/auth/login",
+                            {"email": rng.choice(ctx["users"]), "password": "wrong-password"}, (), (401,))),
+], setup=_login_setup)
+
+
+ACTIVATION_BURST = Scenario("activation_burst", [
+    (1.0, lambda rng, ctx: ("POST", "/api/esim/activate", {
+        "plan_id": rng.choice(PLAN_IDS),
+        "device_imei": str(rng.randrange(10 ** 14, 10 ** 15)),
+        "customer_email": "burst@example.com",
+    }, (), (200,))),
+])
+
+
+SCENARIOS = {s.name: s for s in (CATALOG_BROWSE, LOGIN_STORM, ACTIVATION_BURST)}
+
+
+async def run_load(app, scenarios: List[str], requests: int, concurrency: int,
+                   warm_up: Optional[Callable] = None, repeat: int = 1) -> dict:
+    client = ASGIClient(app)
+    await client.startup()
+    # Measure steady state, not the background work startup leaves running
+    if warm_up is not None:
+        await warm_up()
+    try:
+        results = {}
+        for name in scenarios:
+            runs = [await run_scenario(client, SCENARIOS[name], requests, concurrency) for _ in range(repeat)]
+            results[name] = median_summary(runs)
+        return results
+    finally:
+        await client.shutdown()
@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+"""Run the API benchmark suite and compare the results against a stored baseline.
+
+    python benchmarks/run.py                     # micro + load, compare to baseline
+    python benchmarks/run.py --suite load --scenario login_storm
+    python benchmarks/run.py --update-baseline   # record a new baseline
+
+Everything runs in-process against in-memory storage; no network or database needed.
+Every benchmark is repeated (--repeat) and compared by the median of each figure.
+Each run also times a fixed reference workload; the baseline's figures are scaled
+by how fast this host ran it relative to the baseline's host before comparing, so
+a baseline recorded elsewhere (or on a busier machine) still gates regressions.
+Only throughput is gated by default: p99 from a few thousand in-process requests
+moves by multiples between identical runs. --latency-tolerance opts in to it.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import sys
+from typing import Optional
+from common import median_summary, reference_speed, setup_environment
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baselines", "default.json")
+
+
+def environment_info() -> dict:
+    return {
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "bcrypt_rounds": int(os.environ["BCRYPT_ROUNDS"]),
+    }
+
+
+def host_speed(baseline: dict, current: dict) -> float:
+    """How fast this run's host is relative to the baseline's, by the reference workload."""
+    return current["environment"]["reference_ops"] / baseline["environment"]["reference_ops"]
+
+
+def find_regressions(baseline: dict, current: dict, tolerance: float,
+                     latency_tolerance: Optional[float] = None, speed: float = 1.0):
+    """Compare against baseline figures scaled by speed (see host_speed)."""
+    regressions = []
+    for suite, entries in baseline.get("results", {}).items():
+        for name, expected in entries.items():
+            actual = current.get("results", {}).get(suite, {}).get(name)
+            if actual is None:
+                continue
+            label = f"{suite}.{name}"
+            throughput = round(expected["throughput"] * speed, 1)
+            p99_ms = round(expected["p99_ms"] / speed, 4)
+            if actual["throughput"] < throughput * (1 - tolerance):
+                regressions.append(
+                    f"{label}: throughput {actual['throughput']}/s < baseline {throughput}/s"
+                )
+            if latency_tolerance is not None and actual["p99_ms"] > p99_ms * (1 + latency_tolerance):
+                regressions.append(
+                    f"{label}: p99 {actual['p99_ms']}ms > baseline {p99_ms}ms"
+                )
+            if actual["errors"] > expected["errors"]:
+                regressions.append(f"{label}: {actual['errors']} errors (baseline {expected['errors']})")
+    return regressions
+
+
+def print_results(results: dict):
+    for suite, entries in results.items():
+        print(f"\n{suite.upper()}")
+        print(f"  {'name':28} {'ops/s':>12} {'p50 ms':>10} {'p95 ms':>10} {'p99 ms':>10} {'errors':>7}")
+        for name, r in entries.items():
+            print(f"  {name:28} {r['throughput']:>12} {r['p50_ms']:>10} {r['p95_ms']:>10} "
+                  f"{r['p99_ms']:>10} {r['errors']:>7}")
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="eSIM Myanmar API benchmarks")
+    parser.add_argument("--suite", choices=["micro", "load", "all"], default="all")
+    parser.add_argument("--scenario", action="append",
+                        help="Load scenario to run (repeatable); default is all")
+    parser.add_argument("--requests", type=int, default=2000, help="Requests per load scenario")
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--scale", type=float, default=1.0, help="Multiplier for micro iterations")
+    parser.add_argument("--repeat", type=int, default=5,
+                        help="Runs of each benchmark; the median of each figure is reported (default 5)")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    parser.add_argument("--update-baseline", action="store_true")
+    parser.add_argument("--tolerance", type=float, default=0.25,
+                        help="Allowed fractional throughput drop before failing")
+    parser.add_argument("--latency-tolerance", type=float,
+                        help="Also fail on a p99 increase beyond this fraction (default: p99 not gated)")
+    parser.add_argument("--output", help="Also write results JSON to this file")
+    args = parser.parse_args()
+
+    setup_environment()
+    from loadgen import SCENARIOS, run_load
+    from micro import run_micro
+
+    # Timed on both sides of the suites, so drift while they run is averaged in
+    reference_before = reference_speed()
+    results = {}
+    if args.suite in ("micro", "all"):
+        runs = [run_micro(args.scale) for _ in range(args.repeat)]
+        results["micro"] = {name: median_summary([run[name] for run in runs]) for name in runs[0]}
+    if args.suite in ("load", "all"):
+        from server import app, wait_until_warm
+        scenarios = args.scenario or list(SCENARIOS)
+        results["load"] = asyncio.run(
+            run_load(app, scenarios, args.requests, args.concurrency, wait_until_warm, args.repeat)
+        )
+
+    reference_ops = round((reference_before + reference_speed()) / 2, 1)
+    report = {"environment": dict(environment_info(), reference_ops=reference_ops), "results": results}
+    print_results(results)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+    if args.update_baseline:
+        os.makedirs(os.path.dirname(args.baseline), exist_ok=True)
+        with open(args.baseline, "w") as f:
+            json.dump(report, f, indent=2)
+            f.write("\n")
+        print(f"\nBaseline written to {args.baseline}")
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print(f"\nNo baseline at {args.baseline}; run with --update-baseline to create one")
+        return 0
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    if baseline.get("environment", {}).get("bcrypt_rounds") != report["environment"]["bcrypt_rounds"]:
+        print("\nBaseline was recorded with a different BCRYPT_ROUNDS; skipping comparison")
+        return 0
+    if not baseline["environment"].get("reference_ops"):
+        print("\nBaseline has no reference measurement to scale by; re-record it with --update-baseline")
+        return 1
+
+    speed = host_speed(baseline, report)
+    print(f"\nThis host ran the reference workload at {speed:.2f}x the baseline's speed; "
+          "baseline figures are scaled to match")
+    regressions = find_regressions(baseline, report, args.tolerance, args.latency_tolerance, speed)
+    if regressions:
+        print("\nREGRESSIONS:")
+        for regression in regressions:
+            print(f"  {regression}")
+        return 1
+    print("\nNo regressions against baseline")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
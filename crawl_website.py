@@ -0,0 +1,384 @@
+#!/usr/bin/env python3
+"""Fetch every URL in a sitemap concurrently and report status, TTFB, size and compression.
+
+    python crawl_website.py https://www.esim.com.mm/sitemap.xml
+    python crawl_website.py sitemap.xml --serve . --fallback frontend/public/index.html
+    python crawl_website.py https://staging.esim.com.mm/sitemap.xml -c 64 --jsonl results.jsonl
+
+Sitemaps (and sitemap indexes) are parsed incrementally while they download, and
+URLs go through a bounded queue, so memory stays flat however large the site is.
+--serve starts a local static server over a directory, standing in for nginx
+(try_files fallback, .gz siblings, gzip for text), and points the sitemap's
+URLs at it.
+"""
+
+from array import array
+from email.utils import formatdate
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+from typing import AsyncIterator, Callable, Optional, Tuple
+from urllib.parse import urlsplit, urlunsplit
+import argparse
+import asyncio
+import functools
+import gzip
+import heapq
+import json
+import multiprocessing
+import os
+import statistics
+import sys
+import time
+import xml.etree.ElementTree as ET
+
+import httpx
+
+SITEMAP_NS = "{http://www.sitemaps.org/schemas/sitemap/0.9}"
+USER_AGENT = "esim-myanmar-crawler/1.0"
+# Same thresholds as nginx's gzip settings
+COMPRESSIBLE_TYPES = ("text/", "application/xml", "application/json", "application/javascript",
+                      "application/rss+xml", "application/atom+xml")
+GZIP_MIN_LENGTH = 1024
+SLOWEST_SHOWN = 10
+FAILURES_KEPT = 100
+
+
+class StandInHandler(SimpleHTTPRequestHandler):
+    """Static files the way nginx serves them: try_files $uri $uri/ fallback, gzip_static, gzip"""
+
+    fallback: Optional[str] = None
+    # Keep-alive like nginx, so the crawler's connection pool is exercised
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_head(self):
+        path = self.translate_path(self.path)
+        if os.path.isdir(path):
+            path = os.path.join(path, "index.html")
+        if not os.path.isfile(path):
+            if self.fallback is None:
+                self.send_error(404, "File not found")
+                return None
+            path = self.fallback
+        content_type = self.guess_type(path)
+        encoding = None
+        accepts_gzip = "gzip" in self.headers.get("Accept-Encoding", "")
+        if accepts_gzip and os.path.isfile(path + ".gz"):
+            with open(path + ".gz", "rb") as f:
+                body = f.read()
+            encoding = "gzip"
+        else:
+            size = os.path.getsize(path)
+            if accepts_gzip and content_type.startswith(COMPRESSIBLE_TYPES) and size >= GZIP_MIN_LENGTH:
+                body = gzipped(path, os.path.getmtime(path))
+                encoding = "gzip"
+            else:
+                with open(path, "rb") as f:
+                    body = f.read()
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("Last-Modified", formatdate(os.path.getmtime(path), usegmt=True))
+        if encoding:
+            self.send_header("Content-Encoding", encoding)
+            self.send_header("Vary", "Accept-Encoding")
+        self.end_headers()
+        return _BytesReader(body)
+
+
+class _BytesReader:
+    """The file-like object SimpleHTTPRequestHandler copies into the socket"""
+
+    def __init__(self, body: bytes):
+        self.body = body
+
+    def read(self, size: int = -1) -> bytes:
+        body, self.body = self.body, b""
+        return body
+
+    def close(self):
+        pass
+
+
+@functools.lru_cache(maxsize=256)
+def gzipped(path: str, mtime: float) -> bytes:
+    with open(path, "rb") as f:
+        return gzip.compress(f.read(), 6)
+
+
+def serve_stand_in(directory: str, fallback: Optional[str], port_pipe):
+    handler = type("Handler", (StandInHandler,), {
+        "fallback": fallback,
+        "__init__": lambda self, *a, **kw: StandInHandler.__init__(self, *a, directory=directory, **kw),
+    })
+    # The default backlog of 5 drops connection bursts from the crawler's pool
+    server_class = type("Server", (ThreadingHTTPServer,), {"request_queue_size": 1024, "daemon_threads": True})
+    server = server_class(("127.0.0.1", 0), handler)
+    port_pipe.send(server.server_address[1])
+    port_pipe.close()
+    server.serve_forever()
+
+
+def start_stand_in(directory: str, fallback: Optional[str]) -> Tuple[multiprocessing.Process, int]:
+    """Serve directory from a child process, so the server doesn't compete with the crawler for the GIL"""
+    receiver, sender = multiprocessing.Pipe(duplex=False)
+    process = multiprocessing.Process(
+        target=serve_stand_in,
+        args=(os.path.abspath(directory), os.path.abspath(fallback) if fallback else None, sender),
+        daemon=True,
+    )
+    process.start()
+    return process, receiver.recv()
+
+
+def rebase(url: str, origin: Optional[str]) -> str:
+    """Point an absolute sitemap URL at origin, keeping path and query"""
+    if origin is None:
+        return url
+    parts = urlsplit(url)
+    target = urlsplit(origin)
+    return urlunsplit((target.scheme, target.netloc, parts.path, parts.query, ""))
+
+
+def sitemap_failure(source: str, error: Exception) -> dict:
+    """A result for a sitemap that couldn't be fetched or parsed, reported like a failed page"""
+    status = error.response.status_code if isinstance(error, httpx.HTTPStatusError) else None
+    return {"url": source, "status": status, "ttfb_ms": None, "total_ms": None, "bytes": 0,
+            "wire_bytes": 0, "encoding": None, "error": f"{type(error).__name__}: {error}"}
+
+
+async def iter_locs(client: httpx.AsyncClient, source: str, origin: Optional[str],
+                    on_error: Callable[[dict], None]) -> AsyncIterator[str]:
+    """Yield page URLs from a sitemap or sitemap index without holding the document.
+
+    A sitemap that can't be fetched or parsed goes to on_error; the parts of an
+    index that can still be read are crawled.
+    """
+    parser = ET.XMLPullParser(events=("start", "end"))
+    children = []
+    root = None
+
+    def drain():
+        nonlocal root
+        for event, element in parser.read_events():
+            if event == "start":
+                if root is None:
+                    root = element
+                continue
+            tag = element.tag
+            if tag in (SITEMAP_NS + "url", SITEMAP_NS + "sitemap"):
+                loc = element.findtext(SITEMAP_NS + "loc")
+                if loc:
+                    loc = rebase(loc.strip(), origin)
+                    if tag == SITEMAP_NS + "sitemap":
+                        children.append(loc)
+                    else:
+                        yield loc
+                # Detach handled entries from the root too, not just their contents;
+                # an entry still being parsed is finished by the parser all the same
+                root.clear()
+
+    try:
+        if source.startswith(("http://", "https://")):
+            async with client.stream("GET", source) as response:
+                response.raise_for_status()
+                async for chunk in response.aiter_bytes():
+                    parser.feed(chunk)
+                    for loc in drain():
+                        yield loc
+        else:
+            with open(source, "rb") as f:
+                for chunk in iter(lambda: f.read(1 << 16), b""):
+                    parser.feed(chunk)
+                    for loc in drain():
+                        yield loc
+        parser.close()
+        for loc in drain():
+            yield loc
+    except (httpx.HTTPError, ET.ParseError, OSError) as e:
+        on_error(sitemap_failure(source, e))
+        return
+    # Parts of a sitemap index, one after another
+    for child in children:
+        async for loc in iter_locs(client, child, origin, on_error):
+            yield loc
+
+
+async def fetch(client: httpx.AsyncClient, url: str) -> dict:
+    result = {"url": url, "status": None, "ttfb_ms": None, "total_ms": None,
+              "bytes": 0, "wire_bytes": 0, "encoding": None, "error": None}
+    start = time.perf_counter()
+    try:
+        async with client.stream("GET", url) as response:
+            # Headers are in: that's time to first byte, connection reuse included
+            result["ttfb_ms"] = round((time.perf_counter() - start) * 1000, 2)
+            result["status"] = response.status_code
+            result["encoding"] = response.headers.get("content-encoding")
+            async for chunk in response.aiter_bytes():
+                result["bytes"] += len(chunk)
+            result["wire_bytes"] = response.num_bytes_downloaded
+    except httpx.HTTPError as e:
+        result["error"] = f"{type(e).__name__}: {e}"
+    result["total_ms"] = round((time.perf_counter() - start) * 1000, 2)
+    return result
+
+
+class Report:
+    """Running totals; keeps only what the summary needs, not every result"""
+
+    def __init__(self):
+        self.count = 0
+        self.statuses = {}
+        self.ttfb = array("d")
+        self.bytes = 0
+        self.wire_bytes = 0
+        self.uncompressed = 0
+        self.slowest = []
+        self.failures = []
+        self.failure_count = 0
+
+    def add(self, result: dict):
+        self.count += 1
+        key = str(result["status"] or "error")
+        self.statuses[key] = self.statuses.get(key, 0) + 1
+        if result["error"] or result["status"] >= 400:
+            self.failure_count += 1
+            if len(self.failures) < FAILURES_KEPT:
+                self.failures.append(result)
+            return
+        self.ttfb.append(result["ttfb_ms"])
+        self.bytes += result["bytes"]
+        self.wire_bytes += result["wire_bytes"]
+        if not result["encoding"] and result["bytes"] >= GZIP_MIN_LENGTH:
+            self.uncompressed += 1
+        entry = (result["ttfb_ms"], result["url"])
+        if len(self.slowest) < SLOWEST_SHOWN:
+            heapq.heappush(self.slowest, entry)
+        else:
+            heapq.heappushpop(self.slowest, entry)
+
+    def summary(self, elapsed: float) -> dict:
+        ttfb = sorted(self.ttfb)
+        pick = lambda q: round(ttfb[min(len(ttfb) - 1, int(q * len(ttfb)))], 2) if ttfb else None
+        return {
+            "urls": self.count,
+            "elapsed_s": round(elapsed, 2),
+            "statuses": self.statuses,
+            "ttfb_ms": {"p50": pick(0.5), "p95": pick(0.95), "max": pick(1.0),
+                        "mean": round(statistics.fmean(ttfb), 2) if ttfb else None},
+            "bytes": self.bytes,
+            "wire_bytes": self.wire_bytes,
+            "uncompressed_responses": self.uncompressed,
+            "slowest": [{"url": url, "ttfb_ms": ms} for ms, url in sorted(self.slowest, reverse=True)],
+            "failures": self.failure_count,
+        }
+
+
+async def crawl(sitemap: str, concurrency: int, timeout: float, origin: Optional[str] = None,
+                limit: Optional[int] = None, jsonl=None, verbose: bool = False) -> Report:
+    report = Report()
+    queue: asyncio.Queue = asyncio.Queue(maxsize=concurrency * 4)
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    headers = {"User-Agent": USER_AGENT, "Accept-Encoding": "gzip, deflate"}
+
+    async with httpx.AsyncClient(limits=limits, timeout=timeout, headers=headers,
+                                 follow_redirects=False) as client:
+        def record(result: dict):
+            report.add(result)
+            if jsonl is not None:
+                jsonl.write(json.dumps(result) + "\n")
+            if verbose:
+                print(f"{result['status'] or 'ERR':>4} {result['ttfb_ms'] or 0:>8.1f} ms "
+                      f"{result['wire_bytes']:>9} B {result['encoding'] or '-':>7}  {result['url']}")
+
+        async def worker():
+            while True:
+                url = await queue.get()
+                if url is None:
+                    return
+                record(await fetch(client, url))
+
+        workers = [asyncio.create_task(worker()) for _ in range(concurrency)]
+        try:
+            queued = 0
+            if sitemap.startswith(("http://", "https://")):
+                sitemap = rebase(sitemap, origin)
+            async for loc in iter_locs(client, sitemap, origin, record):
+                await queue.put(loc)
+                queued += 1
+                if limit is not None and queued >= limit:
+                    break
+            for _ in workers:
+                await queue.put(None)
+            await asyncio.gather(*workers)
+        finally:
+            for task in workers:
+                task.cancel()
+    return report
+
+
+def print_summary(summary: dict, failures: list):
+    print("=== SITE CRAWL ===")
+    print(f"URLs: {summary['urls']} in {summary['elapsed_s']} s")
+    print("Statuses: " + ", ".join(f"{k}={v}" for k, v in sorted(summary["statuses"].items())))
+    ttfb = summary["ttfb_ms"]
+    print(f"TTFB ms: p50 {ttfb['p50']}  p95 {ttfb['p95']}  max {ttfb['max']}  mean {ttfb['mean']}")
+    ratio = f" ({summary['wire_bytes'] / summary['bytes']:.0%} on the wire)" if summary["bytes"] else ""
+    print(f"Bytes: {summary['bytes']} decoded, {summary['wire_bytes']} transferred{ratio}")
+    print(f"Uncompressed responses over {GZIP_MIN_LENGTH} bytes: {summary['uncompressed_responses']}")
+    if summary["slowest"]:
+        print("\nSlowest (TTFB):")
+        for row in summary["slowest"]:
+            print(f"  {row['ttfb_ms']:>8.1f} ms  {row['url']}")
+    if failures:
+        print(f"\nFailures ({summary['failures']}):")
+        for result in failures:
+            print(f"  ✗ {result['status'] or result['error']}  {result['url']}")
+    else:
+        print("\n✓ All URLs returned successfully")
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Concurrent sitemap crawler")
+    parser.add_argument("sitemap", help="Sitemap URL or local file")
+    parser.add_argument("-c", "--concurrency", type=int, default=32, help="Requests in flight (default 32)")
+    parser.add_argument("--timeout", type=float, default=10.0)
+    parser.add_argument("--limit", type=int, help="Stop after this many URLs")
+    parser.add_argument("--origin", help="Fetch sitemap URLs from this scheme://host instead")
+    parser.add_argument("--serve", metavar="DIR", help="Serve DIR locally and crawl that instead")
+    parser.add_argument("--fallback", help="With --serve: file returned for paths that don't exist")
+    parser.add_argument("--jsonl", help="Write one JSON result per URL to this file")
+    parser.add_argument("--json", dest="json_path", help="Write the summary to this file")
+    parser.add_argument("-v", "--verbose", action="store_true", help="Print every URL as it completes")
+    args = parser.parse_args()
+
+    origin = args.origin
+    server = None
+    if args.serve:
+        server, port = start_stand_in(args.serve, args.fallback)
+        origin = f"http://127.0.0.1:{port}"
+        print(f"Serving {args.serve} on {origin}")
+
+    jsonl = open(args.jsonl, "w") if args.jsonl else None
+    start = time.perf_counter()
+    try:
+        report = asyncio.run(crawl(args.sitemap, args.concurrency, args.timeout, origin,
+                                   args.limit, jsonl, args.verbose))
+    finally:
+        if jsonl is not None:
+            jsonl.close()
+        if server is not None:
+            server.terminate()
+
+    summary = report.summary(time.perf_counter() - start)
+    print_summary(summary, report.failures)
+    if args.json_path:
+        with open(args.json_path, "w") as f:
+            json.dump(dict(summary, failed_urls=report.failures), f, indent=2)
+    return 1 if report.failure_count else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
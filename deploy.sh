@@ -71,7 +71,15 @@ Type=simple
 User=www-data
 WorkingDirectory=/var/www/esim-myanmar/backend
 Environment=PATH=/usr/local/bin:/usr/bin:/bin
-ExecStart=/usr/local/bin/uvicorn server:app --host 0.0.0.0 --port $BACKEND_PORT
+Environment=PORT=$BACKEND_PORT
+# Shared state in the local MongoDB, so the launcher can run one worker per core
+Environment=MONGO_URL=mongodb://localhost:27017
+Environment=RATE_LIMIT_BACKEND=mongo
+ExecStart=/usr/bin/python3 launcher.py --host 0.0.0.0
+# SIGHUP: zero-downtime rolling reload onto the deployed code
+ExecReload=/bin/kill -HUP \$MAINPID
+KillSignal=SIGTERM
+TimeoutStopSec=45
 Restart=always
 RestartSec=10
 
@@ -106,6 +114,8 @@ sudo sed -i "s|/path/to/key.pem|/etc/ssl/certs/esim-myanmar/key.pem|g" /etc/ngin
 # Create web directory
 sudo mkdir -p /var/www/esim-myanmar
 sudo cp -r . /var/www/esim-myanmar/
+# Sitemap, RSS and Atom from the live catalog, plus their .gz copies
+sudo python3 /var/www/esim-myanmar/generate_seo.py --output /var/www/esim-myanmar/seo
 sudo chown -R www-data:www-data /var/www/esim-myanmar
 
 # Start and enable services
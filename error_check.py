@@ -2,189 +2,306 @@
 
 import os
 import sys
+import glob
 import json
-import subprocess
+import time
+import hashlib
+import argparse
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from pathlib import Path
 
-def check_file_permissions():
+# Results of checks whose input files did not change since the last run
+CACHE_FILE = '.error_check_cache.json'
+
+CRITICAL_FILES = ['deploy.sh', 'backend/server.py', 'nginx.conf', 'README.md']
+# Patterns are expanded against --root, so new modules and scripts are checked without listing them
+PYTHON_FILES = ['backend/*.py', '*.py']
+JS_FILES = ['frontend/src/App.js', 'frontend/src/components/ContactForm.js', 'frontend/src/components/LoginForm.js']
+CONFIG_FILES = ['nginx.conf', 'frontend/package.json']
+DEPENDENCY_FILES = ['backend/requirements.txt']
+SENSITIVE_FILES = ['backend/server.py', 'backend/auth.py']
+COMPANY_FILES = ['README.md', 'frontend/src/App.js', 'backend/server.py']
+
+
+class Workspace:
+    """Reads each file at most once per run, shared by every check"""
+
+    def __init__(self, root='.'):
+        self.root = root
+        self._contents = {}
+        self._lock = threading.Lock()
+
+    def read(self, file_path):
+        """File contents as text, or None if the file does not exist"""
+        with self._lock:
+            if file_path not in self._contents:
+                try:
+                    with open(os.path.join(self.root, file_path), 'rb') as f:
+                        self._contents[file_path] = f.read().decode('utf-8', errors='replace')
+                except FileNotFoundError:
+                    self._contents[file_path] = None
+            return self._contents[file_path]
+
+    def exists(self, file_path):
+        return self.read(file_path) is not None
+
+    def expand(self, paths):
+        """Paths with glob patterns replaced by the files they match, in a stable order"""
+        expanded = []
+        for pattern in paths:
+            if glob.has_magic(pattern):
+                expanded.extend(sorted(glob.glob(pattern, root_dir=self.root)))
+            else:
+                expanded.append(pattern)
+        return expanded
+
+    def fingerprint(self, paths):
+        """Content hash of every input file; missing files hash differently from empty ones"""
+        digest = hashlib.sha256()
+        for file_path in self.expand(paths):
+            content = self.read(file_path)
+            digest.update(file_path.encode())
+            digest.update(b'\0' if content is None else b'\1' + content.encode('utf-8'))
+        return digest.hexdigest()
+
+
+def check_file_permissions(ws):
     """Check critical file permissions"""
     errors = []
-    
-    critical_files = [
-        'deploy.sh',
-        'backend/server.py',
-        'nginx.conf',
-        'README.md'
-    ]
-    
-    for file_path in critical_files:
-        if os.path.exists(file_path):
-            stat = os.stat(file_path)
+
+    for file_path in CRITICAL_FILES:
+        full_path = os.path.join(ws.root, file_path)
+        if os.path.exists(full_path):
+            stat = os.stat(full_path)
             if file_path == 'deploy.sh' and not (stat.st_mode & 0o111):
                 errors.append(f"deploy.sh not executable")
         else:
             errors.append(f"Missing critical file: {file_path}")
-    
+
     return errors
 
-def check_syntax_errors():
+def python_syntax_error(py_file, content):
+    """Error message if content doesn't compile, else None; runs in a worker process"""
+    try:
+        compile(content, py_file, 'exec')
+    except SyntaxError as e:
+        return f"Python syntax error in {py_file}: {e}"
+    return None
+
+def check_syntax_errors(ws):
     """Check for syntax errors in Python and JavaScript files"""
     errors = []
-    
-    # Check Python files
-    python_files = ['backend/server.py', 'backend/auth.py', 'test_api.py', 'validate_website.py']
-    for py_file in python_files:
-        if os.path.exists(py_file):
-            try:
-                with open(py_file, 'r') as f:
-                    compile(f.read(), py_file, 'exec')
-            except SyntaxError as e:
-                errors.append(f"Python syntax error in {py_file}: {e}")
-    
+
+    # Check Python files. compile() holds the GIL, so the files are spread over
+    # processes rather than the threads the checks themselves run on
+    sources = [(py_file, ws.read(py_file)) for py_file in ws.expand(PYTHON_FILES)]
+    sources = [(py_file, content) for py_file, content in sources if content is not None]
+    workers = min(len(sources), os.cpu_count() or 1)
+    if workers > 1:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(python_syntax_error, *zip(*sources), chunksize=4))
+    else:
+        results = [python_syntax_error(py_file, content) for py_file, content in sources]
+    errors.extend(error for error in results if error)
+
     # Check JavaScript files
-    js_files = ['frontend/src/App.js', 'frontend/src/components/ContactForm.js', 'frontend/src/components/LoginForm.js']
-    for js_file in js_files:
-        if os.path.exists(js_file):
-            with open(js_file, 'r') as f:
-                content = f.read()
-                if 'import' not in content and 'export' not in content:
-                    errors.append(f"JavaScript file {js_file} missing import/export")
-    
+    for js_file in JS_FILES:
+        content = ws.read(js_file)
+        if content is not None and 'import' not in content and 'export' not in content:
+            errors.append(f"JavaScript file {js_file} missing import/export")
+
     return errors
 
-def check_configuration_errors():
+def check_configuration_errors(ws):
     """Check configuration file errors"""
     errors = []
-    
+
     # Check nginx.conf
-    if os.path.exists('nginx.conf'):
-        with open('nginx.conf', 'r') as f:
-            nginx_content = f.read()
-            if 'server_name' not in nginx_content:
-                errors.append("nginx.conf missing server_name")
-            if 'ssl_certificate' not in nginx_content:
-                errors.append("nginx.conf missing SSL configuration")
-    
+    nginx_content = ws.read('nginx.conf')
+    if nginx_content is not None:
+        if 'server_name' not in nginx_content:
+            errors.append("nginx.conf missing server_name")
+        if 'ssl_certificate' not in nginx_content:
+            errors.append("nginx.conf missing SSL configuration")
+
     # Check package.json
-    if os.path.exists('frontend/package.json'):
+    package_json = ws.read('frontend/package.json')
+    if package_json is not None:
         try:
-            with open('frontend/package.json', 'r') as f:
-                package_data = json.load(f)
-                if 'scripts' not in package_data:
-                    errors.append("frontend/package.json missing scripts")
+            package_data = json.loads(package_json)
+            if 'scripts' not in package_data:
+                errors.append("frontend/package.json missing scripts")
         except json.JSONDecodeError:
             errors.append("frontend/package.json invalid JSON")
-    
+
     return errors
 
-def check_api_dependencies():
+def check_api_dependencies(ws):
     """Check API and dependency errors"""
     errors = []
-    
+
     # Check requirements.txt
-    if os.path.exists('backend/requirements.txt'):
-        with open('backend/requirements.txt', 'r') as f:
-            requirements = f.read()
-            required_packages = ['fastapi', 'uvicorn', 'pydantic', 'passlib', 'python-jose']
-            for package in required_packages:
-                if package not in requirements:
-                    errors.append(f"Missing required package: {package}")
+    requirements = ws.read('backend/requirements.txt')
+    if requirements is not None:
+        required_packages = ['fastapi', 'uvicorn', 'pydantic', 'passlib', 'python-jose']
+        for package in required_packages:
+            if package not in requirements:
+                errors.append(f"Missing required package: {package}")
     else:
         errors.append("Missing backend/requirements.txt")
-    
+
     return errors
 
-def check_security_issues():
+def check_security_issues(ws):
     """Check for security configuration issues"""
     errors = []
-    
+
     # Check for hardcoded secrets
-    sensitive_files = ['backend/server.py', 'backend/auth.py']
-    for file_path in sensitive_files:
-        if os.path.exists(file_path):
-            with open(file_path, 'r') as f:
-                content = f.read()
-                if 'password' in content.lower() and '=' in content:
-                    lines = content.split('\n')
-                    for i, line in enumerate(lines):
-                        if 'password' in line.lower() and '=' in line and not line.strip().startswith('#'):
-                            if '"' in line or "'" in line:
-                                errors.append(f"Potential hardcoded password in {file_path}:{i+1}")
-    
+    for file_path in SENSITIVE_FILES:
+        content = ws.read(file_path)
+        if content is not None and 'password' in content.lower() and '=' in content:
+            lines = content.split('\n')
+            for i, line in enumerate(lines):
+                if 'password' in line.lower() and '=' in line and not line.strip().startswith('#'):
+                    if '"' in line or "'" in line:
+                        errors.append(f"Potential hardcoded password in {file_path}:{i+1}")
+
     # Check CORS configuration
-    if os.path.exists('backend/server.py'):
-        with open('backend/server.py', 'r') as f:
-            content = f.read()
-            if 'allow_origins=["*"]' in content:
-                errors.append("CORS allows all origins - security risk")
-    
+    content = ws.read('backend/server.py')
+    if content is not None and 'allow_origins=["*"]' in content:
+        errors.append("CORS allows all origins - security risk")
+
     return errors
 
-def check_company_information():
+def check_company_information(ws):
     """Verify company information consistency"""
     errors = []
-    
+
     company_name = "ESIM MYANMAR COMPANY LIMITED"
     phone = "(+95) 96 50000172"
     website = "https://www.esim.com.mm"
     email = "info@esim.com.mm"
-    
-    files_to_check = [
-        'README.md',
-        'frontend/src/App.js',
-        'backend/server.py'
-    ]
-    
-    for file_path in files_to_check:
-        if os.path.exists(file_path):
-            with open(file_path, 'r') as f:
-                content = f.read()
-                if company_name not in content:
-                    errors.append(f"Company name missing in {file_path}")
-                if website not in content and file_path != 'backend/server.py':
-                    errors.append(f"Website URL missing in {file_path}")
-    
+
+    for file_path in COMPANY_FILES:
+        content = ws.read(file_path)
+        if content is not None:
+            if company_name not in content:
+                errors.append(f"Company name missing in {file_path}")
+            if website not in content and file_path != 'backend/server.py':
+                errors.append(f"Website URL missing in {file_path}")
+
     return errors
 
-def run_all_checks():
-    """Run all error checks"""
+# (name, function, input files). Checks with no input files always run; the
+# permissions check depends on file modes, which the content hash doesn't see.
+CHECKS = [
+    ("File Permissions", check_file_permissions, None),
+    ("Syntax Errors", check_syntax_errors, PYTHON_FILES + JS_FILES),
+    ("Configuration", check_configuration_errors, CONFIG_FILES),
+    ("Dependencies", check_api_dependencies, DEPENDENCY_FILES),
+    ("Security Issues", check_security_issues, SENSITIVE_FILES),
+    ("Company Information", check_company_information, COMPANY_FILES),
+]
+
+def load_cache(path):
+    try:
+        with open(path, 'r') as f:
+            cache = json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+    # Any edit to the checks themselves invalidates every cached result
+    return cache.get('results', {}) if cache.get('checker') == checker_version() else {}
+
+def save_cache(path, results):
+    with open(path + '.tmp', 'w') as f:
+        json.dump({'checker': checker_version(), 'results': results}, f, indent=1)
+    os.replace(path + '.tmp', path)
+
+def checker_version():
+    return hashlib.sha256(Path(__file__).read_bytes()).hexdigest()[:16]
+
+def run_check(ws, cache, name, func, inputs):
+    """Run one check, or reuse its cached errors; returns a result dict"""
+    start = time.perf_counter()
+    fingerprint = ws.fingerprint(inputs) if inputs else None
+    cached = cache.get(name)
+    if fingerprint is not None and cached and cached.get('fingerprint') == fingerprint:
+        errors, from_cache = cached['errors'], True
+    else:
+        errors, from_cache = func(ws), False
+    return {
+        'name': name,
+        'errors': errors,
+        'cached': from_cache,
+        'fingerprint': fingerprint,
+        'duration_ms': round((time.perf_counter() - start) * 1000, 3),
+    }
+
+def run_checks(root='.', use_cache=True, jobs=None):
+    """Run every check in parallel; returns results in CHECKS order"""
+    ws = Workspace(root)
+    cache_path = os.path.join(root, CACHE_FILE)
+    cache = load_cache(cache_path) if use_cache else {}
+    with ThreadPoolExecutor(max_workers=jobs or len(CHECKS)) as pool:
+        futures = [pool.submit(run_check, ws, cache, name, func, inputs) for name, func, inputs in CHECKS]
+        results = [future.result() for future in futures]
+    if use_cache:
+        save_cache(cache_path, {r['name']: {'fingerprint': r['fingerprint'], 'errors': r['errors']}
+                                for r in results if r['fingerprint'] is not None})
+    return results
+
+def print_report(results):
     print("ERROR CHECK REPORT")
     print("Company: ESIM MYANMAR COMPANY LIMITED")
     print("Website: https://www.esim.com.mm")
     print("=" * 50)
-    
+
     all_errors = []
-    
-    checks = [
-        ("File Permissions", check_file_permissions),
-        ("Syntax Errors", check_syntax_errors),
-        ("Configuration", check_configuration_errors),
-        ("Dependencies", check_api_dependencies),
-        ("Security Issues", check_security_issues),
-        ("Company Information", check_company_information)
-    ]
-    
-    for check_name, check_func in checks:
-        print(f"\n{check_name}:")
-        errors = check_func()
-        if errors:
-            for error in errors:
+
+    for result in results:
+        print(f"\n{result['name']}:")
+        if result['errors']:
+            for error in result['errors']:
                 print(f"  ERROR: {error}")
-                all_errors.append(f"{check_name}: {error}")
+                all_errors.append(f"{result['name']}: {error}")
         else:
             print("  PASS: No errors found")
-    
+
     print(f"\n{'='*50}")
     print(f"TOTAL ERRORS: {len(all_errors)}")
-    
+
     if all_errors:
         print("\nERRORS SUMMARY:")
         for i, error in enumerate(all_errors, 1):
             print(f"{i}. {error}")
-        return 1
     else:
         print("STATUS: ALL CHECKS PASSED")
-        return 0
+
+def run_all_checks(argv=None):
+    """Run all error checks"""
+    parser = argparse.ArgumentParser(description="Repository error checks")
+    parser.add_argument('--json', action='store_true', help="Print results and per-check timings as JSON")
+    parser.add_argument('--no-cache', action='store_true', help=f"Ignore and don't update {CACHE_FILE}")
+    parser.add_argument('--jobs', type=int, help="Checks to run at once (default: all)")
+    parser.add_argument('--root', default='.', help="Repository root")
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+    results = run_checks(args.root, use_cache=not args.no_cache, jobs=args.jobs)
+    total_errors = sum(len(r['errors']) for r in results)
+
+    if args.json:
+        for result in results:
+            del result['fingerprint']
+        print(json.dumps({
+            'total_errors': total_errors,
+            'duration_ms': round((time.perf_counter() - start) * 1000, 3),
+            'checks': results,
+        }, indent=2))
+    else:
+        print_report(results)
+    return 1 if total_errors else 0
 
 if __name__ == "__main__":
-    sys.exit(run_all_checks())
\ No newline at end of file
+    sys.exit(run_all_checks())
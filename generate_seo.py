@@ -0,0 +1,414 @@
+#!/usr/bin/env python3
+"""Render sitemap.xml, rss.xml and atom.xml from seo/pages.xml and the plan catalog.
+
+    python generate_seo.py                          # refresh seo/ (what nginx serves)
+    python generate_seo.py --output /var/www/esim-myanmar/seo --extra-urls pages.txt
+
+The sitemap lists the pages in seo/pages.xml, each with only those hreflang
+alternates that are pages too; the feeds carry one item per catalog plan.
+Sitemaps are written as a stream and split behind a sitemap index past 50,000 URLs.
+Every artifact also gets a .gz sibling (and .br when the brotli package is
+installed) for nginx's gzip_static. Files whose content did not change are
+left untouched, and a page's lastmod only moves when its source data does.
+"""
+
+from datetime import datetime, timezone
+from typing import Dict, Iterator, List, Optional, Tuple
+from xml.sax.saxutils import escape, quoteattr
+import argparse
+import gzip
+import hashlib
+import json
+import os
+import re
+import shutil
+import sys
+import tempfile
+import xml.etree.ElementTree as ET
+
+try:
+    import brotli
+except ImportError:  # optional; only .gz siblings are written without it
+    brotli = None
+
+ROOT_DIR = os.path.dirname(os.path.abspath(__file__))
+# nginx serves seo/; the older copies at the repo root are only written when asked for
+DEFAULT_OUTPUTS = [os.path.join(ROOT_DIR, "seo")]
+PAGES_PATH = os.path.join(ROOT_DIR, "seo", "pages.xml")
+TEMPLATES_PATH = os.path.join(ROOT_DIR, "seo", "seo-templates.js")
+MANIFEST_NAME = ".seo-manifest.json"
+
+# Sitemap protocol limits per file
+SITEMAP_MAX_URLS = 50000
+SITEMAP_MAX_BYTES = 50 * 1024 * 1024
+SITEMAP_NS = "http://www.sitemaps.org/schemas/sitemap/0.9"
+XHTML_NS = "http://www.w3.org/1999/xhtml"
+IMAGE_NS = "http://www.google.com/schemas/sitemap-image/1.1"
+ATOM_NS = "http://www.w3.org/2005/Atom"
+
+# Pages whose content includes the company details
+COMPANY_PAGES = ("/", "/about", "/contact")
+
+
+class Page:
+    __slots__ = ("loc", "changefreq", "priority", "alternates", "images", "digest")
+
+    def __init__(self, loc: str, changefreq: str, priority: str, source,
+                 alternates: List[Tuple[str, str]] = (), images: List[Dict[str, str]] = ()):
+        self.loc = loc
+        self.changefreq = changefreq
+        self.priority = priority
+        # (hreflang, href)
+        self.alternates = list(alternates)
+        # {"loc", "title", "caption"}
+        self.images = list(images)
+        # lastmod moves only when this changes
+        self.digest = hashlib.sha256(json.dumps(source, sort_keys=True, default=str).encode()).hexdigest()[:16]
+
+
+def load_pages(company: dict, path: str = PAGES_PATH) -> Tuple[str, List[Page]]:
+    """Site base URL and the listed pages; alternates pointing at unlisted pages are dropped."""
+    ns = {"s": SITEMAP_NS, "x": XHTML_NS, "i": IMAGE_NS}
+    entries = []
+    for url in ET.parse(path).getroot().findall("s:url", ns):
+        entries.append({
+            "loc": url.findtext("s:loc", namespaces=ns).strip(),
+            "changefreq": url.findtext("s:changefreq", "monthly", ns).strip(),
+            "priority": url.findtext("s:priority", "0.5", ns).strip(),
+            "alternates": [(link.get("hreflang"), link.get("href")) for link in url.findall("x:link", ns)
+                           if link.get("rel") == "alternate"],
+            "images": [{field: image.findtext(f"i:{field}", "", ns).strip() for field in ("loc", "title", "caption")}
+                       for image in url.findall("i:image", ns)],
+        })
+    if not entries:
+        raise ValueError(f"No pages listed in {path}")
+    listed = {entry["loc"] for entry in entries}
+    scheme, _, rest = entries[0]["loc"].partition("://")
+    base = f"{scheme}://{rest.split('/', 1)[0]}"
+    pages = []
+    for entry in entries:
+        entry["alternates"] = [(lang, href) for lang, href in entry["alternates"] if href in listed]
+        path = entry["loc"][len(base):].rstrip("/") or "/"
+        source = {**entry, "company": company} if path in COMPANY_PAGES else entry
+        pages.append(Page(entry["loc"], entry["changefreq"], entry["priority"], source,
+                          entry["alternates"], entry["images"]))
+    return base, pages
+
+
+def load_catalog():
+    """The plans and company info exactly as the API serves them."""
+    sys.path.insert(0, os.path.join(ROOT_DIR, "backend"))
+    from server import COMPANY_INFO, catalog
+    return catalog.plans, COMPANY_INFO
+
+
+def load_product_templates(path: str = TEMPLATES_PATH) -> Dict[str, str]:
+    with open(path, "r", encoding="utf-8") as f:
+        source = f.read()
+    match = re.search(r'product:\s*{\s*en:\s*{\s*title:\s*"([^"]*)",\s*description:\s*"([^"]*)"', source)
+    if match is None:
+        raise ValueError(f"No product.en templates found in {path}")
+    return {"title": match.group(1), "description": match.group(2)}
+
+
+def user_type(plan) -> str:
+    if plan.duration_days <= 7:
+        return "tourists and short trips"
+    if plan.duration_days <= 30:
+        return "business travelers"
+    return "extended stays and residents"
+
+
+def render_template(template: str, plan) -> str:
+    values = {
+        "planName": plan.name,
+        "dataAmount": f"{plan.data_gb}GB",
+        "price": f"${plan.price_usd}",
+        "duration": f"{plan.duration_days} days",
+        "userType": user_type(plan),
+        "speed": "4G/5G",
+    }
+    return re.sub(r"{(\w+)}", lambda m: values.get(m.group(1), m.group(0)), template)
+
+
+def iter_pages(pages: List[Page], base: str, extra_urls: Optional[str]) -> Iterator[Page]:
+    yield from pages
+    if extra_urls:
+        # One path per line, optionally followed by changefreq and priority
+        with open(extra_urls, "r", encoding="utf-8") as f:
+            for line in f:
+                fields = line.split()
+                if fields and not fields[0].startswith("#"):
+                    path, changefreq, priority = (fields + ["monthly", "0.5"])[:3]
+                    yield Page(base + path, changefreq, priority, path)
+
+
+def iso(moment: datetime) -> str:
+    return moment.strftime("%Y-%m-%dT%H:%M:%S+00:00")
+
+
+def rfc822(moment: datetime) -> str:
+    return moment.strftime("%a, %d %b %Y %H:%M:%S +0000")
+
+
+class PageHistory:
+    """First-seen and last-modified times per page, carried between runs."""
+
+    def __init__(self, previous: Dict[str, list], now: datetime):
+        self.previous = previous
+        self.current: Dict[str, list] = {}
+        self.now = now.strftime("%Y-%m-%dT%H:%M:%S")
+
+    def touch(self, key: str, digest: str) -> Tuple[datetime, datetime]:
+        previous_digest, lastmod, first_seen = self.previous.get(key) or (None, self.now, self.now)
+        if previous_digest != digest:
+            lastmod = self.now
+        self.current[key] = [digest, lastmod, first_seen]
+        parse = lambda value: datetime.strptime(value, "%Y-%m-%dT%H:%M:%S")
+        return parse(lastmod), parse(first_seen)
+
+
+class SitemapWriter:
+    """Streams <url> entries into parts of at most 50,000 URLs / 50 MB each."""
+
+    def __init__(self, staging: str, base_url: str):
+        self.staging = staging
+        # Where the index points at the parts
+        self.base_url = base_url
+        self.parts: List[Tuple[str, datetime]] = []
+        self._file = None
+        self._count = 0
+        self._bytes = 0
+        self._latest: Optional[datetime] = None
+
+    def _open(self):
+        name = f"sitemap-{len(self.parts) + 1}.xml"
+        self._file = open(os.path.join(self.staging, name), "w", encoding="utf-8")
+        self._write(f'<?xml version="1.0" encoding="UTF-8"?>\n'
+                    f'<urlset xmlns="{SITEMAP_NS}" xmlns:xhtml="{XHTML_NS}" xmlns:image="{IMAGE_NS}">\n')
+        self.parts.append((name, None))
+        self._count = 0
+
+    def _write(self, text: str):
+        self._file.write(text)
+        self._bytes += len(text.encode("utf-8"))
+
+    def _close_part(self):
+        self._write("</urlset>\n")
+        self._file.close()
+        self._file = None
+        self.parts[-1] = (self.parts[-1][0], self._latest)
+        self._bytes = 0
+        self._latest = None
+
+    def add(self, page: Page, lastmod: datetime):
+        alternates = "".join(
+            f'    <xhtml:link rel="alternate" hreflang={quoteattr(lang)} href={quoteattr(href)}/>\n'
+            for lang, href in page.alternates
+        )
+        images = "".join(
+            "    <image:image>\n"
+            + "".join(f"      <image:{field}>{escape(image[field])}</image:{field}>\n"
+                      for field in ("loc", "title", "caption") if image.get(field))
+            + "    </image:image>\n"
+            for image in page.images
+        )
+        entry = (f"  <url>\n    <loc>{escape(page.loc)}</loc>\n"
+                 f"    <lastmod>{iso(lastmod)}</lastmod>\n"
+                 f"    <changefreq>{page.changefreq}</changefreq>\n"
+                 f"    <priority>{page.priority}</priority>\n{alternates}{images}  </url>\n")
+        if self._file is not None and (self._count >= SITEMAP_MAX_URLS or
+                                       self._bytes + len(entry) > SITEMAP_MAX_BYTES - 64):
+            self._close_part()
+        if self._file is None:
+            self._open()
+        self._write(entry)
+        self._count += 1
+        self._latest = max(self._latest or lastmod, lastmod)
+
+    def close(self) -> List[str]:
+        """Finish writing; returns the staged file names."""
+        if self._file is None and not self.parts:
+            self._open()
+        if self._file is not None:
+            self._close_part()
+        if len(self.parts) == 1:
+            os.replace(os.path.join(self.staging, self.parts[0][0]), os.path.join(self.staging, "sitemap.xml"))
+            return ["sitemap.xml"]
+        with open(os.path.join(self.staging, "sitemap.xml"), "w", encoding="utf-8") as f:
+            f.write(f'<?xml version="1.0" encoding="UTF-8"?>\n<sitemapindex xmlns="{SITEMAP_NS}">\n')
+            for name, latest in self.parts:
+                f.write(f"  <sitemap>\n    <loc>{escape(self.base_url + '/' + name)}</loc>\n"
+                        f"    <lastmod>{iso(latest)}</lastmod>\n  </sitemap>\n")
+            f.write("</sitemapindex>\n")
+        return ["sitemap.xml"] + [name for name, _ in self.parts]
+
+
+def write_xml(root: ET.Element, path: str):
+    ET.indent(root, space="  ")
+    with open(path, "wb") as f:
+        f.write(ET.tostring(root, encoding="utf-8", xml_declaration=True))
+        f.write(b"\n")
+
+
+def plan_link(base: str, plan) -> Tuple[str, str]:
+    """(link, guid) for a plan's feed item; plans have no page of their own, so the
+    link is the plans listing and the guid is unique per plan."""
+    return f"{base}/plans", f"{base}/plans#{plan.id}"
+
+
+def render_rss(plans, company: dict, templates: dict, dates: dict, base: str, path: str):
+    ET.register_namespace("atom", ATOM_NS)
+    rss = ET.Element("rss", {"version": "2.0"})
+    channel = ET.SubElement(rss, "channel")
+    ET.SubElement(channel, "title").text = f"eSIM Myanmar - {company['name']}"
+    ET.SubElement(channel, "description").text = \
+        "Latest eSIM plans, mobile data offers, and connectivity solutions in Myanmar"
+    ET.SubElement(channel, "link").text = base + "/"
+    ET.SubElement(channel, f"{{{ATOM_NS}}}link",
+                  {"href": base + "/rss.xml", "rel": "self", "type": "application/rss+xml"})
+    ET.SubElement(channel, "language").text = "en-US"
+    # Derived from the items, so an unchanged catalog renders byte-identical feeds
+    built = max((lastmod for lastmod, _ in dates.values()), default=datetime(1970, 1, 1))
+    ET.SubElement(channel, "lastBuildDate").text = rfc822(built)
+    ET.SubElement(channel, "ttl").text = "60"
+    editor = f"{company['email']} ({company['name']})"
+    ET.SubElement(channel, "managingEditor").text = editor
+    ET.SubElement(channel, "webMaster").text = editor
+    for plan in plans:
+        link, guid = plan_link(base, plan)
+        item = ET.SubElement(channel, "item")
+        ET.SubElement(item, "title").text = render_template(templates["title"], plan)
+        ET.SubElement(item, "description").text = render_template(templates["description"], plan)
+        ET.SubElement(item, "link").text = link
+        ET.SubElement(item, "guid", {"isPermaLink": "false"}).text = guid
+        ET.SubElement(item, "pubDate").text = rfc822(dates[plan.id][1])
+        ET.SubElement(item, "category").text = "eSIM Plans"
+    write_xml(rss, path)
+
+
+def render_atom(plans, company: dict, templates: dict, dates: dict, base: str, path: str):
+    ET.register_namespace("", ATOM_NS)
+    q = lambda tag: f"{{{ATOM_NS}}}{tag}"
+    feed = ET.Element(q("feed"))
+    ET.SubElement(feed, q("title")).text = f"eSIM Myanmar - {company['name']}"
+    ET.SubElement(feed, q("subtitle")).text = "New eSIM plans and mobile data offers in Myanmar"
+    ET.SubElement(feed, q("link"), {"href": base + "/atom.xml", "rel": "self"})
+    ET.SubElement(feed, q("link"), {"href": base + "/"})
+    ET.SubElement(feed, q("id")).text = base + "/"
+    updated = max((lastmod for lastmod, _ in dates.values()), default=datetime(1970, 1, 1))
+    ET.SubElement(feed, q("updated")).text = iso(updated)
+    author = ET.SubElement(feed, q("author"))
+    ET.SubElement(author, q("name")).text = company["name"]
+    ET.SubElement(author, q("email")).text = company["email"]
+    for plan in plans:
+        link, guid = plan_link(base, plan)
+        entry = ET.SubElement(feed, q("entry"))
+        ET.SubElement(entry, q("title")).text = render_template(templates["title"], plan)
+        ET.SubElement(entry, q("link"), {"href": link})
+        ET.SubElement(entry, q("id")).text = guid
+        ET.SubElement(entry, q("published")).text = iso(dates[plan.id][1])
+        ET.SubElement(entry, q("updated")).text = iso(dates[plan.id][0])
+        ET.SubElement(entry, q("summary")).text = render_template(templates["description"], plan)
+    write_xml(feed, path)
+
+
+def file_digest(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def compress(path: str):
+    with open(path, "rb") as source, open(path + ".gz.tmp", "wb") as raw:
+        # mtime=0 keeps the .gz byte-identical across rebuilds of the same content
+        with gzip.GzipFile(fileobj=raw, mode="wb", compresslevel=9, mtime=0) as target:
+            shutil.copyfileobj(source, target, 1 << 20)
+    os.replace(path + ".gz.tmp", path + ".gz")
+    if brotli is not None:
+        compressor = brotli.Compressor(quality=11)
+        with open(path, "rb") as source, open(path + ".br.tmp", "wb") as target:
+            for block in iter(lambda: source.read(1 << 20), b""):
+                target.write(compressor.process(block))
+            target.write(compressor.finish())
+        os.replace(path + ".br.tmp", path + ".br")
+
+
+def publish(staging: str, names: List[str], output: str, previous: Dict[str, str]) -> Tuple[Dict[str, str], List[str]]:
+    """Copy changed artifacts into output and compress them; returns (hashes, written)."""
+    hashes = {}
+    written = []
+    for name in names:
+        digest = file_digest(os.path.join(staging, name))
+        hashes[name] = digest
+        target = os.path.join(output, name)
+        siblings_ok = os.path.exists(target + ".gz") and (brotli is None or os.path.exists(target + ".br"))
+        if previous.get(name) == digest and os.path.exists(target) and siblings_ok:
+            continue
+        shutil.copyfile(os.path.join(staging, name), target + ".tmp")
+        os.replace(target + ".tmp", target)
+        compress(target)
+        written.append(name)
+    # Sitemap parts left over from a larger previous run
+    for name in set(previous) - set(hashes):
+        for suffix in ("", ".gz", ".br"):
+            try:
+                os.remove(os.path.join(output, name + suffix))
+            except FileNotFoundError:
+                pass
+    return hashes, written
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Generate SEO artifacts from the plan catalog")
+    parser.add_argument("--output", action="append", help="Directory to publish into (repeatable)")
+    parser.add_argument("--extra-urls", help="File of extra sitemap paths, one per line")
+    args = parser.parse_args()
+    outputs = args.output or DEFAULT_OUTPUTS
+
+    plans, company = load_catalog()
+    base, pages = load_pages(company)
+    templates = load_product_templates()
+    manifest_path = os.path.join(outputs[0], MANIFEST_NAME)
+    try:
+        with open(manifest_path, "r") as f:
+            manifest = json.load(f)
+    except FileNotFoundError:
+        manifest = {"pages": {}, "files": {}}
+
+    history = PageHistory(manifest["pages"], datetime.now(timezone.utc))
+    os.makedirs(outputs[0], exist_ok=True)
+    with tempfile.TemporaryDirectory(dir=outputs[0], prefix=".seo-build-") as staging:
+        sitemap = SitemapWriter(staging, base)
+        for page in iter_pages(pages, base, args.extra_urls):
+            lastmod, _ = history.touch(page.loc, page.digest)
+            sitemap.add(page, lastmod)
+        names = sitemap.close()
+        # Feed item dates: when each plan first appeared and last changed
+        dates = {plan.id: history.touch(f"plan:{plan.id}", Page("", "", "", plan.model_dump()).digest)
+                 for plan in plans}
+        render_rss(plans, company, templates, dates, base, os.path.join(staging, "rss.xml"))
+        render_atom(plans, company, templates, dates, base, os.path.join(staging, "atom.xml"))
+        names += ["rss.xml", "atom.xml"]
+
+        files = {}
+        for output in outputs:
+            os.makedirs(output, exist_ok=True)
+            key = os.path.relpath(os.path.abspath(output), os.path.abspath(outputs[0]))
+            hashes, written = publish(staging, names, output, manifest["files"].get(key, {}))
+            files[key] = hashes
+            print(f"{output}: {len(written)} written, {len(names) - len(written)} unchanged"
+                  + (f" ({', '.join(written)})" if written else ""))
+
+    with open(manifest_path + ".tmp", "w") as f:
+        json.dump({"pages": history.current, "files": files}, f, indent=1, sort_keys=True)
+    os.replace(manifest_path + ".tmp", manifest_path)
+    if brotli is None:
+        print("brotli is not installed; wrote .gz siblings only")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,35 @@
+import os
+import sys
+import tempfile
+
+import pytest
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "backend")
+
+# Local stand-ins, set before anything from backend is imported
+os.environ.pop("MONGO_URL", None)
+os.environ.setdefault("BCRYPT_ROUNDS", "4")
+# API tests share one client address; the limiter is tested on its own
+os.environ.setdefault("RATE_LIMIT_ENABLED", "false")
+os.environ.setdefault("LOG_FILE", os.devnull)
+os.environ.setdefault("QR_CACHE_DIR", tempfile.mkdtemp(prefix="esim-qr-test-"))
+if BACKEND_DIR not in sys.path:
+    sys.path.insert(0, BACKEND_DIR)
+
+
+@pytest.fixture(scope="session")
+def client():
+    # One app lifespan per session: the background services bind to its event loop
+    from fastapi.testclient import TestClient
+    from server import app, wait_until_warm
+
+    with TestClient(app) as test_client:
+        test_client.portal.call(wait_until_warm)
+        yield test_client
+
+
+@pytest.fixture
+def store():
+    """A fresh in-memory storage, separate from the app's."""
+    from storage import Storage
+    return Storage(mongo_url=None)
@@ -0,0 +1,131 @@
+import asyncio
+import uuid
+
+import pytest
+from fastapi import HTTPException
+
+from activation import ActivationCodePool, idempotent
+
+ORDER = {"plan_id": "tourist-7d", "device_imei": "356938035643809", "customer_email": "buyer@example.com"}
+
+
+def test_retry_with_the_same_idempotency_key_replays_the_activation(client):
+    headers = {"Idempotency-Key": str(uuid.uuid4())}
+    first = client.post("/api/esim/activate", json=ORDER, headers=headers)
+    retry = client.post("/api/esim/activate", json=ORDER, headers=headers)
+    assert first.status_code == retry.status_code == 200
+    assert retry.json() == first.json()
+
+    other = client.post("/api/esim/activate", json=ORDER, headers={"Idempotency-Key": str(uuid.uuid4())})
+    assert other.json()["activation_id"] != first.json()["activation_id"]
+    assert other.json()["activation_code"] != first.json()["activation_code"]
+
+
+def test_idempotency_key_reused_for_a_different_order_is_rejected(client):
+    headers = {"Idempotency-Key": str(uuid.uuid4())}
+    assert client.post("/api/esim/activate", json=ORDER, headers=headers).status_code == 200
+    changed = dict(ORDER, plan_id="business-30d")
+    assert client.post("/api/esim/activate", json=changed, headers=headers).status_code == 422
+
+
+def test_bulk_activation_replays_as_a_whole(client):
+    headers = {"Idempotency-Key": str(uuid.uuid4())}
+    body = {"orders": [ORDER, dict(ORDER, plan_id="business-30d")]}
+    first = client.post("/api/esim/activate/bulk", json=body, headers=headers)
+    retry = client.post("/api/esim/activate/bulk", json=body, headers=headers)
+    assert first.status_code == retry.status_code == 200
+    assert retry.json() == first.json()
+
+
+def test_activation_balance_is_readable(client):
+    activation = client.post("/api/esim/activate", json=ORDER).json()
+    balance = client.get(f"/api/esim/{activation['activation_id']}/balance")
+    assert balance.status_code == 200
+    assert balance.json()["data_remaining_gb"] == 5
+    assert client.get("/api/esim/missing/balance").status_code == 404
+
+
+def test_idempotent_replays_the_stored_response(store):
+    calls = []
+
+    async def operation():
+        calls.append(1)
+        return {"activation_id": f"a{len(calls)}"}
+
+    async def run():
+        first = await idempotent("key-1", "activate", {"plan_id": "p"}, operation, store)
+        again = await idempotent("key-1", "activate", {"plan_id": "p"}, operation, store)
+        assert first == again == {"activation_id": "a1"}
+        assert len(calls) == 1
+        with pytest.raises(HTTPException) as e:
+            await idempotent("key-1", "activate", {"plan_id": "other"}, operation, store)
+        assert e.value.status_code == 422
+        # Without a key every call runs
+        await idempotent(None, "activate", {"plan_id": "p"}, operation, store)
+        assert len(calls) == 2
+
+    asyncio.run(run())
+
+
+def test_idempotent_releases_the_key_when_the_operation_fails(store):
+    async def failing():
+        raise RuntimeError("provider down")
+
+    async def succeeding():
+        return {"ok": True}
+
+    async def run():
+        with pytest.raises(RuntimeError):
+            await idempotent("key-1", "activate", {}, failing, store)
+        assert await idempotent("key-1", "activate", {}, succeeding, store) == {"ok": True}
+
+    asyncio.run(run())
+
+
+def test_idempotent_refuses_a_retry_while_the_first_is_running(store):
+    async def run():
+        started, release = asyncio.Event(), asyncio.Event()
+
+        async def slow():
+            started.set()
+            await release.wait()
+            return {"ok": True}
+
+        first = asyncio.create_task(idempotent("key-1", "activate", {}, slow, store))
+        await started.wait()
+        with pytest.raises(HTTPException) as e:
+            await idempotent("key-1", "activate", {}, slow, store)
+        assert e.value.status_code == 409
+        release.set()
+        assert await first == {"ok": True}
+
+    asyncio.run(run())
+
+
+def test_code_pool_skips_codes_already_in_use(store, monkeypatch):
+    import activation
+
+    generated = iter(["ESM1", "ESM2", "ESM2", "ESM3", "ESM4", "ESM5"])
+    monkeypatch.setattr(activation, "generate_code", lambda: next(generated))
+
+    async def run():
+        await store.activations.create({"activation_id": "a1", "activation_code": "ESM3"})
+        pool = ActivationCodePool(store=store, size=3, low_watermark=1)
+        await pool.refill()
+        assert sorted(pool.take() for _ in range(3)) == ["ESM1", "ESM2", "ESM4"]
+
+    asyncio.run(run())
+
+
+def test_drained_code_pool_still_hands_out_codes(store):
+    async def run():
+        pool = ActivationCodePool(store=store, size=20, low_watermark=5)
+        await pool.refill()
+        codes = [pool.take() for _ in range(20)]
+        assert len(set(codes)) == 20 and pool.misses == 0
+        # Below the low watermark a refill is requested; meanwhile codes are unchecked
+        assert pool._refill_needed.is_set()
+        assert pool.take().startswith("ESM")
+        assert pool.misses == 1
+
+    asyncio.run(run())
@@ -0,0 +1,47 @@
+import json
+
+ORDER = {"plan_id": "tourist-7d", "device_imei": "356938035643809", "customer_email": "batch@example.com"}
+
+
+def lines(response) -> list:
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/x-ndjson"
+    return [json.loads(line) for line in response.text.splitlines()]
+
+
+def test_batch_returns_usage_and_balance_in_request_order(client):
+    first, second = (client.post("/api/esim/activate", json=ORDER).json()["activation_id"] for _ in range(2))
+    items = lines(client.post("/api/esim/batch", json={"activation_ids": [second, "missing", first, second]}))
+
+    # Duplicates collapse; order follows first appearance
+    assert [item["activation_id"] for item in items] == [second, "missing", first]
+    assert items[1] == {"activation_id": "missing", "error": "Activation not found"}
+    for item in (items[0], items[2]):
+        single_usage = client.get(f"/api/esim/{item['activation_id']}/usage").json()
+        single_balance = client.get(f"/api/esim/{item['activation_id']}/balance").json()
+        assert item["usage"] == single_usage
+        assert item["balance"] == single_balance
+
+
+def test_batch_include_limits_the_sections(client):
+    activation_id = client.post("/api/esim/activate", json=ORDER).json()["activation_id"]
+    [item] = lines(client.post("/api/esim/batch", json={"activation_ids": [activation_id], "include": ["balance"]}))
+    assert set(item) == {"activation_id", "balance"}
+    assert client.post("/api/esim/batch", json={"activation_ids": [activation_id],
+                                                "include": ["history"]}).status_code == 422
+
+
+def test_batch_streams_past_one_chunk(client):
+    activation_ids = [f"missing-{i}" for i in range(250)]
+    items = lines(client.post("/api/esim/batch", json={"activation_ids": activation_ids}))
+    assert [item["activation_id"] for item in items] == activation_ids
+
+
+def test_oversized_batch_is_refused(client):
+    from server import ESIM_BATCH_MAX_SIZE
+
+    too_many = [f"a{i}" for i in range(ESIM_BATCH_MAX_SIZE + 1)]
+    assert client.post("/api/esim/batch", json={"activation_ids": too_many}).status_code == 413
+    # Counted after duplicates are dropped
+    repeated = ["a1"] * (ESIM_BATCH_MAX_SIZE + 1)
+    assert client.post("/api/esim/batch", json={"activation_ids": repeated}).status_code == 200
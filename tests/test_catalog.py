@@ -0,0 +1,59 @@
+import pytest
+from fastapi.responses import JSONResponse
+
+from catalog import PlanCatalog, etag_matches
+
+
+def plans():
+    from server import ESIM_PLANS, ESIMPlan
+    return ESIM_PLANS, ESIMPlan
+
+
+def test_etag_matching_is_weak_and_accepts_lists():
+    assert etag_matches('"abc"', '"abc"')
+    assert etag_matches('W/"abc"', '"abc"')
+    assert etag_matches('"old", W/"abc"', '"abc"')
+    assert etag_matches("*", '"abc"')
+    assert not etag_matches('"old"', '"abc"')
+    assert not etag_matches(None, '"abc"')
+
+
+def test_bodies_match_what_fastapi_would_render():
+    records, model = plans()
+    catalog = PlanCatalog(records, model)
+    expected = [model(**plan).model_dump(mode="json") for plan in records]
+    assert catalog.body == JSONResponse(expected).body
+    body, etag = catalog.item_entry(records[1]["id"])
+    assert body == JSONResponse(expected[1]).body
+    assert etag != catalog.etag
+    assert catalog.item_entry("missing") is None
+
+
+def test_duplicate_plan_ids_are_rejected():
+    records, model = plans()
+    with pytest.raises(ValueError):
+        PlanCatalog(records + [records[0]], model)
+
+
+def test_listing_revalidates_with_its_etag(client):
+    response = client.get("/api/packages")
+    assert response.status_code == 200
+    etag = response.headers["ETag"]
+    assert response.headers["Cache-Control"] == "public, max-age=300"
+
+    not_modified = client.get("/api/packages", headers={"If-None-Match": etag})
+    assert not_modified.status_code == 304
+    assert not_modified.content == b""
+    assert not_modified.headers["ETag"] == etag
+
+    assert client.get("/api/packages", headers={"If-None-Match": '"stale"'}).status_code == 200
+
+
+def test_single_plan_has_its_own_etag(client):
+    plan = client.get("/api/packages").json()[0]
+    response = client.get(f"/api/packages/{plan['id']}")
+    assert response.json() == plan
+    assert response.headers["ETag"] != client.get("/api/packages").headers["ETag"]
+    revalidated = client.get(f"/api/packages/{plan['id']}", headers={"If-None-Match": response.headers["ETag"]})
+    assert revalidated.status_code == 304
+    assert client.get("/api/packages/no-such-plan").status_code == 404
@@ -0,0 +1,118 @@
+import asyncio
+
+from coalesce import CoalescingCache
+
+
+class Loader:
+    def __init__(self, delay: float = 0.01):
+        self.delay = delay
+        self.calls = 0
+        self.fail = False
+
+    async def __call__(self, key):
+        self.calls += 1
+        await asyncio.sleep(self.delay)
+        if self.fail:
+            raise RuntimeError("storage down")
+        return None if key == "missing" else {"key": key, "load": self.calls}
+
+
+def test_concurrent_gets_share_one_load():
+    loader = Loader()
+    cache = CoalescingCache(loader, ttl=60, stale=0)
+
+    async def run():
+        return await asyncio.gather(*(cache.get("a1") for _ in range(10)))
+
+    results = asyncio.run(run())
+    assert loader.calls == 1
+    assert all(result == {"key": "a1", "load": 1} for result in results)
+    assert (cache.misses, cache.coalesced, cache.hits) == (1, 9, 0)
+
+
+def test_fresh_entries_are_hits():
+    loader = Loader()
+    cache = CoalescingCache(loader, ttl=60, stale=0)
+
+    async def run():
+        await cache.get("a1")
+        await cache.get("a1")
+        cache.discard("a1")
+        await cache.get("a1")
+
+    asyncio.run(run())
+    assert (cache.misses, cache.hits, loader.calls) == (2, 1, 2)
+
+
+def test_not_found_is_coalesced_but_not_cached():
+    loader = Loader()
+    cache = CoalescingCache(loader, ttl=60, stale=0)
+
+    async def run():
+        assert await asyncio.gather(cache.get("missing"), cache.get("missing")) == [None, None]
+        assert await cache.get("missing") is None
+
+    asyncio.run(run())
+    assert loader.calls == 2
+    assert len(cache) == 0
+
+
+def test_stale_entries_are_served_while_one_refresh_runs():
+    loader = Loader()
+    cache = CoalescingCache(loader, ttl=0.2, stale=60)
+
+    async def run():
+        await cache.get("a1")
+        await asyncio.sleep(0.25)
+        stale = await asyncio.gather(*(cache.get("a1") for _ in range(5)))
+        await asyncio.sleep(0.05)
+        return stale, await cache.get("a1")
+
+    stale, refreshed = asyncio.run(run())
+    assert all(result["load"] == 1 for result in stale)
+    assert refreshed["load"] == 2
+    assert (cache.stale_hits, cache.hits) == (5, 1)
+    assert loader.calls == 2
+
+
+def test_failed_refresh_keeps_serving_stale():
+    loader = Loader()
+    cache = CoalescingCache(loader, ttl=0.01, stale=60)
+
+    async def run():
+        await cache.get("a1")
+        await asyncio.sleep(0.02)
+        loader.fail = True
+        stale = await cache.get("a1")
+        await asyncio.sleep(0.05)
+        return stale
+
+    assert asyncio.run(run())["load"] == 1
+    assert cache.refresh_errors == 1
+
+
+def test_a_failed_load_reaches_every_waiter():
+    loader = Loader()
+    loader.fail = True
+    cache = CoalescingCache(loader, ttl=60, stale=0)
+
+    async def run():
+        return await asyncio.gather(cache.get("a1"), cache.get("a1"), return_exceptions=True)
+
+    results = asyncio.run(run())
+    assert all(isinstance(result, RuntimeError) for result in results)
+    assert loader.calls == 1
+    loader.fail = False
+    assert asyncio.run(cache.get("a1"))["load"] == 2
+
+
+def test_size_is_capped_oldest_first():
+    cache = CoalescingCache(Loader(delay=0), ttl=60, stale=0, max_size=2)
+
+    async def run():
+        for key in ("a", "b", "c"):
+            await cache.get(key)
+
+    asyncio.run(run())
+    assert len(cache) == 2
+    assert "a" not in cache._entries
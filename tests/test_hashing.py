@@ -0,0 +1,115 @@
+import asyncio
+from datetime import datetime
+
+import pytest
+from fastapi import HTTPException
+from passlib.hash import bcrypt
+
+from hashing import BCRYPT_ROUNDS, PasswordHasher
+
+# Valid, but made with a cost other than the configured one
+OUTDATED_ROUNDS = BCRYPT_ROUNDS + 1
+
+
+def run_with(hasher: PasswordHasher, coro):
+    try:
+        return asyncio.run(coro)
+    finally:
+        hasher.shutdown()
+
+
+def test_hash_and_verify():
+    hasher = PasswordHasher(workers=2)
+
+    async def run():
+        hashed = await hasher.hash("correct horse")
+        assert await hasher.verify("correct horse", hashed) == (True, None)
+        assert await hasher.verify("wrong horse", hashed) == (False, None)
+
+    run_with(hasher, run())
+    assert hasher.stats()["completed"] == 3
+    assert hasher.pending == 0
+
+
+def test_outdated_hashes_get_a_replacement():
+    hasher = PasswordHasher(workers=1)
+    outdated = bcrypt.using(rounds=OUTDATED_ROUNDS).hash("correct horse")
+
+    valid, new_hash = run_with(hasher, hasher.verify("correct horse", outdated))
+    assert valid and new_hash != outdated
+    assert bcrypt.from_string(new_hash).rounds == BCRYPT_ROUNDS
+    assert hasher.rehashed == 1
+
+
+def test_hash_many_spreads_a_batch_over_the_workers():
+    hasher = PasswordHasher(workers=3)
+    passwords = [f"password-{i}" for i in range(7)]
+
+    hashed = run_with(hasher, hasher.hash_many(passwords))
+    assert len(hashed) == 7
+    assert all(bcrypt.verify(p, h) for p, h in zip(passwords, hashed))
+    # One job per worker, not one per password
+    assert hasher.completed == 3
+
+
+def test_jobs_past_the_limit_are_turned_away():
+    hasher = PasswordHasher(workers=1, max_pending=1)
+
+    async def run():
+        first = asyncio.create_task(hasher.hash("first password"))
+        await asyncio.sleep(0)
+        with pytest.raises(HTTPException) as e:
+            await hasher.hash("second password")
+        assert e.value.status_code == 503
+        assert e.value.headers == {"Retry-After": "1"}
+        with pytest.raises(RuntimeError):
+            await hasher.check_capacity()
+        await first
+        await hasher.check_capacity()
+
+    run_with(hasher, run())
+    assert (hasher.completed, hasher.rejected) == (1, 1)
+
+
+def test_failed_jobs_are_counted_and_release_their_slot():
+    hasher = PasswordHasher(workers=1, max_pending=1)
+
+    async def run():
+        with pytest.raises(ValueError):
+            await hasher.verify("password", "not a bcrypt hash")
+        # The slot is free again
+        await hasher.hash("password")
+
+    run_with(hasher, run())
+    assert (hasher.failed, hasher.completed, hasher.pending) == (1, 1, 0)
+
+
+def add_user(client, email: str, password: str, is_active: bool) -> str:
+    from storage import storage
+
+    hashed = bcrypt.using(rounds=OUTDATED_ROUNDS).hash(password)
+    client.portal.call(storage.users.create, {
+        "id": f"user_{email}", "email": email, "full_name": "Test", "phone": "1",
+        "hashed_auth": hashed, "is_active": is_active, "created_at": datetime.utcnow(),
+    })
+    return hashed
+
+
+def stored_hash(client, email: str) -> str:
+    from storage import storage
+    return client.portal.call(storage.users.get_by_email, email, ("hashed_auth",))["hashed_auth"]
+
+
+def test_login_upgrades_an_outdated_hash(client):
+    add_user(client, "rehash@example.com", "password123", is_active=True)
+    response = client.post("/api/auth/login", json={"email": "rehash@example.com", "password": "password123"})
+    assert response.status_code == 200
+    assert bcrypt.from_string(stored_hash(client, "rehash@example.com")).rounds == BCRYPT_ROUNDS
+
+
+def test_disabled_account_keeps_its_hash(client):
+    hashed = add_user(client, "disabled@example.com", "password123", is_active=False)
+    response = client.post("/api/auth/login", json={"email": "disabled@example.com", "password": "password123"})
+    assert response.status_code == 401
+    assert response.json()["detail"] == "Account is disabled"
+    assert stored_hash(client, "disabled@example.com") == hashed
@@ -0,0 +1,74 @@
+import asyncio
+
+from health import ReadinessChecks
+
+
+async def ok():
+    pass
+
+
+async def down():
+    raise ConnectionError("connection refused")
+
+
+async def hangs():
+    await asyncio.sleep(10)
+
+
+def test_ready_when_every_probe_passes():
+    checks = ReadinessChecks(ttl=0)
+    checks.register("storage", ok)
+    checks.register("token_keys", ok)
+    report = asyncio.run(checks.report())
+    assert report["status"] == "ok"
+    assert set(report["checks"]) == {"storage", "token_keys"}
+
+
+def test_failing_and_slow_probes_fail_readiness():
+    checks = ReadinessChecks(ttl=0)
+    checks.register("storage", down)
+    checks.register("warm_up", hangs, timeout=0.05)
+    checks.register("token_keys", ok)
+    report = asyncio.run(checks.report())
+    assert report["status"] == "fail"
+    assert report["checks"]["storage"]["error"] == "connection refused"
+    assert report["checks"]["warm_up"]["error"] == "Timed out after 0.05s"
+    assert checks.last == {"storage": False, "warm_up": False, "token_keys": True}
+
+
+def test_registering_a_name_again_replaces_the_probe():
+    checks = ReadinessChecks(ttl=0)
+    checks.register("storage", down)
+    checks.register("storage", ok)
+    assert asyncio.run(checks.report())["status"] == "ok"
+    assert [probe.name for probe in checks.probes] == ["storage"]
+
+
+def test_reports_are_cached_and_shared():
+    checks = ReadinessChecks(ttl=60)
+    checks.register("storage", ok)
+
+    async def run():
+        await asyncio.gather(*(checks.report() for _ in range(10)))
+        await checks.report()
+
+    asyncio.run(run())
+    assert checks.runs == 1
+
+
+def test_draining_fails_readiness_without_probing():
+    checks = ReadinessChecks(ttl=0)
+    checks.register("storage", ok)
+    asyncio.run(checks.drain())
+    assert asyncio.run(checks.report()) == {"status": "fail", "checks": {}, "draining": True}
+    assert checks.runs == 0
+
+
+def test_ready_and_live_routes(client):
+    response = client.get("/ready")
+    assert response.status_code == 200
+    assert response.headers["cache-control"] == "no-store"
+    body = response.json()
+    assert body["status"] == "ok"
+    assert {"storage", "warm_up", "password_hashing", "token_keys"} <= set(body["checks"])
+    assert client.get("/live").json() == {"status": "ok"}
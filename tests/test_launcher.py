@@ -0,0 +1,83 @@
+import os
+import signal
+import socket
+import subprocess
+import sys
+import textwrap
+import time
+
+import httpx
+import pytest
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "backend")
+
+# Answers every request with the serving worker's pid
+PID_APP = textwrap.dedent("""
+    import os
+
+    async def app(scope, receive, send):
+        if scope["type"] == "lifespan":
+            while True:
+                message = await receive()
+                await send({"type": message["type"] + ".complete"})
+                if message["type"] == "lifespan.shutdown":
+                    return
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+        await send({"type": "http.response.body", "body": str(os.getpid()).encode()})
+""")
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def launch(tmp_path, *args: str) -> subprocess.Popen:
+    (tmp_path / "pidapp.py").write_text(PID_APP)
+    env = dict(os.environ, PYTHONPATH=str(tmp_path), LOG_FILE=os.devnull, GRACEFUL_TIMEOUT="10")
+    env.pop("MONGO_URL", None)
+    return subprocess.Popen([sys.executable, "launcher.py", *args], cwd=BACKEND_DIR, env=env)
+
+
+def serving_pid(port: int, timeout: float = 30) -> int:
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            return int(httpx.get(f"http://127.0.0.1:{port}/", timeout=2).text)
+        except httpx.HTTPError:
+            if time.monotonic() > deadline:
+                raise
+            time.sleep(0.1)
+
+
+def test_refuses_several_workers_with_process_local_state(tmp_path):
+    launcher = launch(tmp_path, "pidapp:app", "--workers", "2", "--port", str(free_port()))
+    assert launcher.wait(30) == 2
+
+
+@pytest.mark.skipif(not hasattr(os, "fork"), reason="pre-fork launcher needs fork()")
+def test_reload_replaces_workers_without_dropping_the_socket(tmp_path):
+    port = free_port()
+    launcher = launch(tmp_path, "pidapp:app", "--workers", "1", "--host", "127.0.0.1", "--port", str(port))
+    try:
+        old_worker = serving_pid(port)
+        assert old_worker != launcher.pid
+
+        launcher.send_signal(signal.SIGHUP)
+        deadline = time.monotonic() + 30
+        # Every request during the reload is answered, by the old worker or the new one
+        while (pid := serving_pid(port, timeout=0)) == old_worker:
+            assert time.monotonic() < deadline, "worker was not replaced"
+            time.sleep(0.05)
+        # Re-executed in place, so the master keeps its pid
+        assert launcher.poll() is None
+
+        launcher.send_signal(signal.SIGTERM)
+        assert launcher.wait(30) == 0
+        with pytest.raises(ProcessLookupError):
+            os.kill(pid, 0)
+    finally:
+        if launcher.poll() is None:
+            launcher.kill()
+            launcher.wait()
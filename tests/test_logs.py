@@ -0,0 +1,136 @@
+import io
+import json
+import logging
+import os
+import subprocess
+import sys
+
+import pytest
+from fastapi import FastAPI, HTTPException
+from fastapi.testclient import TestClient
+
+import logs
+from logs import AccessLogMiddleware, JSONFormatter, LogPipeline, QueueingHandler, request_id_var
+
+
+def record(msg: str = "hello %s", *args, **extra) -> logging.LogRecord:
+    entry = logging.LogRecord("test", logging.INFO, __file__, 1, msg, args or ("world",), None)
+    entry.__dict__.update(extra)
+    return entry
+
+
+def test_json_lines_carry_context_and_extras():
+    entry = record(request_id="abc", activation_id="a1")
+    line = json.loads(JSONFormatter().format(entry))
+    assert (line["level"], line["logger"], line["msg"]) == ("INFO", "test", "hello world")
+    assert (line["request_id"], line["activation_id"]) == ("abc", "a1")
+    assert "args" not in line and "exc" not in line
+
+    try:
+        raise ValueError("boom")
+    except ValueError:
+        failed = logging.LogRecord("test", logging.ERROR, __file__, 1, "failed", None, sys.exc_info())
+    assert "ValueError: boom" in json.loads(JSONFormatter().format(failed))["exc"]
+
+
+def test_writer_thread_drains_in_batches():
+    stream = io.StringIO()
+    pipeline = LogPipeline(stream, interval=60)
+    pipeline.start()
+    handler = QueueingHandler(pipeline)
+    token = request_id_var.set("req-1")
+    try:
+        for i in range(3):
+            handler.emit(record("line %d", i))
+    finally:
+        request_id_var.reset(token)
+    # Nothing is written until the writer wakes
+    assert stream.getvalue() == ""
+    pipeline.flush()
+    lines = [json.loads(line) for line in stream.getvalue().splitlines()]
+    assert [line["msg"] for line in lines] == ["line 0", "line 1", "line 2"]
+    assert {line["request_id"] for line in lines} == {"req-1"}
+    assert pipeline.written == 3
+    handler.close()
+    assert pipeline._thread is None
+
+
+def test_full_queue_drops_and_counts():
+    stream = io.StringIO()
+    pipeline = LogPipeline(stream, max_size=2, interval=60)
+    handler = QueueingHandler(pipeline)
+    for i in range(5):
+        handler.emit(record("line %d", i))
+    assert (len(pipeline.records), pipeline.dropped) == (2, 3)
+    pipeline.start()
+    pipeline.stop()
+    assert [json.loads(line)["msg"] for line in stream.getvalue().splitlines()] == ["line 0", "line 1"]
+
+
+@pytest.fixture
+def access_app():
+    app = FastAPI()
+
+    @app.get("/api/health")
+    async def health():
+        return {"ok": True}
+
+    @app.get("/fail")
+    async def fail():
+        raise HTTPException(status_code=503)
+
+    return TestClient(AccessLogMiddleware(app))
+
+
+@pytest.fixture
+def access_log():
+    """Access records as the queueing handler sees them, with their request ids."""
+    pipeline = LogPipeline(io.StringIO())
+    handler = QueueingHandler(pipeline)
+    level = logs.access_logger.level
+    logs.access_logger.addHandler(handler)
+    logs.access_logger.setLevel(logging.INFO)
+    yield pipeline.records
+    logs.access_logger.removeHandler(handler)
+    logs.access_logger.setLevel(level)
+
+
+def test_request_ids_are_echoed_only_when_valid(access_app, access_log):
+    assert access_app.get("/fail", headers={"X-Request-ID": "abc-123"}).headers["X-Request-ID"] == "abc-123"
+    replaced = access_app.get("/fail", headers={"X-Request-ID": "not an id"}).headers["X-Request-ID"]
+    assert replaced != "not an id" and len(replaced) == 32
+    generated = access_app.get("/fail").headers["X-Request-ID"]
+    assert generated != replaced
+
+    first, second, third = access_log
+    assert (first.request_id, first.status, first.route) == ("abc-123", 503, "/fail")
+    assert (second.request_id, third.request_id) == (replaced, generated)
+
+
+def test_successful_hot_routes_are_sampled(access_app, access_log, monkeypatch):
+    monkeypatch.setattr(logs, "ACCESS_LOG_SAMPLE_RATE", 0.0)
+    assert access_app.get("/api/health").status_code == 200
+    assert not access_log
+
+    monkeypatch.setattr(logs, "ACCESS_LOG_SAMPLE_RATE", 1.0)
+    access_app.get("/api/health")
+    (entry,) = access_log
+    assert (entry.route, entry.status, entry.sample_rate) == ("/api/health", 200, 1.0)
+
+    # Slow requests are always logged, at full weight
+    monkeypatch.setattr(logs, "ACCESS_LOG_SAMPLE_RATE", 0.0)
+    monkeypatch.setattr(logs, "ACCESS_LOG_SLOW_MS", 0.0)
+    access_app.get("/api/health")
+    assert access_log[-1].sample_rate == 1.0
+
+
+def test_importing_the_server_leaves_logging_alone():
+    script = (
+        "import logging\n"
+        "handler = logging.StreamHandler()\n"
+        "logging.getLogger().addHandler(handler)\n"
+        "import server, logs\n"
+        "assert logging.getLogger().handlers == [handler]\n"
+        "assert logs.pipeline is None\n"
+    )
+    subprocess.run([sys.executable, "-c", script], cwd=os.path.dirname(logs.__file__), check=True, timeout=60)
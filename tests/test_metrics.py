@@ -0,0 +1,92 @@
+import httpx
+import pytest
+
+from metrics import Registry, _LabelledFamily, scrape_allowed
+
+
+def test_counters_and_gauges_render_in_exposition_format():
+    registry = Registry()
+    requests = registry.counter("requests_total", "Requests", ("route",))
+    requests.labels("/a").inc()
+    requests.labels("/a").inc(2)
+    requests.labels('say "hi"\n').inc()
+    registry.gauge("queue_depth", "Queued jobs", lambda: {("fast",): 1, ("slow",): 4}, ("pool",))
+
+    assert registry.render() == (
+        "# HELP requests_total Requests\n"
+        "# TYPE requests_total counter\n"
+        'requests_total{route="/a"} 3\n'
+        'requests_total{route="say \\"hi\\"\\n"} 1\n'
+        "# HELP queue_depth Queued jobs\n"
+        "# TYPE queue_depth gauge\n"
+        'queue_depth{pool="fast"} 1\n'
+        'queue_depth{pool="slow"} 4\n'
+    )
+
+
+def test_histogram_buckets_are_cumulative():
+    registry = Registry()
+    latency = registry.histogram("latency_seconds", "Latency", buckets=(0.1, 1.0))
+    for value in (0.05, 0.1, 0.5, 3.0):
+        latency.observe(value)
+
+    lines = registry.render().splitlines()[2:]
+    assert lines == [
+        'latency_seconds_bucket{le="0.1"} 2',
+        'latency_seconds_bucket{le="1.0"} 3',
+        'latency_seconds_bucket{le="+Inf"} 4',
+        "latency_seconds_sum 3.65",
+        "latency_seconds_count 4",
+    ]
+
+
+def test_metric_names_are_unique_and_families_must_make_children():
+    registry = Registry()
+    registry.counter("jobs_total", "Jobs")
+    with pytest.raises(ValueError):
+        registry.gauge("jobs_total", "Jobs", lambda: 0)
+    with pytest.raises(TypeError):
+        _LabelledFamily("incomplete", "No child type")
+
+
+def test_only_local_and_private_peers_may_scrape():
+    assert scrape_allowed("127.0.0.1", None)
+    assert scrape_allowed("10.2.3.4", None)
+    assert scrape_allowed("::1", None)
+    assert not scrape_allowed("203.0.113.9", None)
+    assert not scrape_allowed(None, None)
+    assert not scrape_allowed("testclient", None)
+    # Relayed by a proxy on behalf of someone else
+    assert not scrape_allowed("127.0.0.1", "203.0.113.9")
+
+
+def scrape(client, peer: str, headers=None) -> httpx.Response:
+    from server import app
+
+    async def get():
+        transport = httpx.ASGITransport(app=app, client=(peer, 40000))
+        async with httpx.AsyncClient(transport=transport, base_url="http://backend") as scraper:
+            return await scraper.get("/metrics", headers=headers)
+
+    return client.portal.call(get)
+
+
+def test_metrics_endpoint_reports_routes(client):
+    client.get("/api/packages")
+    client.get("/api/packages/no-such-plan")
+
+    response = scrape(client, "127.0.0.1")
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "text/plain; version=0.0.4; charset=utf-8"
+    body = response.text
+    assert 'http_requests_total{method="GET",route="/api/packages",status="200"}' in body
+    assert 'http_requests_total{method="GET",route="/api/packages/{plan_id}",status="404"}' in body
+    assert 'http_request_duration_seconds_bucket{method="GET",route="/api/packages",le="+Inf"}' in body
+    assert "# TYPE event_loop_lag_seconds histogram" in body
+    assert "# TYPE password_hash_rejected_total counter" in body
+
+
+def test_metrics_endpoint_hides_from_public_peers(client):
+    assert client.get("/metrics").status_code == 404
+    assert scrape(client, "203.0.113.9").status_code == 404
+    assert scrape(client, "127.0.0.1", {"X-Forwarded-For": "203.0.113.9"}).status_code == 404
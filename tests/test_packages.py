@@ -0,0 +1,94 @@
+import random
+from types import SimpleNamespace
+
+import pytest
+
+from plan_index import InvalidQuery, PlanIndex, PlanQuery, feature_tag
+
+
+def walk(client, url: str):
+    """Every page of a listing, following the rel="next" links."""
+    pages = []
+    response = client.get(url)
+    while True:
+        assert response.status_code == 200
+        pages.append(response)
+        cursor = response.headers.get("X-Next-Cursor")
+        if cursor is None:
+            assert "Link" not in response.headers
+            return pages
+        link, rel = response.headers["Link"].split("; ")
+        assert rel == 'rel="next"' and f"cursor={cursor}" in link
+        response = client.get(link.strip("<>"))
+
+
+def ids(pages):
+    return [plan["id"] for page in pages for plan in page.json()]
+
+
+def test_cursor_walks_every_plan_once(client):
+    everything = client.get("/api/packages").json()
+    pages = walk(client, "/api/packages?limit=1")
+    assert ids(pages) == [plan["id"] for plan in everything]
+    assert all(page.headers["X-Total-Count"] == str(len(everything)) for page in pages)
+    assert len(pages) == len(everything)
+
+
+def test_cursor_keeps_the_sort_order(client):
+    everything = client.get("/api/packages").json()
+    expected = [plan["id"] for plan in sorted(everything, key=lambda plan: -plan["price_usd"])]
+    assert ids(walk(client, "/api/packages?sort=-price_usd&limit=2")) == expected
+
+
+def test_cursor_pages_within_a_filter(client):
+    everything = client.get("/api/packages").json()
+    cheap = [plan["id"] for plan in everything if plan["price_usd"] <= 40]
+    pages = walk(client, "/api/packages?max_price_usd=40&limit=1")
+    assert ids(pages) == cheap
+    assert pages[0].headers["X-Total-Count"] == str(len(cheap))
+
+
+def test_bad_paging_parameters_are_rejected(client):
+    assert client.get("/api/packages?limit=0").status_code == 422
+    assert client.get("/api/packages?limit=1&cursor=not-a-cursor").status_code == 400
+
+
+def test_index_agrees_with_a_linear_scan():
+    rng = random.Random(7)
+    # Several prefix-bitset blocks, with plenty of ties in every field
+    plans = [SimpleNamespace(price_usd=rng.randint(5, 60), data_gb=rng.choice([1, 5, 10, 20]),
+                             duration_days=rng.choice([7, 15, 30]),
+                             features=rng.sample(["5G Data", "Hotspot", "Local Number"], rng.randint(0, 2)))
+             for _ in range(300)]
+    index = PlanIndex(plans, "v1")
+
+    for _ in range(40):
+        low = rng.choice([None, rng.randint(5, 60)])
+        high = rng.choice([None, rng.randint(5, 60)])
+        days = rng.choice([(None, None), (15, 30), (7, 7)])
+        features = rng.sample(["5g-data", "hotspot"], rng.randint(0, 1))
+        sort = rng.choice([None, "price_usd", "-price_usd", "data_gb", "-duration_days"])
+        ranges = {"price_usd": (low, high), "duration_days": days}
+
+        matches = [i for i, plan in enumerate(plans)
+                   if (low is None or plan.price_usd >= low) and (high is None or plan.price_usd <= high)
+                   and (days[0] is None or days[0] <= plan.duration_days <= days[1])
+                   and all(f in map(feature_tag, plan.features) for f in features)]
+        if sort:
+            field = sort.lstrip("-")
+            matches.sort(key=lambda i: (getattr(plans[i], field), i), reverse=sort.startswith("-"))
+
+        walked, cursor = [], None
+        while True:
+            page = index.search(PlanQuery(ranges, features, sort, rng.randint(1, 40), cursor))
+            assert page.total == len(matches)
+            walked += page.positions
+            cursor = page.next_cursor
+            if cursor is None:
+                break
+        assert walked == matches
+
+    query = PlanQuery({"price_usd": (10, None)}, [], None, 5, None)
+    cursor = index.search(query).next_cursor
+    with pytest.raises(InvalidQuery):
+        index.search(query._replace(ranges={"price_usd": (20, None)}, cursor=cursor))
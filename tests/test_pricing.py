@@ -0,0 +1,102 @@
+import asyncio
+import json
+import os
+
+import pytest
+
+import pricing
+from pricing import FXRates, PriceTable, PricingEngine
+
+
+@pytest.fixture
+def catalog():
+    from server import catalog
+    return catalog
+
+
+def write_rates(path, mmk: float, mtime: float):
+    path.write_text(json.dumps({"currency_rates": {"USD_to_MMK": mmk, "last_updated": "2026-01-01"}}))
+    os.utime(path, (mtime, mtime))
+
+
+def test_rates_from_a_feed():
+    rates = FXRates.from_feed({"USD_to_MMK": 2200, "USD_to_USD": 3, "last_updated": "today"})
+    assert rates.rates["MMK"] == 2200.0
+    assert rates.rates["USD"] == 1.0
+    assert rates.rates["THB"] == pricing.DEFAULT_USD_RATES["THB"]
+    assert rates.version == FXRates.from_feed({"USD_to_MMK": 2200}).version
+    assert rates.version != FXRates.from_feed({"USD_to_MMK": 2300}).version
+    with pytest.raises(ValueError):
+        FXRates({"XYZ": 2.0})
+
+
+def test_prices_are_rounded_to_each_currencys_step(catalog):
+    table = PriceTable(catalog, FXRates({"MMK": 2111.0, "SGD": 1.3333}))
+    plan = catalog.plans[0]
+    mmk = json.loads(table.item_entry(plan.id, "MMK")[0])
+    sgd = json.loads(table.item_entry(plan.id, "SGD")[0])
+    assert mmk["price"] == round(plan.price_usd * 2111.0 / 50) * 50 and isinstance(mmk["price"], int)
+    assert sgd["price"] == round(plan.price_usd * 1.3333, 2)
+    assert mmk["fx_version"] == sgd["fx_version"] == table.version
+    assert [item["id"] for item in json.loads(table.list_entry("MMK")[0])] == [p.id for p in catalog.plans]
+    assert table.list_entry("EUR") is None
+
+
+def test_tables_are_reused_per_rate_version(catalog):
+    engine = PricingEngine(catalog, rates_path=None)
+    first, second = FXRates({"MMK": 2100.0}), FXRates({"MMK": 2200.0})
+    engine.update_rates(first)
+    engine.update_rates(second)
+    engine.update_rates(first)
+    assert engine.computations == 2
+    assert engine.table.version == first.version
+
+
+def test_reload_follows_the_rates_file(catalog, tmp_path):
+    path = tmp_path / "rates.json"
+    write_rates(path, 2100, mtime=1000)
+    engine = PricingEngine(catalog, rates_path=str(path))
+    engine.reload()
+    first = engine.table.version
+    engine.reload()
+    assert engine.computations == 1
+    write_rates(path, 2500, mtime=2000)
+    engine.reload()
+    assert engine.table.version != first
+
+
+def test_a_failed_first_build_recovers(catalog, tmp_path, monkeypatch):
+    monkeypatch.setattr(pricing, "FX_REFRESH_INTERVAL", 0.02)
+    path = tmp_path / "rates.json"
+    path.write_text("{not json")
+
+    async def run():
+        engine = PricingEngine(catalog, rates_path=str(path))
+        await engine.start()
+        with pytest.raises(ValueError):
+            await engine.wait_ready()
+        await asyncio.sleep(0.1)
+        # The refresh loop survives reload failures with no table at all
+        assert not engine._task.done()
+
+        write_rates(path, 2100, mtime=3000)
+        await engine.wait_ready()
+        assert "MMK" in engine.table.currencies
+        await engine.stop()
+
+    asyncio.run(run())
+
+
+def test_localized_listing_and_item(client):
+    listing = client.get("/api/packages?currency=mmk")
+    assert listing.status_code == 200
+    plans = listing.json()
+    assert all(plan["currency"] == "MMK" and plan["price"] % 50 == 0 for plan in plans)
+    assert len({plan["fx_version"] for plan in plans}) == 1
+    assert client.get("/api/packages?currency=MMK",
+                      headers={"If-None-Match": listing.headers["ETag"]}).status_code == 304
+
+    item = client.get(f"/api/packages/{plans[0]['id']}?currency=THB").json()
+    assert (item["id"], item["currency"]) == (plans[0]["id"], "THB")
+    assert client.get("/api/packages?currency=EUR").status_code == 400
+    assert client.get("/api/packages/no-such-plan?currency=THB").status_code == 404
@@ -0,0 +1,127 @@
+import asyncio
+import json
+
+import pytest
+
+from hashing import PasswordHasher
+from provisioning import MAX_RECORD_CHARS, InvalidImport, RowReader, UserImport
+
+HEADER = "email,password,full_name,phone\n"
+
+
+def run_import(store, fmt: str, data: str, chunk_size: int = 7, **options) -> dict:
+    """Import data fed in small chunks, so records straddle chunk boundaries."""
+    hasher = PasswordHasher("thread", 2)
+    job = UserImport(fmt, store=store, hasher=hasher, batch_size=2, **options)
+    raw = data.encode()
+
+    async def run():
+        for i in range(0, len(raw), chunk_size):
+            await job.feed(raw[i:i + chunk_size])
+        return await job.finish()
+
+    try:
+        return asyncio.run(run())
+    finally:
+        hasher.shutdown()
+
+
+def statuses(report: dict):
+    return [(result["line"], result["status"]) for result in report["results"]]
+
+
+def test_csv_import_reports_every_line(store):
+    asyncio.run(store.users.create({"id": "u0", "email": "taken@example.com"}))
+    report = run_import(store, "csv", HEADER + (
+        "ana@example.com,password1,Ana,0911\n"
+        "taken@example.com,password1,Taken,0912\n"
+        "ana@example.com,password1,Ana Again,0913\n"
+        "short@example.com,pw,Short,0914\n"
+        "not-an-email,password1,Bad,0915\n"
+        "too,few\n"
+        "\n"
+        "bo@example.com,password1,Bo,0916\n"
+    ))
+    assert statuses(report) == [(2, "created"), (3, "exists"), (4, "duplicate"), (5, "invalid"),
+                                (6, "invalid"), (7, "invalid"), (9, "created")]
+    assert (report["created"], report["exists"], report["duplicate"], report["invalid"]) == (2, 1, 1, 3)
+    assert asyncio.run(store.users.emails_in_use(["ana@example.com", "bo@example.com"])) == {
+        "ana@example.com", "bo@example.com"}
+
+
+def test_csv_quotes(store):
+    report = run_import(store, "csv", HEADER + (
+        'a@example.com,password1,"Pat ""PJ"" O\'Neil",1\n'
+        'b@example.com,password1,O"Brien,2\n'
+        'c@example.com,password1,"Two\nLines",3\n'
+        'd@example.com,password1,"Closed"junk,4\n'
+        'e@example.com,password1,Last,5\n'
+    ))
+    assert statuses(report) == [(2, "created"), (3, "created"), (4, "created"), (6, "invalid"), (7, "created")]
+    assert asyncio.run(store.users.get_by_email("b@example.com"))["full_name"] == 'O"Brien'
+    assert asyncio.run(store.users.get_by_email("c@example.com"))["full_name"] == "Two\nLines"
+
+
+def test_unterminated_quote_is_reported_not_swallowed():
+    reader = RowReader("csv")
+    rows = list(reader.feed((HEADER + 'a@example.com,pw,"open,1\n' + "x,y,z,w\n" * (MAX_RECORD_CHARS // 8)).encode()))
+    rows += reader.feed(b"b@example.com,password1,After,2\n", final=True)
+    assert rows[0] == (2, f"Record runs past {MAX_RECORD_CHARS} characters (unterminated quoted field?)")
+    assert rows[-1][1]["email"] == "b@example.com"
+
+    reader = RowReader("csv")
+    rows = list(reader.feed((HEADER + 'a@example.com,pw,"open,1\nmore\n').encode(), final=True))
+    assert rows == [(2, "Unterminated quoted field")]
+
+
+def test_csv_header_must_name_the_required_columns():
+    with pytest.raises(InvalidImport, match="password"):
+        list(RowReader("csv").feed(b"email,full_name,phone\n"))
+
+
+def test_jsonl_import(store):
+    lines = [
+        json.dumps({"email": "j1@example.com", "password": "password1", "full_name": "J1", "phone": "1"}),
+        "{not json",
+        json.dumps(["a", "list"]),
+        json.dumps({"email": "j2@example.com", "password": "password1", "full_name": "J2", "phone": "2"}),
+    ]
+    report = run_import(store, "jsonl", "\ufeff" + "\n".join(lines) + "\n")
+    assert statuses(report) == [(1, "created"), (2, "invalid"), (3, "invalid"), (4, "created")]
+    assert report["results"][2]["error"] == "Expected a JSON object"
+
+
+def test_dry_run_creates_nothing(store):
+    report = run_import(store, "jsonl", json.dumps(
+        {"email": "dry@example.com", "password": "password1", "full_name": "Dry", "phone": "1"}) + "\n",
+        dry_run=True)
+    assert statuses(report) == [(1, "valid")]
+    assert report["dry_run"] is True
+    assert not asyncio.run(store.users.exists("dry@example.com"))
+
+
+def test_row_limit(store):
+    rows = "".join(f"u{i}@example.com,password1,U{i},{i}\n" for i in range(3))
+    report = run_import(store, "csv", HEADER + rows, max_rows=2)
+    assert statuses(report) == [(2, "created"), (3, "created"), (4, "invalid")]
+
+
+def test_import_route_requires_the_token(client, monkeypatch):
+    import provisioning
+
+    body = HEADER + "route@example.com,password1,Route,1\n"
+    monkeypatch.setattr(provisioning, "PROVISION_TOKEN", None)
+    assert client.post("/api/auth/users/import", content=body,
+                       headers={"Content-Type": "text/csv"}).status_code == 403
+
+    monkeypatch.setattr(provisioning, "PROVISION_TOKEN", "s3cret")
+    headers = {"Content-Type": "text/csv", "X-Provision-Token": "wrong"}
+    assert client.post("/api/auth/users/import", content=body, headers=headers).status_code == 401
+    headers["X-Provision-Token"] = "s3cret"
+    assert client.post("/api/auth/users/import", content=body,
+                       headers=dict(headers, **{"Content-Type": "text/plain"})).status_code == 415
+    response = client.post("/api/auth/users/import?dry_run=true", content=body, headers=headers)
+    assert response.status_code == 200
+    assert statuses(response.json()) == [(2, "valid")]
+    bad_header = client.post("/api/auth/users/import", content="email,phone\n", headers=headers)
+    assert bad_header.status_code == 400
@@ -0,0 +1,70 @@
+import asyncio
+
+import pytest
+
+from qr import QR_SCALE, ByteLRU, QRService, lpa_payload, render_qr
+
+ORDER = {"plan_id": "tourist-7d", "device_imei": "356938035643809", "customer_email": "qr@example.com"}
+
+
+def test_byte_lru_is_bounded_by_size():
+    cache = ByteLRU(max_bytes=10)
+    cache.put("a", b"aaaa")
+    cache.put("b", b"bbbb")
+    cache.get("a")
+    cache.put("c", b"cccc")
+    assert cache.get("b") is None
+    assert (cache.get("a"), cache.get("c")) == (b"aaaa", b"cccc")
+    cache.put("a", b"a")
+    assert cache.size == 5
+    # Larger than the whole cache: not kept, nothing else evicted
+    cache.put("huge", b"x" * 11)
+    assert cache.get("huge") is None and cache.size == 5
+
+
+@pytest.fixture
+def service(store, tmp_path):
+    qr_service = QRService(store=store, cache_dir=str(tmp_path), workers=1)
+    yield qr_service
+    qr_service.shutdown()
+
+
+def test_images_are_rendered_once_then_cached(store, service, tmp_path):
+    async def run():
+        await store.activations.create({"activation_id": "a1", "activation_code": "ESMCODE"})
+        results = await asyncio.gather(*(service.image("a1", "png") for _ in range(5)))
+        digest, body = results[0]
+        assert all(result == (digest, body) for result in results)
+        assert body == render_qr(lpa_payload("ESMCODE"), "png", QR_SCALE)
+        # Concurrent requests shared one render
+        assert service.renders == 1
+        assert await service.image("a1", "png") == (digest, body)
+        assert service.renders == 1
+
+        svg_digest, svg = await service.image("a1", "svg")
+        assert svg_digest != digest and svg.lstrip().startswith(b"<?xml")
+
+        # A fresh process finds the rendered file on disk
+        restarted = QRService(store=store, cache_dir=str(tmp_path), workers=1)
+        assert await restarted.image("a1", "png") == (digest, body)
+        assert (restarted.renders, restarted.disk_hits) == (0, 1)
+
+        assert await service.image("missing", "png") is None
+
+    asyncio.run(run())
+
+
+def test_qr_endpoint(client):
+    activation = client.post("/api/esim/activate", json=ORDER).json()
+    response = client.get(f"/qr/{activation['activation_id']}")
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "image/png"
+    assert response.headers["Cache-Control"] == "public, max-age=31536000, immutable"
+    assert response.content.startswith(b"\x89PNG")
+
+    etag = response.headers["ETag"]
+    assert client.get(f"/qr/{activation['activation_id']}", headers={"If-None-Match": etag}).status_code == 304
+    svg = client.get(f"/qr/{activation['activation_id']}?format=svg")
+    assert svg.headers["content-type"] == "image/svg+xml" and svg.headers["ETag"] != etag
+    assert client.get(f"/qr/{activation['activation_id']}?format=gif").status_code == 422
+    assert client.get("/qr/missing").status_code == 404
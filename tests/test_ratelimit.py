@@ -0,0 +1,98 @@
+import asyncio
+
+from ratelimit import RateLimiter, RateLimitMiddleware, api_key_digest, client_ip
+
+
+async def ok_app(scope, receive, send):
+    await send({"type": "http.response.start", "status": 200, "headers": []})
+    await send({"type": "http.response.body", "body": b""})
+
+
+def login_statuses(limiter: RateLimiter, requests: int, api_key=None, client=("203.0.113.7", 5000)):
+    """Statuses for requests sent to the login route, api_key(i) giving each one's X-API-Key."""
+    middleware = RateLimitMiddleware(ok_app, limiter)
+
+    async def run():
+        statuses = []
+        for i in range(requests):
+            headers = [] if api_key is None else [(b"x-api-key", api_key(i).encode())]
+            scope = {"type": "http", "method": "POST", "path": "/api/auth/login",
+                     "headers": headers, "client": client}
+            sent = []
+
+            async def send(message):
+                sent.append(message)
+
+            await middleware(scope, None, send)
+            statuses.append(sent[0]["status"])
+        return statuses
+
+    return asyncio.run(run())
+
+
+def limiter(*keys: str) -> RateLimiter:
+    return RateLimiter(backend="memory", enabled=True, api_keys={api_key_digest(k.encode()) for k in keys})
+
+
+def test_api_key_identity_only_for_configured_keys():
+    rate_limiter = limiter("reseller-1")
+    assert rate_limiter.api_key_identity(b"reseller-1") == api_key_digest(b"reseller-1")
+    assert rate_limiter.api_key_identity(b"made-up") is None
+    assert rate_limiter.api_key_identity(None) is None
+
+
+def test_anonymous_login_is_limited_per_ip():
+    # Login allows a burst of 10 per IP
+    assert login_statuses(limiter(), 30).count(429) == 20
+
+
+def test_unknown_api_keys_do_not_escape_the_ip_limit():
+    assert login_statuses(limiter("reseller-1"), 30, lambda i: "made-up").count(429) == 20
+    # A fresh key per request is still the same anonymous client
+    assert login_statuses(limiter("reseller-1"), 30, lambda i: f"key-{i}").count(429) == 20
+
+
+def test_known_api_key_gets_its_own_bucket():
+    rate_limiter = limiter("reseller-1")
+    # Login allows a burst of 50 per known key, independent of the IP bucket
+    assert login_statuses(rate_limiter, 30, lambda i: "reseller-1").count(429) == 0
+    assert login_statuses(rate_limiter, 30).count(429) == 20
+
+
+def test_forwarded_for_is_only_trusted_from_proxies():
+    assert client_ip(("127.0.0.1", 1), "198.51.100.1, 127.0.0.1") == "198.51.100.1"
+    assert client_ip(("203.0.113.7", 1), "198.51.100.1") == "203.0.113.7"
+
+
+def test_rejections_carry_cors_headers_in_the_app_stack():
+    from server import app
+
+    # The app's own middleware stack, outermost first, with an enabled limiter
+    stack = ok_app
+    for middleware in reversed(app.user_middleware):
+        kwargs = dict(middleware.kwargs)
+        if middleware.cls is RateLimitMiddleware:
+            kwargs["limiter"] = limiter()
+        stack = middleware.cls(stack, *middleware.args, **kwargs)
+
+    async def run():
+        responses = []
+        for _ in range(11):
+            sent = []
+
+            async def send(message):
+                sent.append(message)
+
+            scope = {"type": "http", "method": "POST", "path": "/api/auth/login", "raw_path": b"/api/auth/login",
+                     "query_string": b"", "headers": [(b"origin", b"https://www.esim.com.mm")],
+                     "client": ("203.0.113.7", 5000), "server": ("backend", 80), "scheme": "http",
+                     "http_version": "1.1", "root_path": ""}
+            await stack(scope, None, send)
+            responses.append(sent[0])
+        return responses[-1]
+
+    rejected = asyncio.run(run())
+    headers = dict(rejected["headers"])
+    assert rejected["status"] == 429
+    assert headers[b"access-control-allow-origin"] == b"https://www.esim.com.mm"
+    assert b"retry-after" in headers
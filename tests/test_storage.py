@@ -0,0 +1,139 @@
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+
+from storage import DuplicateKeyError
+
+
+def activation(activation_id: str, code: str, total_gb: int = 5) -> dict:
+    return {
+        "activation_id": activation_id,
+        "activation_code": code,
+        "status": "pending",
+        "data_total_gb": total_gb,
+        "data_used_gb": 0.0,
+        "duration_days": 7,
+        "created_at": datetime.utcnow(),
+    }
+
+
+def test_users_create_and_project(store):
+    async def run():
+        user = {"id": "u1", "email": "a@example.com", "hashed_auth": "x", "full_name": "A",
+                "phone": "1", "is_active": True}
+        await store.users.create(user)
+        with pytest.raises(DuplicateKeyError):
+            await store.users.create(dict(user))
+        assert await store.users.exists("a@example.com")
+        assert await store.users.get_by_email("a@example.com", ("email", "is_active")) == {
+            "email": "a@example.com", "is_active": True}
+        assert await store.users.get_by_email("nobody@example.com") is None
+
+        failed = await store.users.create_many([
+            {"id": "u2", "email": "b@example.com"},
+            {"id": "u3", "email": "a@example.com"},
+        ])
+        assert failed == [1]
+        assert await store.users.emails_in_use(["a@example.com", "b@example.com", "c@example.com"]) == {
+            "a@example.com", "b@example.com"}
+
+    asyncio.run(run())
+
+
+def test_activations_reject_duplicate_codes(store):
+    async def run():
+        await store.activations.create(activation("a1", "CODE1"))
+        with pytest.raises(DuplicateKeyError):
+            await store.activations.create(activation("a2", "CODE1"))
+        failed = await store.activations.create_many([activation("a3", "CODE3"), activation("a4", "CODE1")])
+        assert failed == [1]
+        assert await store.activations.codes_in_use(["CODE1", "CODE2", "CODE3"]) == {"CODE1", "CODE3"}
+        assert set(await store.activations.get_many(["a1", "a3", "missing"])) == {"a1", "a3"}
+
+    asyncio.run(run())
+
+
+def test_activation_reads_are_copies(store):
+    async def run():
+        await store.activations.create(activation("a1", "CODE1"))
+        record = await store.activations.get("a1")
+        record["data_used_gb"] = 99
+        assert (await store.activations.get("a1"))["data_used_gb"] == 0.0
+
+    asyncio.run(run())
+
+
+def test_apply_usage_adds_deltas_and_keeps_latest_time(store):
+    async def run():
+        await store.activations.create(activation("a1", "CODE1"))
+        later = datetime.utcnow()
+        earlier = later - timedelta(minutes=5)
+        await store.activations.apply_usage({"a1": (0.5, later), "missing": (1.0, later)})
+        await store.activations.apply_usage({"a1": (0.25, earlier)})
+        record = await store.activations.get("a1", ("data_used_gb", "usage_updated_at"))
+        assert record == {"data_used_gb": 0.75, "usage_updated_at": later}
+
+    asyncio.run(run())
+
+
+def test_mongo_reserve_claims_a_key_released_mid_race():
+    from pymongo.errors import DuplicateKeyError as MongoDuplicateKeyError
+    from storage import MongoIdempotencyRepository
+
+    class Collection:
+        """The holder releases the key between our failed insert and the read."""
+
+        def __init__(self):
+            self.inserts = 0
+
+        async def delete_one(self, query):
+            pass
+
+        async def insert_one(self, document):
+            self.inserts += 1
+            if self.inserts == 1:
+                raise MongoDuplicateKeyError("duplicate key")
+
+        async def find_one(self, query, projection):
+            return None
+
+    repository = MongoIdempotencyRepository({"idempotency_keys": Collection()})
+    assert asyncio.run(repository.reserve("activate:k", "fingerprint", 60)) is None
+    assert repository.collection.inserts == 2
+
+
+def test_apply_topups_credits_each_transaction_once(store):
+    async def run():
+        await store.activations.create(activation("a1", "CODE1", total_gb=5))
+        await store.activations.apply_topups({"t1": ("a1", 3)})
+        # A settlement re-run after a lost update
+        await store.activations.apply_topups({"t1": ("a1", 3), "t2": ("a1", 2)})
+        assert (await store.activations.get("a1"))["data_total_gb"] == 10
+
+    asyncio.run(run())
+
+
+def test_topup_claims_are_exclusive_until_the_lease_expires(store):
+    async def run():
+        now = datetime.utcnow()
+        await store.topups.create({"transaction_id": "t1", "status": "queued", "next_attempt_at": now,
+                                   "lease_until": None, "attempts": 0})
+        claimed = await store.topups.claim(10, lease=60)
+        assert [t["transaction_id"] for t in claimed] == ["t1"]
+        assert await store.topups.claim(10, lease=60) == []
+        await store.topups.update_many({"t1": {"status": "processing", "lease_until": now - timedelta(seconds=1)}})
+        assert [t["transaction_id"] for t in await store.topups.claim(10, lease=60)] == ["t1"]
+
+    asyncio.run(run())
+
+
+def test_revocations_since(store):
+    async def run():
+        exp = (datetime.utcnow() + timedelta(minutes=5)).timestamp()
+        await store.revocations.add(b"one", exp)
+        revoked = await store.revocations.since(None)
+        assert [(digest, e) for digest, e, _ in revoked] == [(b"one", exp)]
+        assert await store.revocations.since(revoked[0][2]) == []
+
+    asyncio.run(run())
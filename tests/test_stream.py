@@ -0,0 +1,103 @@
+import asyncio
+import json
+from datetime import datetime
+
+import pytest
+from fastapi import HTTPException
+
+import usage
+from usage import BYTES_PER_GB, UsageAggregator, usage_stream
+
+
+def render(record: dict) -> bytes:
+    return json.dumps({"used": record["data_used_gb"], "total": record["data_total_gb"]}).encode()
+
+
+@pytest.fixture
+def aggregator(store, monkeypatch):
+    aggregator = UsageAggregator(store=store)
+    monkeypatch.setattr(usage, "aggregator", aggregator)
+    monkeypatch.setattr(usage, "USAGE_STREAM_INTERVAL", 0)
+    asyncio.run(store.activations.create({
+        "activation_id": "a1", "activation_code": "code-a1", "status": "active", "data_total_gb": 5,
+        "data_used_gb": 0.0, "duration_days": 7, "created_at": datetime.utcnow(),
+    }))
+    return aggregator
+
+
+def test_stream_pushes_each_change(aggregator):
+    async def run():
+        stream = usage_stream("a1", render)
+        # A response that never starts must not hold a slot
+        assert aggregator.subscriptions == 0
+        assert await stream.__anext__() == b'event: usage\ndata: {"used": 0.0, "total": 5}\n\n'
+        assert aggregator.subscriptions == 1
+        await aggregator.ingest([("a1", BYTES_PER_GB, datetime.utcnow())])
+        assert await stream.__anext__() == b'event: usage\ndata: {"used": 1.0, "total": 5}\n\n'
+        aggregator.set_totals({"a1": 8})
+        assert await stream.__anext__() == b'event: usage\ndata: {"used": 1.0, "total": 8}\n\n'
+        await stream.aclose()
+        assert aggregator.subscriptions == 0
+
+    asyncio.run(run())
+
+
+def test_streamed_counters_survive_flushes(aggregator):
+    async def run():
+        stream = usage_stream("a1", render)
+        await stream.__anext__()
+        await aggregator.ingest([("a1", BYTES_PER_GB, datetime.utcnow())])
+        await aggregator.flush()
+        assert "a1" in aggregator.counters
+        await stream.aclose()
+        await aggregator.flush()
+        assert "a1" not in aggregator.counters
+
+    asyncio.run(run())
+
+
+def test_idle_stream_sends_keepalives(aggregator, monkeypatch):
+    monkeypatch.setattr(usage, "USAGE_STREAM_KEEPALIVE", 0.01)
+
+    async def run():
+        stream = usage_stream("a1", render)
+        await stream.__anext__()
+        assert await stream.__anext__() == b": keepalive\n\n"
+        await stream.aclose()
+
+    asyncio.run(run())
+
+
+def test_unknown_activation_ends_the_stream_and_frees_the_slot(aggregator):
+    async def run():
+        assert [chunk async for chunk in usage_stream("missing", render)] == []
+        assert aggregator.subscriptions == 0
+
+    asyncio.run(run())
+
+
+def test_streams_are_capped(aggregator, monkeypatch):
+    monkeypatch.setattr(usage, "USAGE_STREAM_MAX_CONNECTIONS", 1)
+
+    async def run():
+        stream = usage_stream("a1", render)
+        await stream.__anext__()
+        with pytest.raises(HTTPException) as e:
+            aggregator.check_stream_capacity()
+        assert e.value.status_code == 503
+        await stream.aclose()
+        aggregator.check_stream_capacity()
+
+    asyncio.run(run())
+
+
+def test_stream_endpoint_refuses_before_streaming(client, monkeypatch):
+    order = {"plan_id": "tourist-7d", "device_imei": "356938035643809", "customer_email": "stream@example.com"}
+    activation_id = client.post("/api/esim/activate", json=order).json()["activation_id"]
+    assert client.get("/api/esim/missing/usage/stream").status_code == 404
+
+    monkeypatch.setattr(usage, "USAGE_STREAM_MAX_CONNECTIONS", 0)
+    response = client.get(f"/api/esim/{activation_id}/usage/stream")
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == "30"
+    assert usage.aggregator.subscriptions == 0
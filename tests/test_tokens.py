@@ -0,0 +1,122 @@
+import asyncio
+import time
+from datetime import datetime, timedelta
+
+import pytest
+from jose import jwt
+
+from tokens import InvalidTokenError, KeyRing, RevocationList, SharedRevocationList, VerifiedTokenCache, key_id
+
+
+def claims(minutes: float = 5) -> dict:
+    return {"sub": "a@example.com", "exp": datetime.utcnow() + timedelta(minutes=minutes)}
+
+
+def test_rotated_keys_still_verify_their_tokens():
+    old = KeyRing("old-secret")
+    token = old.encode(claims())
+    assert jwt.get_unverified_header(token)["kid"] == key_id("old-secret")
+
+    rotated = KeyRing("new-secret", ["old-secret"])
+    assert rotated.decode(token)["sub"] == "a@example.com"
+    assert jwt.get_unverified_header(rotated.encode(claims()))["kid"] == key_id("new-secret")
+    # Once the old secret is dropped its tokens are refused
+    with pytest.raises(InvalidTokenError):
+        KeyRing("new-secret").decode(token)
+
+
+def test_tokens_without_a_key_id_try_every_key():
+    legacy = jwt.encode(claims(), "old-secret", algorithm="HS256")
+    assert KeyRing("new-secret", ["old-secret"]).decode(legacy)["sub"] == "a@example.com"
+    with pytest.raises(InvalidTokenError):
+        KeyRing("new-secret").decode(legacy)
+
+
+def test_expired_and_tampered_tokens_are_refused():
+    ring = KeyRing("secret")
+    with pytest.raises(InvalidTokenError):
+        ring.decode(ring.encode(claims(minutes=-1)))
+    with pytest.raises(InvalidTokenError):
+        ring.decode(ring.encode(claims())[:-2] + "xx")
+    ring.self_test()
+
+
+def test_cache_entries_never_outlive_the_token():
+    cache = VerifiedTokenCache(max_size=10, ttl=300)
+    cache.put(b"live", "a@example.com", time.time() + 60)
+    cache.put(b"expired", "b@example.com", time.time() - 1)
+    assert cache.get(b"live") == "a@example.com"
+    assert cache.get(b"expired") is None
+    assert cache.get(b"unknown") is None
+    assert (cache.hits, cache.misses) == (1, 2)
+    cache.discard(b"live")
+    assert cache.get(b"live") is None
+
+
+def test_cache_evicts_the_least_recently_used():
+    cache = VerifiedTokenCache(max_size=2, ttl=300)
+    exp = time.time() + 60
+    cache.put(b"a", "a", exp)
+    cache.put(b"b", "b", exp)
+    cache.get(b"a")
+    cache.put(b"c", "c", exp)
+    assert len(cache) == 2
+    assert cache.get(b"b") is None
+    assert cache.get(b"a") == "a"
+
+
+def test_revocations_are_dropped_once_the_token_expires():
+    revoked = RevocationList()
+    assert b"x" not in revoked
+    revoked.revoke(b"expired", time.time() - 1)
+    revoked.revoke(b"live", time.time() + 60)
+    assert b"live" in revoked
+    revoked._next_purge = 0
+    revoked.revoke(b"other", time.time() + 60)
+    assert b"expired" not in revoked
+    assert len(revoked) == 2
+
+
+def test_shared_revocations_reach_every_worker(store):
+    async def run():
+        # Two workers' lists over one store
+        first = SharedRevocationList(store.revocations, interval=60)
+        second = SharedRevocationList(store.revocations, interval=60)
+        await second.start()
+        await first.publish(b"token", time.time() + 60)
+        assert b"token" in first and b"token" not in second
+        await second.sync()
+        assert b"token" in second
+        # A worker started later loads everything still unexpired
+        late = SharedRevocationList(store.revocations, interval=60)
+        await late.start()
+        assert b"token" in late
+        await second.stop()
+        await late.stop()
+
+    asyncio.run(run())
+
+
+def login(client, email: str) -> dict:
+    client.post("/api/auth/register", json={"email": email, "password": "password123",
+                                            "full_name": "Test", "phone": "1"})
+    token = client.post("/api/auth/login", json={"email": email, "password": "password123"}).json()
+    return {"Authorization": f"Bearer {token['access_token']}"}
+
+
+def test_logout_revokes_the_token(client):
+    headers = login(client, "logout@example.com")
+    assert client.get("/api/auth/me", headers=headers).json()["email"] == "logout@example.com"
+    # Served from the verified-token cache the second time; logout must still win
+    assert client.get("/api/auth/me", headers=headers).status_code == 200
+    assert client.post("/api/auth/logout", headers=headers).status_code == 200
+    assert client.get("/api/auth/me", headers=headers).status_code == 401
+
+
+def test_refresh_issues_a_working_token(client):
+    headers = login(client, "refresh@example.com")
+    refreshed = client.post("/api/auth/refresh", headers=headers).json()
+    assert refreshed["token_type"] == "bearer"
+    me = client.get("/api/auth/me", headers={"Authorization": f"Bearer {refreshed['access_token']}"})
+    assert me.json()["email"] == "refresh@example.com"
+    assert client.get("/api/auth/me", headers={"Authorization": "Bearer not-a-token"}).status_code == 401
@@ -0,0 +1,133 @@
+import asyncio
+import time
+from datetime import datetime
+
+import pytest
+
+import topup
+from topup import FakeTopupProvider, SettlementResult, TopupProcessor
+
+
+class ScriptedProvider:
+    """Answers each settlement call with the next outcome from a script."""
+
+    def __init__(self, *outcomes: str):
+        self.outcomes = list(outcomes)
+        self.batches = []
+
+    async def settle(self, transactions):
+        self.batches.append([t["transaction_id"] for t in transactions])
+        outcome = self.outcomes.pop(0) if self.outcomes else "settled"
+        if outcome == "error":
+            raise ConnectionError("provider unreachable")
+        return {t["transaction_id"]: SettlementResult(outcome, reference="ref", reason="scripted")
+                for t in transactions}
+
+
+@pytest.fixture(autouse=True)
+def no_backoff(monkeypatch):
+    monkeypatch.setattr(topup, "backoff_delay", lambda attempts: 0)
+
+
+async def add_activation(store, activation_id: str = "a1", total_gb: int = 5):
+    await store.activations.create({
+        "activation_id": activation_id, "activation_code": f"code-{activation_id}", "status": "active",
+        "data_total_gb": total_gb, "data_used_gb": 0.0, "duration_days": 7, "created_at": datetime.utcnow(),
+    })
+
+
+async def settle_all(processor: TopupProcessor):
+    """Claim and settle until nothing is claimable, as the workers would."""
+    while True:
+        batch = await processor.store.topups.claim(processor.batch_size, 60)
+        if not batch:
+            return
+        await processor.settle(batch)
+
+
+def test_workers_settle_queued_topups_in_batches(store):
+    async def run():
+        await add_activation(store)
+        provider = FakeTopupProvider(latency=0.01, seed=1)
+        processor = TopupProcessor(provider=provider, store=store, workers=2, batch_size=10)
+        await processor.start()
+        transactions = [await processor.enqueue("a1", amount) for amount in (1, 2, 3)]
+        for _ in range(200):
+            statuses = [(await store.topups.get(t["transaction_id"]))["status"] for t in transactions]
+            if statuses == ["completed"] * 3:
+                break
+            await asyncio.sleep(0.01)
+        await processor.stop()
+        assert statuses == ["completed"] * 3
+        assert provider.calls < 3
+        assert (await store.activations.get("a1"))["data_total_gb"] == 5 + 6
+
+    asyncio.run(run())
+
+
+def test_retries_until_settled(store):
+    async def run():
+        await add_activation(store)
+        processor = TopupProcessor(provider=ScriptedProvider("retry", "error", "settled"), store=store)
+        transaction = await processor.enqueue("a1", 2)
+        await settle_all(processor)
+        stored = await store.topups.get(transaction["transaction_id"])
+        assert (stored["status"], stored["attempts"], stored["provider_reference"]) == ("completed", 3, "ref")
+        assert (await store.activations.get("a1"))["data_total_gb"] == 7
+
+    asyncio.run(run())
+
+
+def test_declined_and_exhausted_topups_fail_without_credit(store):
+    async def run():
+        await add_activation(store)
+        declined = TopupProcessor(provider=ScriptedProvider("declined"), store=store)
+        first = await declined.enqueue("a1", 2)
+        await settle_all(declined)
+
+        exhausted = TopupProcessor(provider=ScriptedProvider("retry", "retry"), store=store, max_attempts=2)
+        second = await exhausted.enqueue("a1", 2)
+        await settle_all(exhausted)
+
+        first, second = [await store.topups.get(t["transaction_id"]) for t in (first, second)]
+        assert (first["status"], first["error"]) == ("failed", "scripted")
+        assert (second["status"], second["error"]) == ("failed", "Retries exhausted: scripted")
+        assert (await store.activations.get("a1"))["data_total_gb"] == 5
+
+    asyncio.run(run())
+
+
+def test_a_replayed_batch_is_credited_once(store):
+    async def run():
+        await add_activation(store)
+        processor = TopupProcessor(provider=FakeTopupProvider(latency=0), store=store)
+        transaction = await processor.enqueue("a1", 3)
+        batch = await store.topups.claim(10, 60)
+        await processor.settle(batch)
+        # The same claim settled again, as after an expired lease
+        await processor.settle(batch)
+        assert (await store.activations.get("a1"))["data_total_gb"] == 8
+        assert (await store.topups.get(transaction["transaction_id"]))["status"] == "completed"
+
+    asyncio.run(run())
+
+
+def test_topup_endpoint_accepts_then_settles(client):
+    order = {"plan_id": "tourist-7d", "device_imei": "356938035643809", "customer_email": "topup@example.com"}
+    activation_id = client.post("/api/esim/activate", json=order).json()["activation_id"]
+    before = client.get(f"/api/esim/{activation_id}/usage").json()["data_total_gb"]
+
+    response = client.post(f"/api/esim/{activation_id}/topup?amount_usd=3")
+    assert response.status_code == 202
+    assert response.json()["status"] == "queued"
+    location = response.headers["Location"]
+
+    deadline = time.monotonic() + 10
+    while client.get(location).json()["status"] != "completed" and time.monotonic() < deadline:
+        time.sleep(0.05)
+    assert client.get(location).json()["status"] == "completed"
+    assert client.get(f"/api/esim/{activation_id}/usage").json()["data_total_gb"] == before + 3
+
+    assert client.post("/api/esim/missing/topup?amount_usd=3").status_code == 404
+    assert client.post(f"/api/esim/{activation_id}/topup?amount_usd=0").status_code == 422
+    assert client.get("/api/esim/topups/missing").status_code == 404
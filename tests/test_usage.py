@@ -0,0 +1,139 @@
+import asyncio
+import json
+from datetime import datetime
+
+import pytest
+
+from usage import BYTES_PER_GB, UsageAggregator, parse_event
+
+GB = BYTES_PER_GB
+
+
+async def add_activations(store, *activation_ids: str):
+    for activation_id in activation_ids:
+        await store.activations.create({
+            "activation_id": activation_id, "activation_code": f"code-{activation_id}", "status": "active",
+            "data_total_gb": 5, "data_used_gb": 0.0, "duration_days": 7, "created_at": datetime.utcnow(),
+        })
+
+
+async def used_gb(store, activation_id: str) -> float:
+    return (await store.activations.get(activation_id))["data_used_gb"]
+
+
+def test_ingest_aggregates_until_flushed(store):
+    async def run():
+        await add_activations(store, "a1")
+        aggregator = UsageAggregator(store=store)
+        now = datetime.utcnow()
+        unknown = await aggregator.ingest([("a1", GB, now), ("a1", GB // 2, now), ("nope", GB, now)])
+        assert unknown == ["nope"]
+        assert (await aggregator.get("a1")).used_gb == 1.5
+        # Nothing written yet, but reads from storage see the pending usage
+        assert await used_gb(store, "a1") == 0.0
+        assert aggregator.apply_to(await store.activations.get("a1"))["data_used_gb"] == 1.5
+
+        await aggregator.flush()
+        assert await used_gb(store, "a1") == 1.5
+        # Clean counters are dropped after the flush and re-read on next use
+        assert "a1" not in aggregator.counters
+        assert (await aggregator.get("a1")).used_gb == 1.5
+
+    asyncio.run(run())
+
+
+def test_failed_flush_is_retried_in_full(store):
+    async def run():
+        await add_activations(store, "a1")
+        aggregator = UsageAggregator(store=store)
+        await aggregator.ingest([("a1", GB, datetime.utcnow())])
+        apply_usage = store.activations.apply_usage
+
+        async def unavailable(updates):
+            raise ConnectionError("storage down")
+
+        store.activations.apply_usage = unavailable
+        with pytest.raises(ConnectionError):
+            await aggregator.flush()
+        await aggregator.ingest([("a1", GB, datetime.utcnow())])
+
+        store.activations.apply_usage = apply_usage
+        await aggregator.flush()
+        assert await used_gb(store, "a1") == 2.0
+
+    asyncio.run(run())
+
+
+def test_counters_being_flushed_are_not_evicted(store):
+    async def run():
+        await add_activations(store, "a0", "a1", "a2")
+        aggregator = UsageAggregator(store=store, max_counters=2)
+        now = datetime.utcnow()
+        await aggregator.ingest([("a0", GB, now), ("a1", GB, now)])
+        release = asyncio.Event()
+
+        async def slow_then_down(updates):
+            await release.wait()
+            raise ConnectionError("storage down")
+
+        store.activations.apply_usage = slow_then_down
+        flush = asyncio.create_task(aggregator.flush())
+        await asyncio.sleep(0)
+        # Loading a third counter while the flush is in flight must not drop the other two
+        await aggregator.get("a2")
+        release.set()
+        with pytest.raises(ConnectionError):
+            await flush
+        assert {a: aggregator.counters[a].pending_gb for a in ("a0", "a1")} == {"a0": 1.0, "a1": 1.0}
+        assert aggregator._dirty == {"a0", "a1"}
+
+    asyncio.run(run())
+
+
+def test_full_aggregator_keeps_unflushed_counters(store):
+    async def run():
+        await add_activations(store, "a0", "a1", "a2")
+        aggregator = UsageAggregator(store=store, max_counters=2)
+        now = datetime.utcnow()
+        await aggregator.ingest([("a0", GB, now), ("a1", GB, now)])
+        await aggregator.get("a2")
+        assert {"a0", "a1"} <= set(aggregator.counters)
+        # Asks the flush loop to make room instead
+        assert aggregator._flush_now.is_set()
+
+    asyncio.run(run())
+
+
+def test_parse_event_normalises_timestamps():
+    activation_id, used, timestamp = parse_event(b'{"activation_id": "a1", "bytes": 10, '
+                                                 b'"timestamp": "2026-01-01T08:00:00+06:30"}')
+    assert (activation_id, used, timestamp) == ("a1", 10, datetime(2026, 1, 1, 1, 30))
+    assert parse_event(b'{"activation_id": "a1", "bytes": 1, "timestamp": "2026-01-01T00:00:00Z"}')[2] == \
+        datetime(2026, 1, 1)
+    for bad in (b'{"activation_id": "a1", "bytes": -1}', b'{"activation_id": 1, "bytes": 1}',
+                b'{"activation_id": "a1", "bytes": 1.5}'):
+        with pytest.raises(ValueError):
+            parse_event(bad)
+
+
+def test_ingest_endpoint(client, monkeypatch):
+    import usage
+
+    order = {"plan_id": "tourist-7d", "device_imei": "356938035643809", "customer_email": "usage@example.com"}
+    activation_id = client.post("/api/esim/activate", json=order).json()["activation_id"]
+    body = "\n".join([
+        json.dumps({"activation_id": activation_id, "bytes": GB}),
+        "not json",
+        json.dumps({"activation_id": "missing", "bytes": 1}),
+        json.dumps({"activation_id": activation_id, "bytes": GB}),
+    ])
+
+    assert client.post("/api/usage/events", content=body).status_code == 403
+    monkeypatch.setattr(usage, "USAGE_INGEST_TOKEN", "feed-secret")
+    assert client.post("/api/usage/events", content=body, headers={"X-Ingest-Token": "wrong"}).status_code == 401
+
+    result = client.post("/api/usage/events", content=body, headers={"X-Ingest-Token": "feed-secret"}).json()
+    assert (result["accepted"], result["rejected"]) == (2, 2)
+    assert result["errors"][0]["line"] == 2
+    assert result["errors"][1] == {"activation_id": "missing", "error": "Activation not found"}
+    assert client.get(f"/api/esim/{activation_id}/usage").json()["data_used_gb"] == 2.0